@@ -1,10 +1,12 @@
 import os
-import json
-import time
-from http.server import BaseHTTPRequestHandler
+import math
+import hashlib
 from urllib.parse import urlparse, parse_qs
 from datetime import datetime
+from functools import lru_cache
 from openai import OpenAI
+from api._lib import cache, keystore, metrics, ratelimit
+from api._lib.base import BaseHandler, dumps
 
 client = OpenAI(
     api_key=os.environ.get("DEEPSEEK_API_KEY"),
@@ -13,73 +15,89 @@ client = OpenAI(
 
 MODEL_NAME = os.environ.get("DEEPSEEK_MODEL")
 
-BASE_DIR = os.path.dirname(__file__)
-KEYS_FILE = os.path.join(BASE_DIR, "..", "WormGptkeys.txt")
-MASTER_KEYS_FILE = os.path.join(BASE_DIR, "..", "masterkeys.txt")
-
-MAX_REQUESTS = 50
-WINDOW_SECONDS = 180  
-
-IP_CACHE = {}
-
-KEY_CACHE = set()
-LIMITED_KEYS = set()
-EXPIRY_MAP = {}
-
-
-def load_keys():
-    try:
-        with open(KEYS_FILE) as f:
-            for line in f:
-                parts = line.strip().split(":")
-                if len(parts) < 2:
-                    continue
-                key, expiry = parts[0], parts[1]
-                KEY_CACHE.add(key)
-                EXPIRY_MAP[key] = expiry
-                if len(parts) == 3 and parts[2] == "limit":
-                    LIMITED_KEYS.add(key)
-    except:
-        pass
-
-    try:
-        with open(MASTER_KEYS_FILE) as f:
-            for k in f:
-                KEY_CACHE.add(k.strip())
-    except:
-        pass
-
-
-load_keys()
-
-
-def validate_key(api_key, ip):
-    if api_key not in KEY_CACHE:
+KEYS_FILE = "WormGptkeys.txt"
+
+# off unless CACHE_TTL_WORMGPT is set
+COMPLETION_CACHE = cache.get_cache("wormgpt", 0)
+
+
+@lru_cache(maxsize=64)
+def error_body(message):
+    return dumps({
+        "status": "error",
+        "error": {
+            "message": message
+        },
+        "owner": "@UseSir / @OverShade"
+    })
+
+
+def build_messages(text):
+    return [
+        {
+            "role": "system",
+            "content": "you are funny"
+        },
+        {
+            "role": "user",
+            "content": text
+        }
+    ]
+
+
+def prompt_key(text):
+    normalized = " ".join(text.split()).casefold()
+    return hashlib.sha256(f"{MODEL_NAME}\n{normalized}".encode()).hexdigest()
+
+
+def complete(text):
+    with metrics.upstream():
+        response = client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=build_messages(text),
+            stream=False
+        )
+    usage = getattr(response, "usage", None)
+    return {
+        "response": response.choices[0].message.content,
+        "tokens": getattr(usage, "total_tokens", 0) or 0
+    }
+
+
+def cached_complete(text):
+    """
+    Returns (completion, hit). With CACHE_TTL_WORMGPT unset every prompt
+    gets its own upstream call; with it set, identical prompts in flight at
+    the same time also share one call.
+    """
+    if COMPLETION_CACHE.ttl <= 0:
+        return complete(text), False
+
+    called = []
+
+    def fetch():
+        called.append(True)
+        return complete(text)
+
+    value, hit = COMPLETION_CACHE.get_or_fetch(prompt_key(text), fetch)
+    # a result shared from another caller's call saved tokens as well
+    if hit or not called:
+        COMPLETION_CACHE.count("tokens_saved", value["tokens"])
+    return value, hit
+
+
+def validate_key(api_key):
+    entry = keystore.lookup(KEYS_FILE, api_key)
+    if entry is None and not keystore.is_master_key(api_key):
         return False, "API key is invalid or expired"
 
-    if api_key in EXPIRY_MAP:
-        if datetime.utcnow() > datetime.strptime(EXPIRY_MAP[api_key], "%d/%m/%Y"):
-            return False, "API key is invalid or expired"
-
-    if api_key in LIMITED_KEYS:
-        now = int(time.time())
-        IP_CACHE.setdefault(api_key, {})
-        IP_CACHE[api_key].setdefault(ip, [])
-
-        IP_CACHE[api_key][ip] = [
-            t for t in IP_CACHE[api_key][ip]
-            if now - t < WINDOW_SECONDS
-        ]
-
-        if len(IP_CACHE[api_key][ip]) >= MAX_REQUESTS:
-            return False, "IP request limit reached"
-
-        IP_CACHE[api_key][ip].append(now)
+    if entry is not None and datetime.utcnow() > entry.expiry:
+        return False, "API key is invalid or expired"
 
     return True, None
 
 
-class handler(BaseHTTPRequestHandler):
+class handler(BaseHandler):
 
     def do_GET(self):
         query = parse_qs(urlparse(self.path).query)
@@ -87,57 +105,90 @@ class handler(BaseHTTPRequestHandler):
         api_key = query.get("key", [None])[0]
         text = query.get("text", [None])[0]
 
-        ip = self.headers.get("x-forwarded-for") or self.client_address[0]
-
         if not api_key:
             return self.error(400, "API key is required")
 
-        valid, msg = validate_key(api_key, ip)
+        with metrics.phase("key_check"):
+            valid, msg = validate_key(api_key)
         if not valid:
             return self.error(401, msg)
 
+        retry_after = ratelimit.check(KEYS_FILE, api_key, self.client_ip())
+        if retry_after:
+            return self.error(
+                429,
+                "Rate limit exceeded",
+                [("Retry-After", str(math.ceil(retry_after)))]
+            )
+
         if not text:
             return self.error(400, "Missing 'text' parameter")
 
-        try:
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "you are funny"
-                    },
-                    {
-                        "role": "user",
-                        "content": text
-                    }
-                ],
-                stream=False
-            )
+        if query.get("stream", ["0"])[0] in ("1", "true"):
+            return self.stream_answer(text)
 
-            answer = response.choices[0].message.content
+        try:
+            completion, hit = cached_complete(text)
+            if COMPLETION_CACHE.ttl > 0:
+                self.cache_status = "HIT" if hit else "MISS"
 
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({
+            self.send_json(200, {
                 "status": "success",
                 "query": text,
-                "response": answer,
+                "response": completion["response"],
                 "owner": "@UseSir / @OverShade"
-            }, indent=2).encode())
+            })
 
         except Exception as e:
             self.error(500, str(e))
-            
-    def error(self, code, message):
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        self.wfile.write(json.dumps({
-            "status": "error",
-            "error": {
-                "message": message
-            },
-            "owner": "@UseSir / @OverShade"
-        }, indent=2).encode())
+
+    def stream_answer(self, text):
+        """
+        Server-Sent Events: one `data: {"delta": ...}` event per token
+        chunk, then `data: [DONE]`. The upstream stream is closed as soon as
+        the client goes away.
+        """
+        try:
+            with metrics.upstream():
+                upstream = client.chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=build_messages(text),
+                    stream=True
+                )
+        except Exception as e:
+            return self.error(500, str(e))
+
+        try:
+            self.start_stream(200, "text/event-stream", [
+                ("Cache-Control", "no-cache"),
+                ("X-Accel-Buffering", "no")
+            ])
+
+            for chunk in upstream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    self.send_event({"delta": delta})
+
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        except (BrokenPipeError, ConnectionError):
+            pass
+
+        except Exception as e:
+            try:
+                self.wfile.write(b"event: error\ndata: " + error_body(str(e)) + b"\n\n")
+            except (BrokenPipeError, ConnectionError):
+                pass
+
+        finally:
+            upstream.close()
+
+    def send_event(self, payload):
+        self.wfile.write(b"data: " + dumps(payload) + b"\n\n")
+
+    def error(self, code, message, headers=None):
+        if code >= 500:
+            metrics.record_exception(self.endpoint)
+        self.send_body(code, error_body(message), headers=headers)
@@ -0,0 +1,201 @@
+import os
+import json
+import hmac
+import queue
+import atexit
+import random
+import socket
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+from api._lib import metrics
+
+# a file path, "unix:/path/to.sock" (datagram) or "udp://host:port";
+# empty turns the access log off
+ACCESS_LOG = os.environ.get("ACCESS_LOG", "")
+SAMPLE = float(os.environ.get("ACCESS_LOG_SAMPLE", "1"))
+QUEUE_SIZE = int(os.environ.get("ACCESS_LOG_QUEUE", "10000"))
+BATCH_SIZE = int(os.environ.get("ACCESS_LOG_BATCH", "500"))
+FLUSH_INTERVAL = float(os.environ.get("ACCESS_LOG_FLUSH", "1"))
+KEY_SALT = os.environ.get("ACCESS_LOG_SALT", "").encode()
+
+_STOP = object()
+
+
+def hash_key(api_key):
+    """
+    Keys are never logged; this stable digest still groups a key's requests.
+    Without ACCESS_LOG_SALT the field stays empty, since an unsalted hash of
+    a short key is easily brute-forced.
+    """
+    if not api_key or not KEY_SALT:
+        return None
+    return hmac.new(KEY_SALT, api_key.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+class FileSink:
+    """
+    Appends batches to a file, reopening it when it has been rotated away.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+        self._inode = None
+
+    def write(self, lines):
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._f is None or inode != self._inode:
+            self.close()
+            self._f = open(self.path, "ab")
+            self._inode = os.fstat(self._f.fileno()).st_ino
+        self._f.write(b"".join(lines))
+        self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class SocketSink:
+    """
+    One datagram per record to a local collector (vector, fluent-bit, ...).
+    """
+
+    def __init__(self, target):
+        if target.startswith("unix:"):
+            self.address = target[len("unix:"):]
+            self.family = socket.AF_UNIX
+        else:
+            host, _, port = target[len("udp://"):].rpartition(":")
+            self.address = (host or "127.0.0.1", int(port))
+            self.family = socket.AF_INET
+        self._sock = None
+
+    def write(self, lines):
+        if self._sock is None:
+            self._sock = socket.socket(self.family, socket.SOCK_DGRAM)
+            self._sock.settimeout(FLUSH_INTERVAL)
+        for line in lines:
+            self._sock.sendto(line, self.address)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def make_sink(target):
+    if target.startswith(("unix:", "udp://")):
+        return SocketSink(target)
+    return FileSink(target)
+
+
+class Writer:
+    """
+    Bounded queue drained by one background thread, which encodes records
+    and hands them to the sink in batches. Request threads only ever call
+    put_nowait(); when the queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, sink, size=QUEUE_SIZE):
+        self.sink = sink
+        self._queue = queue.Queue(maxsize=size)
+        self._thread = threading.Thread(target=self._run, name="access-log", daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            metrics.ACCESS_LOG_DROPPED.inc("queue_full")
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+
+            batch = []
+            while item is not _STOP:
+                batch.append(item)
+                if len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                lines = [
+                    json.dumps(r, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+                    for r in batch
+                ]
+                try:
+                    self.sink.write(lines)
+                except Exception:
+                    metrics.ACCESS_LOG_DROPPED.inc("write_failed", amount=len(batch))
+                    self.sink.close()
+
+            if item is _STOP:
+                self.sink.close()
+                return
+
+    def close(self, timeout=5):
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+_WRITER = None
+_LOCK = threading.Lock()
+
+
+def get_writer():
+    global _WRITER
+    if not ACCESS_LOG:
+        return None
+    if _WRITER is None:
+        with _LOCK:
+            if _WRITER is None:
+                _WRITER = Writer(make_sink(ACCESS_LOG))
+                atexit.register(_WRITER.close)
+    return _WRITER
+
+
+def sampled(status):
+    # server errors are always kept
+    return status >= 500 or SAMPLE >= 1 or random.random() < SAMPLE
+
+
+def record(endpoint, method, status, api_key, seconds, cache_status=None, info=None):
+    """
+    Queue one access record. `info` is metrics.request_info() for the
+    request's thread.
+    """
+    writer = get_writer()
+    if writer is None or not sampled(status):
+        return
+
+    info = info or {}
+    writer.submit({
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "endpoint": endpoint,
+        "method": method,
+        "status": status,
+        "key": hash_key(api_key),
+        "provider": info.get("provider"),
+        "upstream_ms": round(info.get("upstream", 0.0) * 1000, 1),
+        "total_ms": round(seconds * 1000, 1),
+        "bytes": info.get("bytes", 0),
+        "cache": cache_status,
+        "error": info.get("error")
+    })
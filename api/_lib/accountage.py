@@ -0,0 +1,133 @@
+import os
+import csv
+import time
+import bisect
+import threading
+from datetime import date
+
+from api._lib.keystore import ROOT_DIR, RELOAD_INTERVAL
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TABLE_FILE = os.environ.get("IG_ID_TABLE", os.path.join(ROOT_DIR, "ig_id_dates.csv"))
+
+
+class Table:
+    """
+    Sorted (first id, date) boundaries from TABLE_FILE, re-read when the
+    file changes. Dates are kept as ordinals so they can be interpolated.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = []
+        self.days = []
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _parse(self):
+        rows = []
+        with open(self.path, newline="") as f:
+            lines = (line for line in f if line.strip() and not line.startswith("#"))
+            for row in csv.DictReader(lines):
+                try:
+                    rows.append((int(row["id"]), date.fromisoformat(row["date"].strip()).toordinal()))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        rows.sort()
+        return [r[0] for r in rows], [r[1] for r in rows]
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked < RELOAD_INTERVAL:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime != self._mtime:
+                    self.ids, self.days = self._parse()
+                    self._mtime = mtime
+            except OSError:
+                self.ids, self.days = [], []
+                self._mtime = None
+
+
+_TABLE = Table(TABLE_FILE)
+
+
+def _segment_day(ids, days, i, uid):
+    lo_id, hi_id = ids[i], ids[i + 1]
+    lo_day, hi_day = days[i], days[i + 1]
+    return lo_day + (uid - lo_id) * (hi_day - lo_day) / (hi_id - lo_id)
+
+
+def _result(ids, days, uid, day):
+    if day is None:
+        if ids and uid >= ids[-1]:
+            last = date.fromordinal(days[-1])
+            return {"year": f"{last.year} or later", "month": None}
+        return None
+    d = date.fromordinal(int(day))
+    return {"year": d.year, "month": f"{d.year}-{d.month:02d}"}
+
+
+def estimate(insta_id):
+    """
+    {"year", "month"} estimate for a numeric user id by interpolating
+    between the surrounding table boundaries. Ids newer than the last
+    boundary get "<year> or later" and no month; unknown ids give None.
+    """
+    try:
+        uid = int(insta_id)
+    except (TypeError, ValueError):
+        return None
+
+    _TABLE.refresh()
+    ids, days = _TABLE.ids, _TABLE.days
+
+    i = bisect.bisect_right(ids, uid) - 1
+    if i < 0:
+        return None
+    if i + 1 >= len(ids):
+        return _result(ids, days, uid, None)
+    return _result(ids, days, uid, _segment_day(ids, days, i, uid))
+
+
+def estimate_many(insta_ids):
+    """
+    Bulk version of estimate() for backfills; uses numpy when installed.
+    """
+    _TABLE.refresh()
+    ids, days = _TABLE.ids, _TABLE.days
+
+    if numpy is None or len(ids) < 2:
+        return [estimate(i) for i in insta_ids]
+
+    uids = []
+    valid = []
+    for value in insta_ids:
+        try:
+            uids.append(int(value))
+            valid.append(True)
+        except (TypeError, ValueError):
+            uids.append(0)
+            valid.append(False)
+
+    # float64 is exact for ids below 2**53, far above current ids
+    xs = numpy.asarray(uids, dtype=numpy.float64)
+    table_ids = numpy.asarray(ids, dtype=numpy.float64)
+    interpolated = numpy.interp(xs, table_ids, numpy.asarray(days, dtype=numpy.float64))
+    inside = (xs >= table_ids[0]) & (xs < table_ids[-1])
+
+    out = []
+    for uid, ok, day, known in zip(uids, valid, interpolated.tolist(), inside.tolist()):
+        if not ok or uid < ids[0]:
+            out.append(None)
+        else:
+            out.append(_result(ids, days, uid, day if known else None))
+    return out
@@ -0,0 +1,343 @@
+import io
+import os
+import time
+import asyncio
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from api._lib import accesslog, endpoints, mediacache, mediaproxy, metrics, tokens
+from api._lib.base import error_body
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+MAX_CONCURRENCY = int(os.environ.get("ASGI_MAX_CONCURRENCY", "1000"))
+THREADS = int(os.environ.get("ASGI_THREADS", "64"))
+UPSTREAM_CONNECTIONS = int(os.environ.get("ASGI_UPSTREAM_CONNECTIONS", "512"))
+MAX_BODY = int(os.environ.get("ASGI_MAX_BODY", str(8 * 1024 * 1024)))
+# The disk media cache lives in the threaded relay path, so it takes over
+# ?link= requests whenever it is enabled.
+ASYNC_PROXY = os.environ.get("ASGI_ASYNC_PROXY", "1") == "1" and not mediacache.ENABLED
+
+# ?link= proxies that can be streamed on the event loop, with their default
+# Content-Type. tera-downloader is left out: it needs cloudscraper cookies.
+ASYNC_PROXIES = {
+    "ig-story": "application/octet-stream",
+    "ig-post": "application/octet-stream",
+    "tiktok-downloader": "video/mp4",
+    "twitter-download": "video/mp4"
+}
+
+DROP_HEADERS = {"connection", "transfer-encoding", "keep-alive", "server", "date"}
+
+
+def load_handlers():
+    """
+    Import every api/*.py endpoint and key it by its public path.
+    """
+    routes = {}
+    for stem in endpoints.names():
+        module = endpoints.load(stem)
+        if hasattr(module, "handler"):
+            routes[f"/api/{stem}"] = (stem, module)
+    return routes
+
+
+class _ResponseWriter(io.RawIOBase):
+    """
+    File-like `wfile` for a BaseHTTPRequestHandler running in a worker
+    thread. The raw status line and headers it writes are parsed into an
+    ASGI response start; body writes block until the event loop has sent
+    them, which gives natural backpressure.
+    """
+
+    def __init__(self, loop, send, disconnected):
+        self.loop = loop
+        self._send = send
+        self.disconnected = disconnected
+        self._head = b""
+        self.started = False
+
+    def writable(self):
+        return True
+
+    def _call(self, message):
+        if self.disconnected.is_set():
+            raise BrokenPipeError("client disconnected")
+        asyncio.run_coroutine_threadsafe(self._send(message), self.loop).result()
+
+    def _start(self, head):
+        lines = head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ", 2)[1])
+        headers = []
+        for line in lines[1:]:
+            if not line or ":" not in line:
+                continue
+            name, value = line.split(":", 1)
+            if name.strip().lower() in DROP_HEADERS:
+                continue
+            headers.append((name.strip().lower().encode("latin-1"), value.strip().encode("latin-1")))
+        self._call({"type": "http.response.start", "status": status, "headers": headers})
+        self.started = True
+
+    def write(self, data):
+        data = bytes(data)
+        if not self.started:
+            self._head += data
+            end = self._head.find(b"\r\n\r\n")
+            if end < 0:
+                return len(data)
+            head, body = self._head[:end], self._head[end + 4:]
+            self._head = b""
+            self._start(head)
+            if body:
+                self._call({"type": "http.response.body", "body": body, "more_body": True})
+            return len(data)
+
+        if data:
+            self._call({"type": "http.response.body", "body": data, "more_body": True})
+        return len(data)
+
+    def finish(self):
+        if not self.started:
+            self._call({"type": "http.response.start", "status": 500, "headers": []})
+            self.started = True
+        self._call({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _headers_message(scope):
+    msg = http.client.HTTPMessage()
+    for name, value in scope.get("headers", []):
+        msg[name.decode("latin-1")] = value.decode("latin-1")
+    return msg
+
+
+def _request_target(scope):
+    path = scope.get("raw_path") or scope["path"].encode()
+    if isinstance(path, bytes):
+        path = path.decode("latin-1")
+    query = scope.get("query_string", b"").decode("latin-1")
+    return f"{path}?{query}" if query else path
+
+
+class App:
+    """
+    ASGI application serving every api/*.py handler from one process.
+    Handler code runs on a bounded thread pool; ?link= media proxies are
+    streamed on the event loop with httpx when it is installed.
+    """
+
+    def __init__(self, routes=None):
+        self.routes = routes if routes is not None else load_handlers()
+        self.executor = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix="api")
+        self.client = None
+        self._limit = None
+
+    async def startup(self):
+        self._limit = asyncio.Semaphore(MAX_CONCURRENCY)
+        if httpx is not None and ASYNC_PROXY:
+            self.client = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=httpx.Timeout(30.0),
+                limits=httpx.Limits(
+                    max_connections=UPSTREAM_CONNECTIONS,
+                    max_keepalive_connections=UPSTREAM_CONNECTIONS
+                )
+            )
+
+    async def shutdown(self):
+        if self.client is not None:
+            await self.client.aclose()
+        self.executor.shutdown(wait=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+
+        if self._limit is None:
+            await self.startup()
+
+        async with self._limit:
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        path = scope["path"].rstrip("/")
+        route = self.routes.get(path)
+        if route is None:
+            return await self._plain(send, 404, b'{"status":"error","message":"Not found"}')
+
+        stem, module = route
+        headers = _headers_message(scope)
+
+        if self.client is not None and stem in ASYNC_PROXIES and scope["method"] in ("GET", "HEAD"):
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            if query.get("link"):
+                return await self._proxy(module, stem, query, headers, scope, send)
+
+        # the handlers check their own, smaller limits; this one bounds what
+        # is buffered before they run
+        try:
+            declared = int(headers.get("content-length") or 0)
+        except ValueError:
+            return await self._plain(send, 400, error_body("Invalid Content-Length"))
+        if declared > MAX_BODY:
+            return await self._plain(send, 413, error_body("Request body too large"))
+
+        chunks = []
+        received = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            received += len(chunk)
+            if received > MAX_BODY:
+                return await self._plain(send, 413, error_body("Request body too large"))
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+
+        loop = asyncio.get_running_loop()
+        disconnected = threading.Event()
+        writer = _ResponseWriter(loop, send, disconnected)
+
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+        try:
+            await loop.run_in_executor(
+                self.executor,
+                self._run_handler,
+                module, scope, headers, body, writer
+            )
+        finally:
+            watcher.cancel()
+
+    async def _watch_disconnect(self, receive, disconnected):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+                return
+
+    def _run_handler(self, module, scope, headers, body, writer):
+        cls = module.handler
+        h = cls.__new__(cls)
+        h.command = scope["method"]
+        h.path = _request_target(scope)
+        h.request_version = "HTTP/1.1"
+        h.requestline = f"{h.command} {h.path} HTTP/1.1"
+        h.headers = headers
+        h.client_address = tuple(scope.get("client") or ("127.0.0.1", 0))
+        h.server = None
+        h.close_connection = True
+        h.rfile = io.BytesIO(body)
+        h.wfile = writer
+
+        method = getattr(h, "do_" + h.command, None)
+        h.begin_request()
+        try:
+            if method is None:
+                h.send_response(405)
+                h.send_header("Content-Length", "0")
+                h.end_headers()
+            else:
+                method()
+            writer.finish()
+        except (BrokenPipeError, ConnectionError):
+            pass
+        finally:
+            h.end_request()
+
+    async def _proxy(self, module, stem, query, headers, scope, send):
+        start = time.perf_counter()
+        # status, body bytes and exception class, accounted once at the end
+        # like the threaded handlers' end_request()
+        result = {"status": None, "sent": 0, "error": None}
+        try:
+            await self._relay_link(module, stem, query, headers, scope, send, result)
+        finally:
+            self._account(stem, scope["method"], start, result)
+
+    async def _relay_link(self, module, stem, query, headers, scope, send, result):
+        try:
+            target = module.decode_url(query["link"][0])
+        except tokens.InvalidToken:
+            result["status"] = 403
+            return await self._plain(send, 403, error_body("Invalid or expired link"))
+
+        try:
+            request = self.client.build_request(
+                "GET", target, headers=mediaproxy.upstream_headers(headers)
+            )
+            r = await self.client.send(request, stream=True)
+        except Exception as e:
+            result["status"], result["error"] = 500, type(e).__name__
+            return await self._plain(send, 500)
+
+        try:
+            if r.status_code not in mediaproxy.RELAY_STATUSES:
+                result["status"] = 500
+                return await self._plain(send, 500)
+
+            relay = mediaproxy.response_headers(r.status_code, r.headers, ASYNC_PROXIES[stem])
+            result["status"] = r.status_code
+            await send({
+                "type": "http.response.start",
+                "status": r.status_code,
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in relay]
+            })
+
+            if r.status_code in (200, 206) and scope["method"] == "GET":
+                async for chunk in r.aiter_raw():
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                    result["sent"] += len(chunk)
+
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await r.aclose()
+
+    def _account(self, stem, method, start, result):
+        status = result["status"]
+        if status is None:
+            return
+        seconds = time.perf_counter() - start
+        method = metrics.method_label(method)
+        metrics.REQUESTS.inc(stem, method, str(status))
+        metrics.REQUEST_SECONDS.observe(seconds, stem)
+        if result["sent"]:
+            metrics.PROXY_BYTES.inc(stem, "upstream", amount=result["sent"])
+        if result["error"]:
+            metrics.EXCEPTIONS.inc(stem, result["error"])
+        if accesslog.ACCESS_LOG:
+            accesslog.record(
+                stem, method, status, None, seconds, None,
+                {"bytes": result["sent"], "error": result["error"]}
+            )
+
+    async def _plain(self, send, status, body=b""):
+        headers = [(b"content-length", str(len(body)).encode())]
+        if body:
+            headers.append((b"content-type", b"application/json"))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def create_app():
+    return App()
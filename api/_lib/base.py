@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import math
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from api._lib import accesslog, metrics, ratelimit
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# unread request body bytes discarded to keep a connection alive; a larger
+# remainder closes it instead
+DRAIN_LIMIT = int(os.environ.get("BODY_DRAIN_LIMIT", str(256 * 1024)))
+
+
+def dumps(payload):
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload)
+        except TypeError:
+            pass
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+@lru_cache(maxsize=256)
+def error_body(message):
+    return dumps({"status": "error", "message": message})
+
+
+@lru_cache(maxsize=None)
+def endpoint_name(cls):
+    """
+    The api/<stem>.py file a handler class comes from; its module name is
+    not the file name when loaded through endpoints.load().
+    """
+    module = sys.modules.get(cls.__module__)
+    path = getattr(module, "__file__", None) or cls.__module__
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class RequestBody:
+    """
+    The connection stream limited to one request's Content-Length, so a
+    handler can never read into the next request and whatever it leaves
+    unread can be drained afterwards.
+    """
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+        self.truncated = False
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if size <= 0:
+            return b""
+        data = self.stream.read(size)
+        if len(data) < size:
+            self.truncated = True
+        self.remaining -= len(data)
+        if self.truncated:
+            self.remaining = 0
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if size <= 0:
+            return b""
+        data = self.stream.readline(size)
+        if not data:
+            self.truncated = True
+        self.remaining = 0 if self.truncated else self.remaining - len(data)
+        return data
+
+    def drain(self, limit=DRAIN_LIMIT):
+        """
+        Reads and discards the rest of the body. False when it was too
+        large or the client went away, i.e. the connection cannot be reused.
+        """
+        if self.remaining > limit:
+            return False
+        while self.remaining and not self.truncated:
+            self.read(min(self.remaining, 64 * 1024))
+        return not self.truncated
+
+
+class BaseHandler(BaseHTTPRequestHandler):
+    """
+    Common response layer for the api/ handlers. Every response carries a
+    Content-Length so HTTP/1.1 connections can be kept alive.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes; with Nagle on, the body waits
+    # for the client's delayed ACK of the headers (~40ms per response)
+    disable_nagle_algorithm = True
+
+    cache_status = None
+    headers_sent = False
+    status_code = None
+    started = None
+
+    @property
+    def endpoint(self):
+        return endpoint_name(type(self))
+
+    def begin_request(self):
+        # one instance serves every request on a kept-alive connection
+        self.cache_status = None
+        self.headers_sent = False
+        self.status_code = None
+        self.started = time.perf_counter()
+        metrics.bind(self.endpoint)
+
+    def end_request(self):
+        if self.started is None:
+            return
+        if self.status_code is not None:
+            seconds = time.perf_counter() - self.started
+            method = metrics.method_label(self.command)
+            metrics.REQUESTS.inc(self.endpoint, method, str(self.status_code))
+            metrics.REQUEST_SECONDS.observe(seconds, self.endpoint)
+            if accesslog.ACCESS_LOG:
+                accesslog.record(
+                    self.endpoint, method, self.status_code,
+                    parse_qs(urlparse(self.path).query).get("key", [None])[0],
+                    seconds, self.cache_status, metrics.request_info()
+                )
+        self.started = None
+        metrics.bind(None)
+        self.finish_body()
+
+    def start_body(self):
+        """
+        Puts the request body behind a RequestBody. Bodies without a usable
+        Content-Length (chunked, malformed) cannot be skipped, so those
+        connections are closed after the response.
+        """
+        length = self.headers.get("Content-Length")
+        try:
+            length = int(length) if length is not None else 0
+        except ValueError:
+            length = -1
+        if length < 0 or self.headers.get("Transfer-Encoding"):
+            self.close_connection = True
+            length = 0
+        self.rfile = RequestBody(self.rfile, length)
+
+    def finish_body(self):
+        body = self.rfile
+        if not isinstance(body, RequestBody):
+            return
+        self.rfile = body.stream
+        if not self.close_connection and not body.drain():
+            self.close_connection = True
+
+    def parse_request(self):
+        self.begin_request()
+        if not super().parse_request():
+            return False
+        self.start_body()
+        return True
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        finally:
+            self.end_request()
+
+    def send_response(self, code, message=None):
+        self.status_code = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        # the media proxy sets X-Cache itself
+        if keyword == "X-Cache":
+            self.cache_status = value
+        super().send_header(keyword, value)
+
+    def end_headers(self):
+        super().end_headers()
+        self.headers_sent = True
+
+    def send_body(self, code, body, content_type="application/json", headers=None):
+        self.send_response(code)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if self.cache_status:
+            self.send_header("X-Cache", self.cache_status)
+        for name, value in headers or ():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+            metrics.add_sent(len(body))
+
+    def send_json(self, code, payload):
+        """
+        `payload` is either a dict to serialize or an error message string,
+        which is sent as {"status": "error", "message": ...}.
+        """
+        if code >= 500:
+            metrics.record_exception(self.endpoint)
+        with metrics.phase("serialize", self.endpoint):
+            if isinstance(payload, str):
+                body = error_body(payload)
+            else:
+                body = dumps(payload)
+        self.send_body(code, body)
+
+    def start_stream(self, code, content_type="application/x-ndjson", headers=None):
+        """
+        Start a response whose length is not known up front. The body ends
+        when the connection closes.
+        """
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Connection", "close")
+        if self.cache_status:
+            self.send_header("X-Cache", self.cache_status)
+        for name, value in headers or ():
+            self.send_header(name, value)
+        self.end_headers()
+        self.close_connection = True
+
+    def send_line(self, payload):
+        with metrics.phase("serialize", self.endpoint):
+            line = dumps(payload) + b"\n"
+        self.wfile.write(line)
+        metrics.add_sent(len(line))
+
+    def client_ip(self):
+        forwarded = self.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+        return self.client_address[0]
+
+    def rate_limited(self, keys_file, api_key, cost=1):
+        """
+        Answers 429 and returns True when `api_key` is over its tier's limit.
+        """
+        retry_after = ratelimit.check(keys_file, api_key, self.client_ip(), cost)
+        if not retry_after:
+            return False
+        self.send_body(
+            429,
+            error_body("Rate limit exceeded"),
+            headers=[("Retry-After", str(math.ceil(retry_after)))]
+        )
+        return True
+
+    def length_required(self):
+        """
+        Answers 411 and returns True for a body sent without Content-Length
+        (chunked); the handlers only read Content-Length delimited bodies.
+        """
+        if self.headers.get("Content-Length") is None and self.headers.get("Transfer-Encoding"):
+            self.close_connection = True
+            self.send_json(411, "Content-Length required")
+            return True
+        return False
+
+    def send_empty(self, code):
+        self.send_body(code, b"", content_type=None)
+
+    def abort(self, code=500):
+        """
+        Empty error response, or a dropped connection when the response
+        had already started streaming.
+        """
+        if self.headers_sent:
+            self.close_connection = True
+            return
+        self.send_empty(code)
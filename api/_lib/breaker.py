@@ -0,0 +1,222 @@
+import os
+import time
+import threading
+from collections import deque
+
+try:
+    from requests import exceptions as http_errors
+except ImportError:
+    http_errors = None
+
+WINDOW = float(os.environ.get("BREAKER_WINDOW", "60"))
+MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "10"))
+ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", "0.5"))
+SLOW_CALL = float(os.environ.get("BREAKER_SLOW_CALL", "15"))
+OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+HALF_OPEN_CALLS = int(os.environ.get("BREAKER_HALF_OPEN_CALLS", "1"))
+# latency quantiles come from the most recent LATENCY_SAMPLES successful
+# calls and are recomputed at most every LATENCY_REFRESH seconds
+LATENCY_SAMPLES = int(os.environ.get("BREAKER_LATENCY_SAMPLES", "256"))
+LATENCY_REFRESH = float(os.environ.get("BREAKER_LATENCY_REFRESH", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class ProviderError(Exception):
+    """
+    Raised by adapters that check the provider's status code themselves,
+    so is_failure() can tell a provider outage from a rejected input.
+    """
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+TRANSPORT_ERRORS = (TimeoutError, ConnectionError)
+if http_errors is not None:
+    TRANSPORT_ERRORS += (http_errors.Timeout, http_errors.ConnectionError, http_errors.ChunkedEncodingError)
+
+
+def is_failure(error):
+    """
+    Only timeouts, connection errors and 5xx answers say the provider is
+    unhealthy. Anything else (a provider 4xx, "not found", an invalid URL)
+    is caused by the request and must not open the breaker for everyone.
+    """
+    if isinstance(error, TRANSPORT_ERRORS):
+        return True
+    status = getattr(error, "status", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    return status is not None and status >= 500
+
+
+class Breaker:
+    """
+    Rolling-window circuit breaker for one upstream provider. A call that
+    fails (see is_failure), or takes longer than SLOW_CALL seconds, counts
+    as a failure. Once at least MIN_CALLS calls in the last WINDOW seconds
+    fail at ERROR_RATE or worse the breaker opens and calls fail
+    immediately for OPEN_SECONDS; after that it closes again once
+    HALF_OPEN_CALLS probes have all succeeded.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes = 0
+        self.successes = 0
+        self.rejected = 0
+        self._calls = deque()
+        self._failures = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._quantiles = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._calls and self._calls[0][0] < now - WINDOW:
+            if not self._calls.popleft()[1]:
+                self._failures -= 1
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.probes = 0
+        self.successes = 0
+
+    def allow(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN:
+                if now - self.opened_at < OPEN_SECONDS:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self.probes = 0
+                self.successes = 0
+
+            if self.state == HALF_OPEN:
+                if self.probes >= HALF_OPEN_CALLS:
+                    self.rejected += 1
+                    return False
+                self.probes += 1
+            return True
+
+    def record(self, ok, seconds):
+        now = time.monotonic()
+        ok = ok and seconds <= SLOW_CALL
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if not ok:
+                    self._open(now)
+                    return
+                self.successes += 1
+                if self.successes < HALF_OPEN_CALLS:
+                    return
+                self.state = CLOSED
+                self._calls.clear()
+                self._failures = 0
+                self._latencies.clear()
+                self._quantiles.clear()
+
+            self._calls.append((now, ok, seconds))
+            if ok:
+                self._latencies.append((now, seconds))
+            else:
+                self._failures += 1
+            self._prune(now)
+
+            if self.state == CLOSED and len(self._calls) >= MIN_CALLS:
+                if self._failures >= ERROR_RATE * len(self._calls):
+                    self._open(now)
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} is unavailable")
+
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            # the provider answered; the request itself was the problem
+            self.record(not is_failure(e), time.monotonic() - start)
+            raise
+        self.record(True, time.monotonic() - start)
+        return result
+
+    def latency(self, p, min_calls=MIN_CALLS):
+        """
+        p-quantile of recent successful call latency in the window, or None
+        while there are fewer than `min_calls` samples. Sorting a bounded
+        sample at most every LATENCY_REFRESH seconds keeps this off the
+        per-request path.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._quantiles.get((p, min_calls))
+            if cached is not None and now - cached[0] < LATENCY_REFRESH:
+                return cached[1]
+            samples = [seconds for at, seconds in self._latencies if at >= now - WINDOW]
+
+        value = None
+        if samples and len(samples) >= min_calls:
+            samples.sort()
+            value = samples[min(len(samples) - 1, int(p * len(samples)))]
+        with self._lock:
+            self._quantiles[(p, min_calls)] = (now, value)
+        return value
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            calls = len(self._calls)
+            failures = self._failures
+            state = self.state
+            retry_in = max(0.0, OPEN_SECONDS - (now - self.opened_at)) if state == OPEN else 0.0
+            rejected = self.rejected
+
+        p50 = self.latency(0.5, 1)
+        p95 = self.latency(0.95, 1)
+
+        return {
+            "state": state,
+            "calls": calls,
+            "error_rate": round(failures / calls, 3) if calls else 0.0,
+            "p50_seconds": None if p50 is None else round(p50, 3),
+            "p95_seconds": None if p95 is None else round(p95, 3),
+            "rejected": rejected,
+            "retry_in": round(retry_in, 1)
+        }
+
+
+_BREAKERS = {}
+_LOCK = threading.Lock()
+
+
+def get(name):
+    """
+    Breaker for a provider, keyed by the env var that configures it.
+    """
+    b = _BREAKERS.get(name)
+    if b is None:
+        with _LOCK:
+            b = _BREAKERS.get(name)
+            if b is None:
+                b = _BREAKERS[name] = Breaker(name)
+    return b
+
+
+def snapshot():
+    with _LOCK:
+        breakers = list(_BREAKERS.values())
+    return {b.name: b.snapshot() for b in breakers}
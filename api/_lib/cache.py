@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from api._lib import singleflight
+
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()
+CACHE_PATH = os.environ.get("CACHE_PATH", "/tmp/reel-api-cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "2048"))
+
+MISSING = object()
+
+
+class MemoryBackend:
+    """
+    In-process LRU with per-entry expiry.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return MISSING
+            expires, value = item
+            if expires <= time.time():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteBackend:
+    """
+    File-backed cache shared by every worker on the box. Values are stored
+    as JSON; least recently used rows are evicted past max_entries.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._conn() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT, expires REAL, used REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+
+    def _conn(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        db = self._conn()
+        now = time.time()
+        row = db.execute(
+            "SELECT value, expires FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return MISSING
+        if row[1] <= now:
+            db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return MISSING
+        db.execute("UPDATE cache SET used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        db = self._conn()
+        now = time.time()
+        db.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires, used) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl, now)
+        )
+        db.execute(
+            "DELETE FROM cache WHERE key IN ("
+            "SELECT key FROM cache ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class ResultCache:
+
+    def __init__(self, namespace, ttl, backend):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.backend = backend
+        self.flight = singleflight.Group()
+        self.counters = {"hits": 0, "misses": 0, "shared": 0}
+        self._counters_lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._counters_lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def stats(self):
+        with self._counters_lock:
+            stats = dict(self.counters)
+        # shared single-flight results also saved an upstream call
+        lookups = stats["hits"] + stats["misses"] + stats["shared"]
+        saved = stats["hits"] + stats["shared"]
+        stats["hit_rate"] = round(saved / lookups, 3) if lookups else 0.0
+        return stats
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Returns (value, hit). On a miss, concurrent callers for the same key
+        share a single `fetch()` call; a None result is not cached.
+        """
+        full_key = f"{self.namespace}:{key}"
+        enabled = self.backend is not None and self.ttl > 0
+
+        if enabled:
+            try:
+                value = self.backend.get(full_key)
+            except Exception:
+                value = MISSING
+            if value is not MISSING:
+                self.count("hits")
+                return value, True
+
+        def load():
+            value = fetch()
+            if value is not None and enabled:
+                try:
+                    self.backend.set(full_key, value, self.ttl)
+                except Exception:
+                    pass
+            return value
+
+        value, shared = self.flight.do(full_key, load)
+        self.count("shared" if shared else "misses")
+        return value, False
+
+
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+_CACHES = {}
+
+
+def get_backend():
+    global _BACKEND
+    if CACHE_BACKEND in ("off", "none", ""):
+        return None
+    if _BACKEND is None:
+        with _BACKEND_LOCK:
+            if _BACKEND is None:
+                if CACHE_BACKEND == "sqlite":
+                    _BACKEND = SQLiteBackend()
+                else:
+                    _BACKEND = MemoryBackend()
+    return _BACKEND
+
+
+def get_cache(namespace, default_ttl):
+    """
+    TTL is read from CACHE_TTL_<NAMESPACE>, e.g. CACHE_TTL_IG_STORY.
+    """
+    env = "CACHE_TTL_" + namespace.upper().replace("-", "_")
+    ttl = float(os.environ.get(env, default_ttl))
+    result_cache = _CACHES[namespace] = ResultCache(namespace, ttl, get_backend())
+    return result_cache
+
+
+def stats():
+    return {name: c.stats() for name, c in list(_CACHES.items())}
@@ -0,0 +1,42 @@
+import os
+import sys
+import threading
+import importlib.util
+
+API_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+_LOCK = threading.RLock()
+
+
+def names():
+    return sorted(
+        name[:-3] for name in os.listdir(API_DIR)
+        if name.endswith(".py") and not name.startswith("_")
+    )
+
+
+def load(stem):
+    """
+    Import api/<stem>.py once per process. Endpoint file names are not
+    valid module names, so they are registered as api_<stem>.
+    """
+    module_name = "api_" + stem.replace("-", "_")
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+
+    with _LOCK:
+        module = sys.modules.get(module_name)
+        if module is None:
+            spec = importlib.util.spec_from_file_location(
+                module_name,
+                os.path.join(API_DIR, stem + ".py")
+            )
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            try:
+                spec.loader.exec_module(module)
+            except BaseException:
+                del sys.modules[module_name]
+                raise
+    return module
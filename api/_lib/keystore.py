@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from api._lib import metrics
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# where the key files live; the repo root unless overridden
+KEYS_DIR = os.environ.get("KEYS_DIR", ROOT_DIR)
+
+RELOAD_INTERVAL = float(os.environ.get("KEYS_RELOAD_INTERVAL", "2"))
+
+MASTER_KEYS_FILE = "masterkeys.txt"
+
+KeyEntry = namedtuple("KeyEntry", ["key", "expiry", "scope"])
+
+
+class KeyFile:
+    """
+    Parsed view of one key file. Lines are `key:dd/mm/YYYY[:scope]`,
+    or a bare `key` when the file is undated (masterkeys.txt).
+    The file is only re-read when its mtime changes.
+    """
+
+    def __init__(self, path, dated=True):
+        self.path = path
+        self.dated = dated
+        self.entries = {}
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _parse(self):
+        entries = {}
+        with open(self.path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+
+                if ":" not in line:
+                    if not self.dated:
+                        entries.setdefault(line, KeyEntry(line, None, None))
+                    continue
+
+                parts = line.split(":")
+                key = parts[0]
+                try:
+                    expiry = datetime.strptime(parts[1], "%d/%m/%Y")
+                except ValueError:
+                    continue
+                scope = parts[2] if len(parts) > 2 and parts[2] else None
+                entries.setdefault(key, KeyEntry(key, expiry, scope))
+        return entries
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < RELOAD_INTERVAL:
+            return
+
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                self.entries = {}
+                self._mtime = None
+                return
+
+            if force or mtime != self._mtime:
+                try:
+                    self.entries = self._parse()
+                    self._mtime = mtime
+                except OSError:
+                    self.entries = {}
+                    self._mtime = None
+
+    def get(self, api_key):
+        self.refresh()
+        return self.entries.get(api_key)
+
+
+_FILES = {}
+_FILES_LOCK = threading.Lock()
+
+
+def key_file(name, dated=True):
+    path = os.path.join(KEYS_DIR, name)
+    kf = _FILES.get(path)
+    if kf is None:
+        with _FILES_LOCK:
+            kf = _FILES.get(path)
+            if kf is None:
+                kf = _FILES[path] = KeyFile(path, dated=dated)
+    return kf
+
+
+def lookup(name, api_key):
+    if not api_key:
+        return None
+    return key_file(name).get(api_key)
+
+
+def is_master_key(api_key):
+    if not api_key:
+        return False
+    return key_file(MASTER_KEYS_FILE, dated=False).get(api_key) is not None
+
+
+def is_key_valid(name, api_key, allow_master=False):
+    if not api_key:
+        return False
+
+    with metrics.phase("key_check"):
+        if allow_master and is_master_key(api_key):
+            return True
+
+        entry = lookup(name, api_key)
+        if entry is None:
+            return False
+        return datetime.utcnow() <= entry.expiry
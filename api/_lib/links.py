@@ -0,0 +1,237 @@
+import os
+import re
+import html
+from collections import deque
+from html.entities import html5
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+BACKEND = os.environ.get("LINKS_BACKEND", "lxml" if etree is not None else "stdlib")
+
+FEED_SIZE = 64 * 1024
+
+LINK_ATTRS = {
+    "a": "href",
+    "source": "src",
+    "img": "src"
+}
+
+# never pushed on the open-element stack, like BeautifulSoup's builder
+VOID_TAGS = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen",
+    "link", "menuitem", "meta", "param", "source", "track", "wbr",
+    "basefont", "bgsound", "command", "frame", "image", "isindex",
+    "nextid", "spacer"
+))
+
+# text inside these is not a plain string to get_text()
+HIDDEN_TEXT = frozenset(("script", "style", "template", "rt", "rp"))
+
+# libxml2 keeps the first of a repeated attribute, html.parser the last
+REPEATED_LINK_ATTR = re.compile(r"<(?:a|img|source)(?=\s)[^>]*?\s(href|src)\s*=[^>]*\s\1\s*=", re.I)
+
+
+class Link:
+    __slots__ = ("tag", "url", "text", "_parts", "done")
+
+    def __init__(self, tag, url, with_text):
+        self.tag = tag
+        self.url = url
+        self.text = ""
+        self._parts = [] if with_text else None
+        self.done = not with_text
+
+    def close(self):
+        if self._parts is not None:
+            self.text = "".join(p.strip() for p in self._parts if p.strip())
+            self._parts = None
+        self.done = True
+
+
+class _Collector:
+    """
+    Parser target that keeps only link-bearing tags. Anchor text is
+    collected like BeautifulSoup's get_text(strip=True) over an
+    html.parser tree: an end tag closes back to its matching open element,
+    stray end tags are ignored, and script/style text is left out.
+    """
+
+    def __init__(self, tags, with_text):
+        self.tags = tags
+        self.with_text = with_text
+        self.pending = deque()
+        self._stack = []
+        self._open = []
+        self._text = []
+        self._hidden = 0
+
+    def start(self, tag, attrs):
+        tag = tag.lower()
+        link = None
+        if tag in self.tags:
+            url = attrs.get(LINK_ATTRS[tag])
+            if url is not None:
+                link = Link(tag, url, self.with_text and tag == "a")
+                self.pending.append(link)
+
+        if not self.with_text:
+            return
+        self._flush()
+        if tag in VOID_TAGS:
+            return
+        if link is not None and not link.done:
+            self._open.append(link)
+        else:
+            link = None
+        self._stack.append((tag, link))
+        if tag in HIDDEN_TEXT:
+            self._hidden += 1
+
+    def end(self, tag):
+        if not self.with_text:
+            return
+        tag = tag.lower()
+        self._flush()
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                break
+        else:
+            return
+        while len(self._stack) > i:
+            name, link = self._stack.pop()
+            if name in HIDDEN_TEXT:
+                self._hidden -= 1
+            if link is not None:
+                self._open.remove(link)
+                link.close()
+
+    def data(self, text):
+        if self.with_text:
+            self._text.append(text)
+
+    def comment(self, text):
+        if self.with_text:
+            self._flush()
+
+    def _flush(self):
+        """
+        Ends the current text string; adjacent data events make one
+        string, which is what get_text(strip=True) strips.
+        """
+        if not self._text:
+            return
+        text = "".join(self._text)
+        self._text = []
+        if not self._hidden:
+            for link in self._open:
+                link._parts.append(text)
+
+    def close(self):
+        self._flush()
+        for link in self._open:
+            link.close()
+        self._open = []
+        self._stack = []
+
+    def ready(self):
+        while self.pending and self.pending[0].done:
+            yield self.pending.popleft()
+
+
+class _StdlibParser(HTMLParser):
+    """
+    html.parser driven the way BeautifulSoup's builder drives it, with
+    character references resolved by hand so text splits the same way.
+    """
+
+    def __init__(self, target):
+        super().__init__(convert_charrefs=False)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag, {k: v or "" for k, v in attrs})
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.target.end(tag)
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+    def handle_entityref(self, name):
+        char = html5.get(name + ";")
+        self.target.data(char if char is not None else f"&{name}")
+
+    def handle_charref(self, name):
+        self.target.data(html.unescape(f"&#{name};"))
+
+    def handle_comment(self, data):
+        self.target.comment(data)
+
+    handle_decl = handle_pi = handle_comment
+
+    def unknown_decl(self, data):
+        self.target.comment(data)
+        if data.upper().startswith("CDATA["):
+            self.target.data(data[len("CDATA["):])
+            self.target.comment(data)
+
+
+def _parser(collector, markup):
+    """
+    lxml for plain link lists. Anchor text depends on how the tree is
+    repaired around broken markup, where libxml2 and html.parser disagree,
+    so text extraction and pages with a repeated link attribute stay on
+    html.parser.
+    """
+    if (
+        BACKEND == "lxml"
+        and etree is not None
+        and not collector.with_text
+        and not REPEATED_LINK_ATTR.search(markup)
+    ):
+        return etree.HTMLParser(target=collector)
+    return _StdlibParser(collector)
+
+
+def iter_links(markup, tags=("a",), with_text=False):
+    """
+    Single pass over `markup` yielding Link objects for a[href],
+    source[src] and img[src] in document order. Stops parsing as soon as
+    the caller stops iterating.
+    """
+    collector = _Collector(set(tags), with_text)
+    parser = _parser(collector, markup)
+
+    for i in range(0, len(markup), FEED_SIZE):
+        parser.feed(markup[i:i + FEED_SIZE])
+        yield from collector.ready()
+
+    parser.close()
+    collector.close()
+    yield from collector.ready()
+
+
+def hrefs(markup, match=None):
+    return [
+        link.url for link in iter_links(markup)
+        if match is None or match(link.url)
+    ]
+
+
+def first_href(markup, match):
+    for link in iter_links(markup):
+        if match(link.url):
+            return link.url
+    return None
+
+
+def is_mp4(url):
+    return ".mp4" in url.lower()
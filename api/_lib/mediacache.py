@@ -0,0 +1,465 @@
+import os
+import json
+import mmap
+import time
+import uuid
+import hashlib
+import threading
+
+CACHE_DIR = os.environ.get("MEDIA_CACHE_DIR")
+CACHE_BYTES = int(os.environ.get("MEDIA_CACHE_BYTES", str(2 * 1024 ** 3)))
+MAX_OBJECT = int(os.environ.get("MEDIA_CACHE_MAX_OBJECT", str(CACHE_BYTES // 4)))
+# a fill nobody reads any more is finished only if this little is left
+ORPHAN_BYTES = int(os.environ.get("MEDIA_CACHE_ORPHAN_BYTES", str(4 * 1024 * 1024)))
+
+ENABLED = bool(CACHE_DIR)
+
+TOUCH_INTERVAL = 60
+WAIT_TIMEOUT = 30
+SEND_CHUNK = 1024 * 1024
+
+CONDITIONAL_HEADERS = ("Range", "If-Range", "If-None-Match", "If-Modified-Since")
+
+_fills = {}
+_fills_lock = threading.Lock()
+_evict_lock = threading.Lock()
+
+
+def key_for(url):
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+class FillAbandoned(Exception):
+    """
+    Raised out of the fill's writer once it has no readers left; `sent`
+    is what reached the downloading client.
+    """
+
+    def __init__(self, sent):
+        super().__init__("cache fill abandoned")
+        self.sent = sent
+
+
+def _paths(key):
+    base = os.path.join(CACHE_DIR, key[:2], key)
+    return base, base + ".meta"
+
+
+class Fill:
+    """
+    An in-progress download into the cache. Readers can follow the part
+    file while `size` grows; `meta` is set once upstream headers are known.
+    `readers` counts the downloading client and every follower.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.part = os.path.join(CACHE_DIR, key[:2], f"{key}.part.{uuid.uuid4().hex}")
+        self.meta = None
+        self.size = 0
+        self.done = False
+        self.failed = False
+        self.readers = 1
+        self.abandoned = False
+        self.cond = threading.Condition()
+
+    def started(self, meta):
+        with self.cond:
+            self.meta = meta
+            self.cond.notify_all()
+
+    def advance(self, n):
+        with self.cond:
+            self.size += n
+            self.cond.notify_all()
+
+    def finish(self, ok):
+        with self.cond:
+            self.done = True
+            self.failed = not ok
+            self.cond.notify_all()
+
+    def wait_meta(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.meta is not None or self.done, WAIT_TIMEOUT)
+            return None if self.failed else self.meta
+
+    def join(self):
+        """
+        Register a follower; False once the fill is being dropped.
+        """
+        with self.cond:
+            if self.abandoned or self.failed:
+                return False
+            self.readers += 1
+            return True
+
+    def leave(self):
+        with self.cond:
+            self.readers -= 1
+
+    def orphaned(self):
+        """
+        True, and from then on for good, once nobody reads the fill and
+        more than ORPHAN_BYTES are still to come.
+        """
+        with self.cond:
+            if not self.readers and self.meta["length"] - self.size > ORPHAN_BYTES:
+                self.abandoned = True
+            return self.abandoned
+
+
+class _TeeWriter:
+    """
+    Writes to the part file and the client. Other requests follow the
+    fill, so a client that goes away only stops the copy to it, unless no
+    one else is reading and the rest is not worth downloading.
+    """
+
+    def __init__(self, f, out, fill):
+        self.f = f
+        self.out = out
+        self.fill = fill
+        self.client_gone = False
+        self.sent = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.fill.advance(len(data))
+        if not self.client_gone:
+            try:
+                self.out.write(data)
+                self.sent += len(data)
+            except OSError:
+                self.client_gone = True
+                self.fill.leave()
+        if self.client_gone and self.fill.orphaned():
+            raise FillAbandoned(self.sent)
+        return len(data)
+
+
+def is_open_range(client_headers):
+    """
+    `Range: bytes=0-`, which <video> elements send for a plain playback.
+    """
+    value = client_headers.get("Range")
+    return bool(value) and value.replace(" ", "") == "bytes=0-" and not client_headers.get("If-Range")
+
+
+def is_cacheable_request(client_headers):
+    if is_open_range(client_headers):
+        names = [name for name in CONDITIONAL_HEADERS if name != "Range"]
+    else:
+        names = CONDITIONAL_HEADERS
+    return not any(client_headers.get(name) for name in names)
+
+
+def lookup(url):
+    """
+    Returns ("hit", (path, meta)), ("filling", Fill) or (None, None).
+    """
+    key = key_for(url)
+    path, meta_path = _paths(key)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if os.path.getsize(path) == meta["length"]:
+            return "hit", (path, meta)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    with _fills_lock:
+        fill = _fills.get(key)
+    if fill is not None:
+        return "filling", fill
+    return None, None
+
+
+def begin_fill(url):
+    """
+    Claim the fill for `url`; returns None when another request holds it.
+    """
+    key = key_for(url)
+    with _fills_lock:
+        if key in _fills:
+            return None
+        fill = _fills[key] = Fill(key)
+    os.makedirs(os.path.dirname(fill.part), exist_ok=True)
+    return fill
+
+
+def end_fill(fill, ok):
+    fill.finish(ok)
+    with _fills_lock:
+        _fills.pop(fill.key, None)
+
+
+def fill_and_stream(handler, fill, r, pump, send_headers):
+    """
+    Stream an upstream 200 response to the client while writing it to the
+    cache. The file only becomes visible through an atomic rename once the
+    whole body has arrived. `send_headers(length)` answers the client.
+    """
+    length = r.headers.get("Content-Length")
+    if r.status_code != 200 or not length or int(length) > MAX_OBJECT:
+        end_fill(fill, False)
+        return None
+
+    meta = {
+        "length": int(length),
+        "content_type": r.headers.get("Content-Type"),
+        "content_encoding": r.headers.get("Content-Encoding"),
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified")
+    }
+
+    path, meta_path = _paths(fill.key)
+    ok = False
+    try:
+        with open(fill.part, "wb", buffering=0) as f:
+            fill.started(meta)
+            send_headers(meta["length"])
+            tee = _TeeWriter(f, handler.wfile, fill)
+            try:
+                stats = pump(r, tee)
+            finally:
+                if tee.client_gone:
+                    handler.close_connection = True
+
+        if stats.bytes_sent == meta["length"]:
+            tmp_meta = f"{meta_path}.{uuid.uuid4().hex}"
+            with open(tmp_meta, "w") as f:
+                json.dump(meta, f)
+            os.replace(fill.part, path)
+            os.replace(tmp_meta, meta_path)
+            ok = True
+        return stats
+    finally:
+        if not ok:
+            try:
+                os.remove(fill.part)
+            except OSError:
+                pass
+        end_fill(fill, ok)
+        if ok:
+            evict()
+
+
+def _touch(path):
+    try:
+        if time.time() - os.path.getmtime(path) > TOUCH_INTERVAL:
+            os.utime(path)
+    except OSError:
+        pass
+
+
+def _parse_range(value, size):
+    if not value or not value.startswith("bytes=") or "," in value:
+        return None
+    start, _, end = value[6:].strip().partition("-")
+    try:
+        if start == "":
+            n = int(end)
+            if n <= 0:
+                return False
+            return max(size - n, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _not_modified(client_headers, meta):
+    etag = meta.get("etag")
+    inm = client_headers.get("If-None-Match")
+    if inm and etag:
+        return etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*"
+    ims = client_headers.get("If-Modified-Since")
+    return bool(ims and meta.get("last_modified") and ims == meta["last_modified"])
+
+
+def _validator_headers(meta):
+    headers = []
+    if meta.get("etag"):
+        headers.append(("ETag", meta["etag"]))
+    if meta.get("last_modified"):
+        headers.append(("Last-Modified", meta["last_modified"]))
+    return headers
+
+
+def _copy_out(handler, f, offset, count):
+    sock = getattr(handler, "connection", None)
+    if sock is not None and hasattr(sock, "sendfile"):
+        sock.sendfile(f, offset, count)
+        return
+
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            end = offset + count
+            while offset < end:
+                n = min(SEND_CHUNK, end - offset)
+                handler.wfile.write(view[offset:offset + n])
+                offset += n
+        finally:
+            view.release()
+
+
+def serve_file(handler, path, meta, default_type):
+    """
+    Answer from a complete cached object, honouring Range and
+    If-None-Match/If-Modified-Since. Returns the number of body bytes sent.
+    """
+    size = meta["length"]
+    _touch(path)
+
+    if _not_modified(handler.headers, meta):
+        handler.send_response(304)
+        for name, value in _validator_headers(meta):
+            handler.send_header(name, value)
+        handler.end_headers()
+        return 0
+
+    rng = None
+    if_range = handler.headers.get("If-Range")
+    if not if_range or if_range in (meta.get("etag"), meta.get("last_modified")):
+        rng = _parse_range(handler.headers.get("Range"), size)
+
+    if rng is False:
+        handler.send_response(416)
+        handler.send_header("Content-Range", f"bytes */{size}")
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+        return 0
+
+    start, end = rng if rng else (0, size - 1)
+    count = end - start + 1 if size else 0
+
+    handler.send_response(206 if rng else 200)
+    handler.send_header("Content-Type", meta.get("content_type") or default_type)
+    handler.send_header("Content-Disposition", "inline")
+    handler.send_header("Content-Length", str(count))
+    handler.send_header("Accept-Ranges", "bytes")
+    if rng:
+        handler.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+    if meta.get("content_encoding"):
+        handler.send_header("Content-Encoding", meta["content_encoding"])
+    for name, value in _validator_headers(meta):
+        handler.send_header(name, value)
+    handler.send_header("X-Cache", "HIT")
+    handler.end_headers()
+
+    if count and handler.command != "HEAD":
+        with open(path, "rb") as f:
+            _copy_out(handler, f, start, count)
+    return count
+
+
+def content_range_headers(client_headers, length):
+    """
+    Status and Content-Range for a full object sent in answer to an open
+    `bytes=0-` range, which is a 206 of the whole body.
+    """
+    if length and is_open_range(client_headers):
+        return 206, [("Content-Range", f"bytes 0-{length - 1}/{length}")]
+    return 200, []
+
+
+def follow_fill(handler, fill, default_type):
+    """
+    Stream an object that another request is still downloading, reading
+    the part file as it grows. Returns None if the fill was abandoned
+    before this reader joined so the caller can go upstream itself.
+    """
+    meta = fill.wait_meta()
+    if meta is None or not fill.join():
+        return None
+
+    try:
+        f = open(fill.part, "rb")
+    except FileNotFoundError:
+        path, _ = _paths(fill.key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            fill.leave()
+            return None
+
+    try:
+        with f:
+            status, range_headers = content_range_headers(handler.headers, meta["length"])
+            handler.send_response(status)
+            handler.send_header("Content-Type", meta.get("content_type") or default_type)
+            handler.send_header("Content-Disposition", "inline")
+            handler.send_header("Content-Length", str(meta["length"]))
+            handler.send_header("Accept-Ranges", "bytes")
+            for name, value in range_headers:
+                handler.send_header(name, value)
+            if meta.get("content_encoding"):
+                handler.send_header("Content-Encoding", meta["content_encoding"])
+            for name, value in _validator_headers(meta):
+                handler.send_header(name, value)
+            handler.send_header("X-Cache", "FILL")
+            handler.end_headers()
+
+            sent = 0
+            while sent < meta["length"]:
+                with fill.cond:
+                    fill.cond.wait_for(lambda: fill.size > sent or fill.done, WAIT_TIMEOUT)
+                    available = fill.size
+                    failed = fill.failed
+                if available <= sent:
+                    if failed or fill.done:
+                        raise IOError("cache fill aborted")
+                    continue
+                chunk = f.read(min(available - sent, SEND_CHUNK))
+                if not chunk:
+                    continue
+                handler.wfile.write(chunk)
+                sent += len(chunk)
+            return sent
+    finally:
+        fill.leave()
+
+
+def evict():
+    """
+    Delete least recently used objects until the cache fits CACHE_BYTES.
+    """
+    if not _evict_lock.acquire(blocking=False):
+        return
+    try:
+        entries = []
+        total = 0
+        for bucket in os.scandir(CACHE_DIR):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                name = entry.name
+                if ".part." in name or name.endswith(".meta") or ".meta." in name:
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+        if total <= CACHE_BYTES:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= CACHE_BYTES:
+                break
+            for p in (path, path + ".meta"):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            total -= size
+    finally:
+        _evict_lock.release()
@@ -0,0 +1,227 @@
+import os
+import time
+import threading
+from collections import namedtuple
+
+from api._lib import mediacache, metrics
+
+FORWARD_HEADERS = (
+    "Range",
+    "If-Range",
+    "If-None-Match",
+    "If-Modified-Since"
+)
+
+PASSTHROUGH_HEADERS = (
+    "Content-Length",
+    "Content-Range",
+    "Content-Encoding",
+    "Accept-Ranges",
+    "ETag",
+    "Last-Modified"
+)
+
+MIN_CHUNK = int(os.environ.get("PROXY_MIN_CHUNK", str(64 * 1024)))
+MAX_CHUNK = int(os.environ.get("PROXY_MAX_CHUNK", str(1024 * 1024)))
+
+FAST_READ = 0.05
+SLOW_READ = 0.25
+
+TransferStats = namedtuple("TransferStats", ["bytes_sent", "seconds"])
+
+_local = threading.local()
+
+
+def upstream_headers(client_headers):
+    """
+    Range/conditional headers from the client request to replay upstream.
+    Identity encoding keeps upstream Content-Length/Content-Range valid
+    for the bytes we forward.
+    """
+    headers = {"Accept-Encoding": "identity"}
+    for name in FORWARD_HEADERS:
+        value = client_headers.get(name)
+        if value:
+            headers[name] = value
+    return headers
+
+
+def _buffer():
+    buf = getattr(_local, "buffer", None)
+    if buf is None:
+        buf = _local.buffer = memoryview(bytearray(MAX_CHUNK))
+    return buf
+
+
+def _next_size(size, n, elapsed):
+    if n == size and elapsed < FAST_READ:
+        return min(size * 2, MAX_CHUNK)
+    if elapsed > SLOW_READ:
+        return max(size // 2, MIN_CHUNK)
+    return size
+
+
+def pump(r, out):
+    """
+    Copy the upstream body to `out` through one reusable per-thread buffer.
+    The read size starts at MIN_CHUNK and doubles while reads fill the
+    buffer quickly, halving again when a round trip gets slow.
+    """
+    size = MIN_CHUNK
+    sent = 0
+    start = time.perf_counter()
+
+    raw = getattr(r, "raw", None)
+    readinto = getattr(raw, "readinto", None)
+
+    try:
+        if readinto is None:
+            for chunk in r.iter_content(MAX_CHUNK):
+                if chunk:
+                    out.write(chunk)
+                    sent += len(chunk)
+            return TransferStats(sent, time.perf_counter() - start)
+
+        view = _buffer()
+        while True:
+            t0 = time.perf_counter()
+            n = readinto(view[:size])
+            if not n:
+                break
+            out.write(view[:n])
+            sent += n
+            size = _next_size(size, n, time.perf_counter() - t0)
+
+        return TransferStats(sent, time.perf_counter() - start)
+    finally:
+        metrics.proxied(sent)
+        metrics.observe_phase("transfer", time.perf_counter() - start)
+
+
+RELAY_STATUSES = (200, 206, 304, 416)
+
+
+def response_headers(status, upstream, default_type="application/octet-stream"):
+    """
+    Headers to send to the client for a relayed upstream response.
+    """
+    headers = []
+
+    if status in (200, 206):
+        headers.append(("Content-Type", upstream.get("Content-Type", default_type)))
+        headers.append(("Content-Disposition", "inline"))
+        names = PASSTHROUGH_HEADERS
+    else:
+        names = ("Content-Range", "ETag", "Last-Modified")
+
+    for name in names:
+        value = upstream.get(name)
+        if value:
+            headers.append((name, value))
+
+    if status == 416:
+        headers.append(("Content-Length", "0"))
+
+    return headers
+
+
+def send_head(handler, r, default_type, cache_status=None, status=None, extra=()):
+    handler.send_response(status or r.status_code)
+    for name, value in response_headers(r.status_code, r.headers, default_type):
+        handler.send_header(name, value)
+    for name, value in extra:
+        handler.send_header(name, value)
+    if r.status_code in (200, 206) and not r.headers.get("Content-Length"):
+        handler.send_header("Connection", "close")
+    if cache_status:
+        handler.send_header("X-Cache", cache_status)
+    handler.end_headers()
+
+
+def stream(handler, r, default_type="application/octet-stream"):
+    """
+    Relay an upstream streamed response to the client, keeping 206/304/416
+    semantics. Any other non-2xx status raises so the caller can answer 500.
+    Returns the TransferStats of the body copy.
+    """
+    try:
+        if r.status_code not in RELAY_STATUSES:
+            r.raise_for_status()
+            raise Exception("Unexpected upstream status")
+
+        send_head(handler, r, default_type)
+
+        if r.status_code not in (200, 206):
+            return TransferStats(0, 0.0)
+
+        stats = pump(r, handler.wfile)
+        handler.log_message(
+            "proxied %d bytes in %.3fs", stats.bytes_sent, stats.seconds
+        )
+        return stats
+    finally:
+        r.close()
+
+
+def _from_cache(handler, target, fetch, default_type):
+    state, entry = mediacache.lookup(target)
+    endpoint = metrics.current()
+
+    if state == "hit":
+        metrics.MEDIA_CACHE.inc(endpoint, "hit")
+        sent = mediacache.serve_file(handler, *entry, default_type)
+        if handler.command == "GET":
+            metrics.proxied(sent, "cache", endpoint)
+        return sent
+
+    if handler.command != "GET" or not mediacache.is_cacheable_request(handler.headers):
+        return None
+
+    if state == "filling":
+        metrics.MEDIA_CACHE.inc(endpoint, "fill")
+        sent = mediacache.follow_fill(handler, entry, default_type)
+        if sent is not None:
+            metrics.proxied(sent, "cache", endpoint)
+        return sent
+
+    metrics.MEDIA_CACHE.inc(endpoint, "miss")
+
+    fill = mediacache.begin_fill(target)
+    if fill is None:
+        return None
+
+    try:
+        r = fetch(upstream_headers({}))
+    except Exception:
+        mediacache.end_fill(fill, False)
+        raise
+
+    def send_fill_head(length):
+        status, extra = mediacache.content_range_headers(handler.headers, length)
+        send_head(handler, r, default_type, "MISS", status, extra)
+
+    try:
+        stats = mediacache.fill_and_stream(handler, fill, r, pump, send_fill_head)
+        if stats is None:
+            return stream(handler, r, default_type).bytes_sent
+        return stats.bytes_sent
+    except mediacache.FillAbandoned as e:
+        return e.sent
+    finally:
+        r.close()
+
+
+def relay(handler, target, fetch, default_type="application/octet-stream"):
+    """
+    Proxy `target` to the client. `fetch(headers)` performs the streamed
+    upstream GET. With MEDIA_CACHE_DIR set, complete objects are answered
+    from disk and plain (or `bytes=0-`) misses are written through to it.
+    """
+    start = time.perf_counter()
+
+    if mediacache.ENABLED:
+        sent = _from_cache(handler, target, fetch, default_type)
+        if sent is not None:
+            return TransferStats(sent, time.perf_counter() - start)
+
+    return stream(handler, fetch(upstream_headers(handler.headers)), default_type)
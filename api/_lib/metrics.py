@@ -0,0 +1,316 @@
+import os
+import sys
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("METRICS", "1") != "0"
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_local = threading.local()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield self.name + _labels(self.labels, labels), value
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram in seconds, one series per label
+    tuple.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, ([*s[0]], s[1], s[2])) for labels, s in self._values.items())
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="' + _number(float(bound)) + '"'
+                yield f"{self.name}_bucket" + _labels(self.labels, labels, le), cumulative
+            yield f"{self.name}_sum" + _labels(self.labels, labels), total
+            yield f"{self.name}_count" + _labels(self.labels, labels), count
+
+
+REQUESTS = Counter(
+    "reel_api_requests_total", "Requests answered, by endpoint, method and status.",
+    ("endpoint", "method", "code")
+)
+REQUEST_SECONDS = Histogram(
+    "reel_api_request_seconds", "Time from request line to the end of the response.",
+    ("endpoint",)
+)
+# phases: key_check, upstream (round trip to response headers), parse (the
+# rest of a provider call), serialize (JSON encoding) and transfer (proxied
+# media bodies)
+PHASE_SECONDS = Histogram(
+    "reel_api_phase_seconds", "Time spent per request phase.",
+    ("endpoint", "phase")
+)
+PROVIDER_CALLS = Counter(
+    "reel_api_provider_calls_total", "Provider backend calls by outcome (ok, error, rejected).",
+    ("provider", "outcome")
+)
+PROVIDER_SECONDS = Histogram(
+    "reel_api_provider_seconds", "Provider backend call latency, including parsing.",
+    ("provider",)
+)
+PROXY_BYTES = Counter(
+    "reel_api_proxy_bytes_total", "Media bytes relayed to clients, from upstream or the disk cache.",
+    ("endpoint", "source")
+)
+MEDIA_CACHE = Counter(
+    "reel_api_media_cache_total", "Disk media cache lookups by result (hit, fill, miss).",
+    ("endpoint", "result")
+)
+EXCEPTIONS = Counter(
+    "reel_api_exceptions_total", "Exceptions turned into 5xx answers, by type.",
+    ("endpoint", "exception")
+)
+ACCESS_LOG_DROPPED = Counter(
+    "reel_api_access_log_dropped_total", "Access log records dropped on a full queue or a failed write.",
+    ("reason",)
+)
+
+METRICS = (
+    REQUESTS, REQUEST_SECONDS, PHASE_SECONDS, PROVIDER_CALLS,
+    PROVIDER_SECONDS, PROXY_BYTES, MEDIA_CACHE, EXCEPTIONS,
+    ACCESS_LOG_DROPPED
+)
+
+
+class _Request:
+    """
+    Totals that worker threads running bound() functions add to on behalf
+    of the request thread.
+    """
+
+    def __init__(self):
+        self.upstream = 0.0
+        self._lock = threading.Lock()
+
+    def add_upstream(self, seconds):
+        with self._lock:
+            self.upstream += seconds
+
+
+def bind(endpoint):
+    """
+    Sets the endpoint the current thread's measurements are recorded under
+    and starts a fresh per-request context, see request_info().
+    """
+    _local.endpoint = endpoint
+    _local.provider = None
+    _local.error = None
+    _local.sent = 0
+    _local.upstream_mark = upstream_total()
+    _local.request = _Request()
+
+
+def request_info():
+    """
+    Provider, error class, body bytes and upstream seconds noted on this
+    thread since the last bind().
+    """
+    return {
+        "provider": getattr(_local, "provider", None),
+        "error": getattr(_local, "error", None),
+        "bytes": getattr(_local, "sent", 0),
+        "upstream": upstream_total() - getattr(_local, "upstream_mark", 0.0) + _borrowed()
+    }
+
+
+def _borrowed():
+    request = getattr(_local, "request", None)
+    return request.upstream if request is not None else 0.0
+
+
+def note_provider(name):
+    _local.provider = name
+
+
+def add_sent(n):
+    _local.sent = getattr(_local, "sent", 0) + n
+
+
+def proxied(n, source="upstream", endpoint=None):
+    PROXY_BYTES.inc(endpoint or current(), source, amount=n)
+    add_sent(n)
+
+
+METHODS = frozenset(("GET", "HEAD", "POST", "OPTIONS"))
+
+
+def method_label(method):
+    """
+    Request methods come from the client; anything unexpected is folded
+    into "other" so it cannot mint new series.
+    """
+    return method if method in METHODS else "other"
+
+
+def current():
+    return getattr(_local, "endpoint", None) or "unknown"
+
+
+@contextmanager
+def using(endpoint):
+    previous = getattr(_local, "endpoint", None)
+    _local.endpoint = endpoint
+    try:
+        yield
+    finally:
+        _local.endpoint = previous
+
+
+def bound(fn):
+    """
+    Wraps `fn` so it records under the calling thread's endpoint when run
+    on a worker pool, and its upstream time counts towards the calling
+    request (hedged provider calls, bulk lookups).
+    """
+    endpoint = current()
+    request = getattr(_local, "parent", None) or getattr(_local, "request", None)
+
+    def run(*args, **kwargs):
+        previous = getattr(_local, "parent", None)
+        _local.parent = request
+        try:
+            with using(endpoint):
+                return fn(*args, **kwargs)
+        finally:
+            _local.parent = previous
+    return run
+
+
+def observe_phase(name, seconds, endpoint=None):
+    PHASE_SECONDS.observe(seconds, endpoint or current(), name)
+
+
+@contextmanager
+def phase(name, endpoint=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(name, time.perf_counter() - start, endpoint)
+
+
+@contextmanager
+def upstream():
+    """
+    Times one upstream HTTP round trip. The per-thread total lets a caller
+    tell upstream time apart from its own parsing, see upstream_total().
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _local.upstream = getattr(_local, "upstream", 0.0) + elapsed
+        parent = getattr(_local, "parent", None)
+        if parent is not None:
+            parent.add_upstream(elapsed)
+        observe_phase("upstream", elapsed)
+
+
+def upstream_total():
+    return getattr(_local, "upstream", 0.0)
+
+
+def record_exception(endpoint=None):
+    """
+    Counts the exception being handled, if any. Called from the generic
+    error paths so bare excepts still leave a trace.
+    """
+    error = sys.exc_info()[1]
+    if error is not None:
+        _local.error = type(error).__name__
+        EXCEPTIONS.inc(endpoint or current(), _local.error)
+
+
+def series(name, **labels):
+    return name + _labels(labels.keys(), labels.values())
+
+
+def render_family(name, kind, help, samples):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for key, value in samples:
+        lines.append(f"{key} {_number(value)}")
+    return lines
+
+
+def render(extra=()):
+    """
+    Prometheus text exposition of every metric; `extra` holds lines from
+    collectors evaluated at scrape time.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(render_family(metric.name, metric.kind, metric.help, metric.samples()))
+    lines.extend(extra)
+    return ("\n".join(lines) + "\n").encode()
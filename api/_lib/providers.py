@@ -0,0 +1,179 @@
+import os
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from api._lib import breaker, metrics, sessions
+
+HEDGE = os.environ.get("PROVIDER_HEDGE", "0") == "1"
+HEDGE_QUANTILE = float(os.environ.get("PROVIDER_HEDGE_QUANTILE", "0.9"))
+HEDGE_MIN_DELAY = float(os.environ.get("PROVIDER_HEDGE_MIN_DELAY", "0.2"))
+HEDGE_THREADS = int(os.environ.get("PROVIDER_HEDGE_THREADS", "32"))
+MIRROR_TIMEOUT = float(os.environ.get("PROVIDER_MIRROR_TIMEOUT", "20"))
+
+# "adapter=https://..." picks an adapter by name; a bare URL uses the default
+ENTRY = re.compile(r"^(?:([\w-]+)=)?(https?://\S+)$")
+
+_executor = None
+
+
+def _hedge_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="hedge")
+    return _executor
+
+
+class Pacer:
+    """
+    Spaces calls at least 1/rate seconds apart across threads. Each caller
+    reserves the next free slot and sleeps until it comes up.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Backend:
+
+    def __init__(self, url, adapter, circuit, pacer=None):
+        self.url = url
+        self.adapter = adapter
+        self.breaker = circuit
+        self.pacer = pacer
+
+    def call(self, *args):
+        # paced outside the breaker so waiting does not count as latency
+        if self.pacer is not None:
+            self.pacer.wait()
+
+        metrics.note_provider(self.breaker.name)
+        outcome = "error"
+        before = metrics.upstream_total()
+        start = time.perf_counter()
+        try:
+            result = self.breaker.call(self.adapter, self.url, *args)
+            outcome = "ok"
+            return result
+        except breaker.CircuitOpen:
+            outcome = "rejected"
+            raise
+        finally:
+            if outcome != "rejected":
+                elapsed = time.perf_counter() - start
+                # whatever the adapter did besides its HTTP calls is parsing
+                metrics.observe_phase("parse", max(0.0, elapsed - (metrics.upstream_total() - before)))
+                metrics.PROVIDER_SECONDS.observe(elapsed, self.breaker.name)
+            metrics.PROVIDER_CALLS.inc(self.breaker.name, outcome)
+
+    def hedge_delay(self):
+        p = self.breaker.latency(HEDGE_QUANTILE)
+        if p is None:
+            return None
+        return max(p, HEDGE_MIN_DELAY)
+
+
+class Pool:
+    """
+    Ordered provider backends for one platform, configured as a comma
+    separated list in `env`. Calls go to the first backend and fail over to
+    the next one on errors or an open breaker. With PROVIDER_HEDGE=1 a
+    second backend is also asked once the first has been slower than its
+    recent p90, and whichever answers first wins. `<env>_RPS` paces the
+    upstream calls made to each backend.
+
+    An adapter is `fn(provider_url, *args)` returning the parsed result;
+    None ("not found") is an answer and does not fail over.
+    """
+
+    def __init__(self, env, adapters, default=None):
+        self.env = env
+        self.backends = []
+
+        entries = [e.strip() for e in (os.environ.get(env) or "").split(",") if e.strip()]
+        rate = float(os.environ.get(f"{env}_RPS") or 0)
+        for i, entry in enumerate(entries, start=1):
+            m = ENTRY.match(entry)
+            if not m:
+                raise ValueError(f"{env}: invalid provider entry {entry!r}")
+            name = m.group(1) or default or next(iter(adapters))
+            if name not in adapters:
+                raise ValueError(f"{env}: unknown adapter {name!r}")
+            # a single provider keeps the plain env name as its breaker key
+            key = env if len(entries) == 1 else f"{env}#{i}"
+            pacer = Pacer(rate) if rate > 0 else None
+            self.backends.append(Backend(m.group(2), adapters[name], breaker.get(key), pacer))
+
+    def __bool__(self):
+        return bool(self.backends)
+
+    def __len__(self):
+        return len(self.backends)
+
+    def _hedged(self, first, second, delay, args):
+        executor = _hedge_executor()
+        futures = [executor.submit(metrics.bound(first.call), *args)]
+        done, _ = wait(futures, timeout=delay)
+        if not done or futures[0].exception() is not None:
+            futures.append(executor.submit(metrics.bound(second.call), *args))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                try:
+                    return f.result()
+                except Exception as e:
+                    error = e
+        raise error
+
+    def call(self, *args):
+        errors = []
+        i = 0
+        while i < len(self.backends):
+            backend = self.backends[i]
+            delay = None
+            if HEDGE and i + 1 < len(self.backends) and backend.breaker.state == breaker.CLOSED:
+                delay = backend.hedge_delay()
+            hedge = delay is not None
+            try:
+                if hedge:
+                    return self._hedged(backend, self.backends[i + 1], delay, args)
+                return backend.call(*args)
+            except Exception as e:
+                errors.append(e)
+            i += 2 if hedge else 1
+
+        if not errors:
+            raise breaker.CircuitOpen(f"{self.env} is not configured")
+        # report a real upstream error over "breaker open" when there is one
+        for e in reversed(errors):
+            if not isinstance(e, breaker.CircuitOpen):
+                raise e
+        raise errors[-1]
+
+
+def fetch_mirror(provider, value, param="url"):
+    """
+    "mirror" adapter: ask another deployment of this API, configured as its
+    endpoint URL including ?key=. Returns the success payload or None.
+    """
+    r = sessions.get(provider, params={param: value}, timeout=MIRROR_TIMEOUT)
+    if r.status_code >= 500:
+        raise breaker.ProviderError(f"mirror answered {r.status_code}", r.status_code)
+    data = r.json()
+    if data.get("status") != "success":
+        return None
+    return data
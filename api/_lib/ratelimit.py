@@ -0,0 +1,218 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+from api._lib import keystore
+
+RATELIMIT_BACKEND = os.environ.get("RATELIMIT_BACKEND", "memory").lower()
+RATELIMIT_PATH = os.environ.get("RATELIMIT_PATH", "/tmp/reel-api-ratelimit.sqlite3")
+RATELIMIT_MAX_ENTRIES = int(os.environ.get("RATELIMIT_MAX_ENTRIES", "100000"))
+
+DEFAULT_LIMIT = os.environ.get("RATELIMIT_DEFAULT", "600/60")
+MASTER_LIMIT = os.environ.get("RATELIMIT_MASTER", "")
+
+# scope names usable in key files; RATELIMIT_TIERS="free=30/60,pro=600/60"
+# adds or overrides tiers. "limit" is the historical WORMgpt per-IP scope.
+BUILTIN_TIERS = "limit=50/180@ip"
+
+PRUNE_EVERY = 1000
+
+Limit = namedtuple("Limit", ["requests", "period", "per_ip"])
+
+
+def parse_limit(spec):
+    """
+    "N/SECONDS" or "N/SECONDS@ip" -> Limit; None for an empty spec, which
+    means unlimited.
+    """
+    spec = (spec or "").strip()
+    if not spec:
+        return None
+    spec, _, per = spec.partition("@")
+    requests, _, period = spec.partition("/")
+    return Limit(int(requests), float(period or 1), per == "ip")
+
+
+def parse_tiers(text):
+    tiers = {}
+    for item in text.split(","):
+        name, _, spec = item.strip().partition("=")
+        if name and spec:
+            tiers[name] = parse_limit(spec)
+    return tiers
+
+
+TIERS = parse_tiers(BUILTIN_TIERS)
+TIERS.update(parse_tiers(os.environ.get("RATELIMIT_TIERS", "")))
+
+
+def _refill(tokens, updated, now, limit):
+    rate = limit.requests / limit.period
+    return min(float(limit.requests), tokens + (now - updated) * rate)
+
+
+def _decide(tokens, limit, cost):
+    """
+    Returns (remaining tokens, retry_after); retry_after is 0 when allowed.
+    """
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    if cost > limit.requests:
+        return tokens, limit.period
+    return tokens, (cost - tokens) * limit.period / limit.requests
+
+
+class MemoryBackend:
+    """
+    Token buckets in process memory. Buckets are kept in update order, so
+    the ones at the front that have refilled completely (idle) are dropped
+    as new requests come in.
+    """
+
+    def __init__(self, max_entries=RATELIMIT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, bucket, limit, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            state = self._buckets.get(bucket)
+            if state is None:
+                tokens = float(limit.requests)
+            else:
+                tokens = _refill(state[0], state[1], now, limit)
+
+            tokens, retry_after = _decide(tokens, limit, cost)
+            self._buckets[bucket] = (tokens, now, now + limit.period)
+            self._buckets.move_to_end(bucket)
+
+            while self._buckets:
+                _, (_, _, idle_at) = next(iter(self._buckets.items()))
+                if idle_at > now and len(self._buckets) <= self.max_entries:
+                    break
+                self._buckets.popitem(last=False)
+
+            return retry_after
+
+
+class SQLiteBackend:
+    """
+    Token buckets in a SQLite file so every worker on the box shares them.
+    """
+
+    def __init__(self, path=RATELIMIT_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        with self._conn() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "bucket TEXT PRIMARY KEY, tokens REAL, updated REAL, idle_at REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS buckets_idle ON buckets (idle_at)")
+
+    def _conn(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def take(self, bucket, limit, cost=1):
+        db = self._conn()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT tokens, updated FROM buckets WHERE bucket = ?", (bucket,)
+            ).fetchone()
+            if row is None:
+                tokens = float(limit.requests)
+            else:
+                tokens = _refill(row[0], row[1], now, limit)
+
+            tokens, retry_after = _decide(tokens, limit, cost)
+            db.execute(
+                "INSERT OR REPLACE INTO buckets (bucket, tokens, updated, idle_at) "
+                "VALUES (?, ?, ?, ?)",
+                (bucket, tokens, now, now + limit.period)
+            )
+
+            self._calls += 1
+            if self._calls % PRUNE_EVERY == 0:
+                db.execute("DELETE FROM buckets WHERE idle_at <= ?", (now,))
+
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def get_backend():
+    global _BACKEND
+    if RATELIMIT_BACKEND in ("off", "none", ""):
+        return None
+    if _BACKEND is None:
+        with _BACKEND_LOCK:
+            if _BACKEND is None:
+                if RATELIMIT_BACKEND == "sqlite":
+                    _BACKEND = SQLiteBackend()
+                else:
+                    _BACKEND = MemoryBackend()
+    return _BACKEND
+
+
+def limit_for(keys_file, api_key):
+    """
+    The key's tier comes from the scope field of its key file line:
+    a tier name from TIERS or an inline "N/SECONDS[@ip]". Keys without a
+    scope get RATELIMIT_DEFAULT, master keys RATELIMIT_MASTER.
+    """
+    entry = keystore.lookup(keys_file, api_key)
+    if entry is None:
+        if keystore.is_master_key(api_key):
+            return parse_limit(MASTER_LIMIT)
+        return parse_limit(DEFAULT_LIMIT)
+
+    if not entry.scope:
+        return parse_limit(DEFAULT_LIMIT)
+    if entry.scope in TIERS:
+        return TIERS[entry.scope]
+    try:
+        return parse_limit(entry.scope)
+    except ValueError:
+        return parse_limit(DEFAULT_LIMIT)
+
+
+def check(keys_file, api_key, ip, cost=1):
+    """
+    Take `cost` requests from the key's bucket. Returns 0 when allowed,
+    otherwise the number of seconds until it would be.
+    """
+    backend = get_backend()
+    if backend is None or not api_key:
+        return 0.0
+
+    limit = limit_for(keys_file, api_key)
+    if limit is None:
+        return 0.0
+
+    bucket = f"{keys_file}:{api_key}"
+    if limit.per_ip:
+        bucket += f":{ip}"
+
+    try:
+        return backend.take(bucket, limit, cost)
+    except Exception:
+        # a broken limiter store must not take the API down with it
+        return 0.0
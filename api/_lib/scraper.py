@@ -0,0 +1,116 @@
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+
+import cloudscraper
+
+from api._lib import metrics
+
+POOL_SIZE = int(os.environ.get("SCRAPER_POOL_SIZE", "2"))
+SCRAPER_TTL = float(os.environ.get("SCRAPER_TTL", "1800"))
+MAX_FAILURES = int(os.environ.get("SCRAPER_MAX_FAILURES", "3"))
+
+
+def is_challenge(r):
+    """
+    Header-only check so it is safe on streamed responses.
+    """
+    if r.headers.get("cf-mitigated") == "challenge":
+        return True
+    if r.status_code in (403, 503):
+        server = r.headers.get("Server", "").lower()
+        ctype = r.headers.get("Content-Type", "").lower()
+        return "cloudflare" in server and "text/html" in ctype
+    return False
+
+
+class ScraperPool:
+    """
+    Long-lived cloudscraper sessions. A scraper keeps its solved challenge
+    cookies until it ages out, its cf_clearance cookie expires, it keeps
+    failing, or upstream serves a challenge page again.
+    """
+
+    def __init__(self, size=POOL_SIZE, ttl=SCRAPER_TTL, **create_kwargs):
+        self.ttl = ttl
+        self.create_kwargs = create_kwargs
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _create(self):
+        s = cloudscraper.create_scraper(**self.create_kwargs)
+        s.created_at = time.monotonic()
+        s.failures = 0
+        s.discarded = False
+        return s
+
+    def _healthy(self, s):
+        if s.discarded or s.failures >= MAX_FAILURES:
+            return False
+        if time.monotonic() - s.created_at > self.ttl:
+            return False
+        now = time.time()
+        for c in s.cookies:
+            if c.name == "cf_clearance" and c.expires and c.expires <= now:
+                return False
+        return True
+
+    def _acquire(self):
+        while True:
+            try:
+                s = self._idle.get_nowait()
+            except queue.Empty:
+                return self._create()
+            if self._healthy(s):
+                return s
+            s.close()
+
+    def _release(self, s):
+        if not self._healthy(s):
+            s.close()
+            return
+        try:
+            self._idle.put_nowait(s)
+        except queue.Full:
+            s.close()
+
+    @contextmanager
+    def scraper(self):
+        s = self._acquire()
+        try:
+            yield s
+        finally:
+            self._release(s)
+
+    def request(self, method, url, **kwargs):
+        for attempt in range(2):
+            with self.scraper() as s:
+                try:
+                    with metrics.upstream():
+                        r = s.request(method, url, **kwargs)
+                except Exception:
+                    s.failures += 1
+                    raise
+
+                if is_challenge(r) and attempt == 0:
+                    s.discarded = True
+                    r.close()
+                    continue
+
+                s.failures = 0
+                return r
+
+
+_POOLS = {}
+_LOCK = threading.Lock()
+
+
+def get_pool(name, **create_kwargs):
+    pool = _POOLS.get(name)
+    if pool is None:
+        with _LOCK:
+            pool = _POOLS.get(name)
+            if pool is None:
+                pool = _POOLS[name] = ScraperPool(**create_kwargs)
+    return pool
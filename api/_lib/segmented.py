@@ -0,0 +1,175 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api._lib import mediacache, mediaproxy, metrics
+
+SEGMENT_SIZE = int(os.environ.get("PROXY_SEGMENT_SIZE", str(8 * 1024 * 1024)))
+SEGMENT_THREADS = int(os.environ.get("PROXY_SEGMENT_THREADS", "32"))
+SEGMENT_RETRIES = int(os.environ.get("PROXY_SEGMENT_RETRIES", "1"))
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+SIMPLE_RANGE = re.compile(r"bytes=(\d+)-(\d*)$")
+
+_executor = ThreadPoolExecutor(max_workers=SEGMENT_THREADS, thread_name_prefix="segment")
+
+
+class SegmentError(Exception):
+    pass
+
+
+def _client_range(client_headers):
+    """
+    (start, end) for a plain or single open/closed Range request, where
+    `end` may be None. None when the request has to be relayed as-is.
+    """
+    if client_headers.get("If-Range") or client_headers.get("If-None-Match") \
+            or client_headers.get("If-Modified-Since"):
+        return None
+    value = client_headers.get("Range")
+    if not value:
+        return 0, None
+    m = SIMPLE_RANGE.match(value.strip())
+    if not m:
+        return None
+    start = int(m.group(1))
+    end = int(m.group(2)) if m.group(2) else None
+    if end is not None and end < start:
+        return None
+    return start, end
+
+
+def _range_headers(start, end, validator=None):
+    headers = {"Accept-Encoding": "identity", "Range": f"bytes={start}-{end}"}
+    if validator:
+        headers["If-Range"] = validator
+    return headers
+
+
+def _fetch_segment(fetch, start, end, validator):
+    """
+    Download one byte range fully into memory. `If-Range` makes upstream
+    answer 200 instead of 206 if the object changed under us.
+    """
+    for attempt in range(SEGMENT_RETRIES + 1):
+        r = None
+        try:
+            r = fetch(_range_headers(start, end, validator))
+            m = CONTENT_RANGE.match(r.headers.get("Content-Range", ""))
+            if r.status_code != 206 or not m or int(m.group(1)) != start:
+                raise SegmentError(f"upstream refused range {start}-{end}")
+            body = r.content
+            if len(body) != end - start + 1:
+                raise SegmentError(f"short segment {start}-{end}")
+            return body
+        except SegmentError:
+            raise
+        except Exception:
+            if attempt == SEGMENT_RETRIES:
+                raise
+        finally:
+            if r is not None:
+                r.close()
+
+
+def _send_head(handler, r, status, start, end, total, default_type):
+    upstream = {
+        "Content-Type": r.headers.get("Content-Type"),
+        "Content-Length": str(end - start + 1),
+        "Accept-Ranges": "bytes",
+        "ETag": r.headers.get("ETag"),
+        "Last-Modified": r.headers.get("Last-Modified")
+    }
+    if status == 206:
+        upstream["Content-Range"] = f"bytes {start}-{end}/{total}"
+    if not upstream["Content-Type"]:
+        del upstream["Content-Type"]
+
+    handler.send_response(status)
+    for name, value in mediaproxy.response_headers(status, upstream, default_type):
+        handler.send_header(name, value)
+    handler.end_headers()
+
+
+def stream(handler, fetch, segments, default_type="application/octet-stream"):
+    """
+    Relay a large object over `segments` parallel range requests. The first
+    request doubles as a probe: if upstream answers it with anything but a
+    206 carrying the full size, that response is relayed as a normal single
+    stream. Segments are written to the client in order, with at most
+    `segments` of them held in memory at once.
+    """
+    wanted = _client_range(handler.headers)
+    if wanted is None or segments <= 1:
+        return mediaproxy.stream(handler, fetch(mediaproxy.upstream_headers(handler.headers)), default_type)
+
+    start, end = wanted
+    first_end = start + SEGMENT_SIZE - 1
+    if end is not None:
+        first_end = min(first_end, end)
+
+    r = fetch(_range_headers(start, first_end))
+    m = CONTENT_RANGE.match(r.headers.get("Content-Range", ""))
+    if r.status_code != 206 or not m or int(m.group(1)) != start:
+        return mediaproxy.stream(handler, r, default_type)
+
+    begin = time.perf_counter()
+    pending = {}
+    try:
+        total = int(m.group(3))
+        end = total - 1 if end is None else min(end, total - 1)
+        first_end = int(m.group(2))
+        validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+
+        bounds = []
+        offset = first_end + 1
+        while offset <= end:
+            bounds.append((offset, min(offset + SEGMENT_SIZE - 1, end)))
+            offset += SEGMENT_SIZE
+
+        status = 206 if handler.headers.get("Range") else 200
+        _send_head(handler, r, status, start, end, total, default_type)
+
+        if handler.command == "HEAD":
+            return mediaproxy.TransferStats(0, 0.0)
+
+        # later segments download while the probe body is being relayed
+        submitted = 0
+        while submitted < min(segments - 1, len(bounds)):
+            pending[submitted] = _executor.submit(metrics.bound(_fetch_segment), fetch, *bounds[submitted], validator)
+            submitted += 1
+
+        sent = mediaproxy.pump(r, handler.wfile).bytes_sent
+        if sent != first_end - start + 1:
+            raise SegmentError("short first segment")
+
+        for i in range(len(bounds)):
+            if submitted < len(bounds):
+                pending[submitted] = _executor.submit(metrics.bound(_fetch_segment), fetch, *bounds[submitted], validator)
+                submitted += 1
+            body = pending.pop(i).result()
+            handler.wfile.write(body)
+            sent += len(body)
+            metrics.proxied(len(body))
+
+        stats = mediaproxy.TransferStats(sent, time.perf_counter() - begin)
+        handler.log_message(
+            "proxied %d bytes in %.3fs over %d segments",
+            stats.bytes_sent, stats.seconds, len(bounds) + 1
+        )
+        return stats
+    finally:
+        for future in pending.values():
+            future.cancel()
+        r.close()
+
+
+def relay(handler, target, fetch, segments, default_type="application/octet-stream"):
+    """
+    mediaproxy.relay() with segmented upstream downloads. The disk media
+    cache keeps its single-stream fills, so it takes precedence when set.
+    """
+    if mediacache.ENABLED or segments <= 1:
+        return mediaproxy.relay(handler, target, fetch, default_type)
+    return stream(handler, fetch, segments, default_type)
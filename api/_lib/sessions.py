@@ -0,0 +1,78 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from api._lib import metrics
+
+POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "10"))
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "32"))
+RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+RETRY_BACKOFF = float(os.environ.get("HTTP_RETRY_BACKOFF", "0.3"))
+
+RETRY_STATUSES = (502, 503, 504)
+
+# one session per purpose, never per host: each session's adapter keeps at
+# most POOL_CONNECTIONS host pools (least recently used are closed), so the
+# per-request CDN hosts media is proxied from cannot grow it without bound
+PURPOSES = ("api", "media")
+
+_SESSIONS = {}
+_LOCK = threading.Lock()
+
+
+def _build_session():
+    """
+    Keep-alive session with a bounded connection pool. Connect errors are
+    retried for every method, read/status retries only for idempotent ones.
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=retry
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(purpose="api"):
+    """
+    "api" for provider calls, "media" for proxied media, so CDN hosts do
+    not push provider connections out of the pool.
+    """
+    if purpose not in PURPOSES:
+        raise ValueError(f"unknown session purpose {purpose!r}")
+    session = _SESSIONS.get(purpose)
+    if session is None:
+        with _LOCK:
+            session = _SESSIONS.get(purpose)
+            if session is None:
+                session = _SESSIONS[purpose] = _build_session()
+    return session
+
+
+def get(url, purpose="api", **kwargs):
+    with metrics.upstream():
+        return get_session(purpose).get(url, **kwargs)
+
+
+def post(url, purpose="api", **kwargs):
+    with metrics.upstream():
+        return get_session(purpose).post(url, **kwargs)
+
+
+def close_all():
+    with _LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
@@ -0,0 +1,75 @@
+import os
+import time
+import threading
+
+NEGATIVE_TTL = float(os.environ.get("SINGLEFLIGHT_NEGATIVE_TTL", "5"))
+MAX_FAILURES = 1024
+
+
+class _Call:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group:
+    """
+    Coalesces concurrent calls for the same key into one execution.
+    Callers that arrive while a call is in flight wait for it and share its
+    result or exception. A failure is replayed to new callers for
+    `negative_ttl` seconds so a burst does not hammer a failing upstream.
+    """
+
+    def __init__(self, negative_ttl=NEGATIVE_TTL):
+        self.negative_ttl = negative_ttl
+        self._calls = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def _remember_failure(self, key, error):
+        now = time.monotonic()
+        if len(self._failures) >= MAX_FAILURES:
+            for k in [k for k, (exp, _) in self._failures.items() if exp <= now]:
+                del self._failures[k]
+        self._failures[key] = (now + self.negative_ttl, error)
+
+    def do(self, key, fn):
+        """
+        Returns (result, shared) where `shared` is True when the result came
+        from another caller's execution.
+        """
+        with self._lock:
+            failed = self._failures.get(key)
+            if failed is not None:
+                expires, error = failed
+                if expires > time.monotonic():
+                    raise error
+                del self._failures[key]
+
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                if self.negative_ttl > 0:
+                    self._remember_failure(key, e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+        return call.result, False
@@ -0,0 +1,196 @@
+import os
+import hmac
+import time
+import zlib
+import base64
+import sqlite3
+import hashlib
+import threading
+
+# Must be set to the same value on every instance, otherwise links minted
+# by one worker are rejected by another.
+SECRET = os.environ.get("PROXY_TOKEN_SECRET", "").encode()
+
+if not SECRET:
+    raise RuntimeError(
+        "PROXY_TOKEN_SECRET is not set; ?link= URLs would only work on the "
+        "process that minted them. Set it to the same random value (e.g. "
+        "`openssl rand -hex 32`) on every worker and instance."
+    )
+
+TOKEN_TTL = int(os.environ.get("PROXY_TOKEN_TTL", str(6 * 3600)))
+TOKEN_MODE = os.environ.get("PROXY_TOKEN_MODE", "signed").lower()
+# SQLite file holding the id -> URL mappings of PROXY_TOKEN_MODE=id; every
+# worker and instance that answers ?link= must reach the same file
+TOKEN_STORE = os.environ.get("PROXY_TOKEN_STORE", "")
+
+if TOKEN_MODE == "id" and not TOKEN_STORE:
+    raise RuntimeError(
+        "PROXY_TOKEN_MODE=id needs PROXY_TOKEN_STORE, a SQLite file shared "
+        "by every worker, otherwise links fail on all but the minting one"
+    )
+
+SIG_BYTES = 12
+ID_BYTES = 12
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(data):
+    return hmac.new(SECRET, data, hashlib.sha256).digest()[:SIG_BYTES]
+
+
+def _expiry():
+    # Expiry is bucketed so one URL maps to the same token for a whole
+    # TOKEN_TTL window, which keeps edge cache keys stable.
+    return (int(time.time()) // TOKEN_TTL + 2) * TOKEN_TTL
+
+
+def _encode_signed(url):
+    body = f"{_expiry():x}\n{url}".encode()
+    packed = zlib.compress(body, 9)
+    if len(packed) < len(body):
+        flag, body = "z", packed
+    else:
+        flag = "r"
+    payload = flag + _b64(body)
+    return f"{payload}.{_b64(_sign(payload.encode()))}"
+
+
+def _decode_signed(token):
+    payload, _, sig = token.partition(".")
+    if not payload or not sig:
+        raise InvalidToken("malformed token")
+    try:
+        expected = _unb64(sig)
+        body = _unb64(payload[1:])
+    except Exception:
+        raise InvalidToken("malformed token")
+    if not hmac.compare_digest(expected, _sign(payload.encode())):
+        raise InvalidToken("bad signature")
+
+    if payload[0] == "z":
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            raise InvalidToken("malformed token")
+    elif payload[0] != "r":
+        raise InvalidToken("malformed token")
+
+    try:
+        expires, _, url = body.decode().partition("\n")
+        expires = int(expires, 16)
+    except ValueError:
+        raise InvalidToken("malformed token")
+    if expires < time.time():
+        raise InvalidToken("expired token")
+    return url
+
+
+class LinkStore:
+    """
+    id -> URL mappings for PROXY_TOKEN_MODE=id. Unlike the result cache
+    there is no LRU bound that could drop a live link; rows stay until they
+    expire and expired ones are swept every PRUNE_EVERY writes.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS links ("
+            "id TEXT PRIMARY KEY, url TEXT, expires REAL)"
+        )
+
+    def _conn(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def set(self, token_id, url, ttl):
+        db = self._conn()
+        now = time.time()
+        db.execute(
+            "INSERT OR REPLACE INTO links (id, url, expires) VALUES (?, ?, ?)",
+            (token_id, url, now + ttl)
+        )
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        if prune:
+            db.execute("DELETE FROM links WHERE expires <= ?", (now,))
+
+    def get(self, token_id):
+        row = self._conn().execute(
+            "SELECT url, expires FROM links WHERE id = ?", (token_id,)
+        ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0]
+
+
+_ID_STORE = None
+_ID_STORE_LOCK = threading.Lock()
+
+
+def _id_store():
+    global _ID_STORE
+    if _ID_STORE is None:
+        with _ID_STORE_LOCK:
+            if _ID_STORE is None:
+                _ID_STORE = LinkStore(TOKEN_STORE)
+    return _ID_STORE
+
+
+def _encode_id(url):
+    token_id = "i" + _b64(hmac.new(SECRET, url.encode(), hashlib.sha256).digest()[:ID_BYTES])
+    _id_store().set(token_id, url, 2 * TOKEN_TTL)
+    return token_id
+
+
+def _decode_id(token):
+    url = _id_store().get(token)
+    if url is None:
+        raise InvalidToken("unknown token")
+    return url
+
+
+def encode(url):
+    """
+    Opaque ?link= token for an upstream media URL: an HMAC-signed,
+    optionally zlib-compressed payload, or with PROXY_TOKEN_MODE=id a short
+    key into the PROXY_TOKEN_STORE link store.
+    """
+    if TOKEN_MODE == "id":
+        return _encode_id(url)
+    return _encode_signed(url)
+
+
+def decode(token):
+    if not token:
+        raise InvalidToken("missing token")
+    if token[0] == "i":
+        url = _decode_id(token)
+    else:
+        url = _decode_signed(token)
+    if not url.startswith(("http://", "https://")):
+        raise InvalidToken("invalid media URL")
+    return url
@@ -0,0 +1,58 @@
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+TRACKING_PARAMS = {
+    "igsh", "igshid", "img_index",
+    "si", "s", "t", "ref", "ref_src", "ref_url",
+    "_r", "_t", "is_from_webapp", "sender_device", "share_app_id",
+    "fbclid", "gclid", "mibextid", "invite_code"
+}
+
+SHORTCODE_PATTERNS = (
+    ("instagram", re.compile(r"instagram\.com/(?:[^/?#]+/)?(?:p|reel|reels|tv)/([A-Za-z0-9_-]+)", re.I)),
+    ("tiktok", re.compile(r"tiktok\.com/.*?/(?:video|photo)/(\d+)", re.I)),
+    ("twitter", re.compile(r"(?:twitter|x)\.com/(?:[^/?#]+/)?status(?:es)?/(\d+)", re.I)),
+    ("pinterest", re.compile(r"pinterest\.[a-z.]+/pin/(?:[^/?#]*--)?(\d+)", re.I)),
+    # /s/<1 + surl>: share paths carry the surl with a leading "1"
+    ("terabox", re.compile(r"(?:tera|1024)[a-z0-9.]*\.[a-z]+/(?:s/1?([A-Za-z0-9_-]+)|(?:sharing/link|wap/share/filelist)\?(?:[^#]*&)?surl=([A-Za-z0-9_-]+))", re.I)),
+)
+
+
+def canonical_username(username):
+    return username.strip().lstrip("@").strip("/").lower()
+
+
+def canonical_url(url):
+    """
+    Stable identity for a share link: the platform shortcode when one can be
+    extracted, otherwise the URL with tracking params, fragments and
+    host/scheme noise removed.
+    """
+    url = url.strip()
+
+    for platform, pattern in SHORTCODE_PATTERNS:
+        m = pattern.search(url)
+        if m:
+            return f"{platform}:{next(g for g in m.groups() if g)}"
+
+    if "://" not in url:
+        url = "https://" + url
+
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m.", "mobile."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+
+    params = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith("utm_")
+    )
+
+    return urlunsplit((
+        "https",
+        host,
+        parts.path.rstrip("/") or "/",
+        urlencode(params),
+        ""
+    ))
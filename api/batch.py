@@ -0,0 +1,164 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse, parse_qs
+from api._lib import endpoints, metrics, ratelimit
+from api._lib.base import BaseHandler
+
+MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "100"))
+CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+MAX_BODY = 256 * 1024
+
+# item type -> endpoint; endpoint names are accepted as types as well
+TYPES = {
+    "reel": "ig-reel",
+    "post": "ig-post",
+    "story": "ig-story",
+    "profile": "ig-info",
+    "tiktok": "tiktok-downloader",
+    "twitter": "twitter-download",
+    "pin": "pin-download",
+    "terabox": "tera-downloader"
+}
+
+
+def endpoint_for(item_type):
+    if item_type in TYPES:
+        return TYPES[item_type]
+    if item_type in TYPES.values():
+        return item_type
+    return None
+
+
+def resolve_item(stem, value, host):
+    """
+    One item through its endpoint's resolve(), failures answered the way
+    that endpoint's own handler answers them.
+    """
+    module = endpoints.load(stem)
+    with metrics.using(stem):
+        try:
+            code, payload, hit = module.resolve(value, host)
+        except Exception as e:
+            metrics.record_exception()
+            code, message = module.error_response(e)
+            return code, message, False
+    return code, payload, hit
+
+
+def parse_body(raw):
+    """
+    Accepts either a JSON list of items or {"key": ..., "items": [...]}.
+    """
+    data = json.loads(raw or b"null")
+    if isinstance(data, list):
+        return None, data
+    if isinstance(data, dict) and isinstance(data.get("items"), list):
+        return data.get("key"), data["items"]
+    raise ValueError("invalid batch body")
+
+
+class handler(BaseHandler):
+
+    def do_POST(self):
+        query = parse_qs(urlparse(self.path).query)
+
+        if self.length_required():
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY:
+                # the body is not read, so the connection cannot be reused
+                self.close_connection = True
+                return self.send_json(413, "Batch body too large")
+            body_key, items = parse_body(self.rfile.read(length))
+        except:
+            return self.send_json(400, "Body must be a JSON list of {type, url} items")
+
+        api_key = query.get("key", [body_key])[0]
+
+        if not api_key:
+            return self.send_json(401, "Invalid or expired API key")
+
+        if not items:
+            return self.send_json(400, "No items")
+
+        if len(items) > MAX_ITEMS:
+            return self.send_json(400, f"At most {MAX_ITEMS} items per batch")
+
+        jobs = []
+        errors = []
+        allowed = {}
+
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append((index, None, None, 400, "Item must be an object"))
+                continue
+
+            item_type = item.get("type")
+            value = item.get("url") or item.get("username")
+            stem = endpoint_for(item_type)
+
+            if stem is None:
+                errors.append((index, item_type, value, 400, "Unknown type"))
+                continue
+            if not value:
+                errors.append((index, item_type, value, 400, "Missing 'url' parameter"))
+                continue
+
+            # the key is checked once per endpoint, not once per item
+            if stem not in allowed:
+                allowed[stem] = bool(endpoints.load(stem).is_key_valid(api_key))
+            if not allowed[stem]:
+                errors.append((index, item_type, value, 401, "Invalid or expired API key"))
+                continue
+
+            jobs.append((index, item_type, value, stem))
+
+        if allowed and not any(allowed.values()):
+            return self.send_json(401, "Invalid or expired API key")
+
+        # every item counts against the key's limit for its endpoint
+        costs = {}
+        for _, _, _, stem in jobs:
+            costs[stem] = costs.get(stem, 0) + 1
+        limited = {
+            stem for stem, cost in costs.items()
+            if ratelimit.check(endpoints.load(stem).KEYS_FILE, api_key, self.client_ip(), cost)
+        }
+        for index, item_type, value, stem in jobs:
+            if stem in limited:
+                errors.append((index, item_type, value, 429, "Rate limit exceeded"))
+        jobs = [job for job in jobs if job[3] not in limited]
+
+        host = self.headers.get("host")
+        self.start_stream(200)
+
+        for index, item_type, value, code, message in errors:
+            self.send_result(index, item_type, value, code, message, False)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(CONCURRENCY, len(jobs))))
+        try:
+            futures = {
+                executor.submit(resolve_item, stem, value, host): (index, item_type, value)
+                for index, item_type, value, stem in jobs
+            }
+            for future in as_completed(futures):
+                index, item_type, value = futures[future]
+                code, payload, hit = future.result()
+                self.send_result(index, item_type, value, code, payload, hit)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def send_result(self, index, item_type, value, code, payload, hit):
+        if isinstance(payload, str):
+            payload = {"status": "error", "message": payload}
+        self.send_line({
+            "index": index,
+            "type": item_type,
+            "url": value,
+            "code": code,
+            "cache": "HIT" if hit else "MISS",
+            "result": payload
+        })
@@ -1,169 +1,304 @@
 import os
 import json
-import requests
-from http.server import BaseHTTPRequestHandler
+import threading
+import email.policy
+from email.parser import BytesParser
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from urllib.parse import urlparse, parse_qs
-from datetime import datetime
+from api._lib import accountage, breaker, cache, keystore, metrics, providers, ratelimit, sessions, urls
+from api._lib.base import BaseHandler
 
-INSTAGRAM_API_URL = os.environ.get("INSTAGRAM_API_URL")
-KEYS_FILE = os.path.join(os.path.dirname(__file__), "..", "iginfokey.txt")
+KEYS_FILE = "iginfokey.txt"
+
+PROFILE_CACHE = cache.get_cache("ig-info", 3600)
+
+BULK_CONCURRENCY = int(os.environ.get("IG_INFO_BULK_CONCURRENCY", "8"))
+BULK_MAX_USERNAMES = int(os.environ.get("IG_INFO_BULK_MAX", "50000"))
+BULK_MAX_BODY = 4 * 1024 * 1024
+
+PROVIDER_HEADERS = {
+    "authority": "tools.xrespond.com",
+    "accept": "*/*",
+    "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
+    "origin": "https://bitchipdigital.com",
+    "referer": "https://bitchipdigital.com/",
+    "sec-ch-ua": '"Chromium";v="137", "Not/A)Brand";v="24"',
+    "sec-ch-ua-mobile": "?1",
+    "sec-ch-ua-platform": '"Android"',
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "cross-site",
+    "user-agent": "Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Mobile Safari/537.36"
+}
 
 def is_key_valid(api_key):
-    try:
-        with open(KEYS_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or ":" not in line:
-                    continue
-                key, expiry = line.split(":", 1)
-                if key == api_key:
-                    return datetime.utcnow() <= datetime.strptime(expiry, "%d/%m/%Y")
-    except:
-        pass
-    return False
+    return keystore.is_key_valid(KEYS_FILE, api_key)
 
-def detect_year(insta_id):
+def fetch_profile(provider, username):
+    r = sessions.post(provider, headers=PROVIDER_HEADERS, data={"profile": username}, timeout=20)
+    r.raise_for_status()
     try:
-        uid = int(insta_id)
-        if 1 < uid < 1279000: return 2010
-        elif 1279001 <= uid < 17750000: return 2011
-        elif 17750001 <= uid < 279760000: return 2012
-        elif 279760001 <= uid < 900990000: return 2013
-        elif 900990001 <= uid < 1629010000: return 2014
-        elif 1629010001 <= uid < 2369359762: return 2015
-        elif 2369359762 <= uid < 4239516755: return 2016
-        elif 4239516755 <= uid < 6345108210: return 2017
-        elif 6345108210 <= uid < 10016232396: return 2018
-        elif 10016232396 <= uid < 27238602160: return 2019
-        elif 27238602160 <= uid < 43464475396: return 2020
-        elif 43464475396 <= uid < 50289297648: return 2021
-        elif 50289297648 <= uid < 57464707083: return 2022
-        elif 57464707083 <= uid < 63313426939: return 2023
-        else: return "2024 or 2025"
+        res_json = r.json()
     except:
+        raise Exception()
+
+    return res_json.get("data", {}).get("data", {}) or None
+
+def fetch_profile_mirror(provider, username):
+    """
+    "mirror" adapter. ig-info answers without a "status" field, so this
+    reads the normalized `data` and maps it back to the provider's keys.
+    """
+    r = sessions.get(provider, params={"username": username}, timeout=providers.MIRROR_TIMEOUT)
+    if r.status_code >= 500:
+        raise breaker.ProviderError(f"mirror answered {r.status_code}", r.status_code)
+    data = r.json().get("data") if r.status_code == 200 else None
+    if not data or not data.get("username"):
         return None
+    return {
+        "id": data.get("id"),
+        "username": data.get("username"),
+        "full_name": data.get("full_name"),
+        "biography": data.get("bio"),
+        "external_url": data.get("external_url"),
+        "followers_count": data.get("followers"),
+        "following_count": data.get("following"),
+        "media_count": data.get("posts"),
+        "profile_pic_url_hd": data.get("profile_image_hd"),
+        "is_private": data.get("is_private"),
+        "is_verified": data.get("is_verified"),
+        "is_business": data.get("is_business_account"),
+        "is_professional_account": data.get("is_professional_account"),
+        "is_new_to_instagram": data.get("is_new_to_instagram"),
+        "is_eligible_for_meta_verified_label": data.get("is_eligible_for_meta_verified_label"),
+        "fbid": data.get("fbid")
+    }
+
+# INSTAGRAM_API_URL: comma separated, "mirror=<other deployment>/api/ig-info?key=..."
+PROVIDERS = providers.Pool("INSTAGRAM_API_URL", {"json": fetch_profile, "mirror": fetch_profile_mirror})
+
+def normalize_profile(profile):
+    """
+    Provider profile dict -> the public `data` object, picking the first
+    populated field out of the shapes different providers return.
+    """
+    profile = profile or {}
+    age = accountage.estimate(profile.get("id")) or {}
+
+    followers = (
+        profile.get("followers_count")
+        or profile.get("follower_count")
+        or profile.get("followers")
+        or (profile.get("edge_followed_by") or {}).get("count")
+    )
+
+    following = (
+        profile.get("following_count")
+        or profile.get("following")
+        or (profile.get("edge_follow") or {}).get("count")
+    )
+
+    posts = (
+        profile.get("media_count")
+        or profile.get("posts")
+        or profile.get("post_count")
+    )
+
+    return {
+        "id": profile.get("id"),
+        "username": profile.get("username"),
+        "full_name": profile.get("full_name"),
+        "bio": profile.get("biography"),
+        "external_url": profile.get("external_url") or None,
+        "direct_link": f"https://www.instagram.com/{profile.get('username')}",
+        "followers": followers,
+        "following": following,
+        "posts": posts,
+        "profile_image_hd": profile.get("profile_pic_url_hd") or profile.get("profile_pic_url_original") or profile.get("profile_pic_url"),
+        "is_private": bool(profile.get("is_private")),
+        "is_verified": bool(profile.get("is_verified")),
+        "is_business_account": bool(profile.get("is_business")),
+        "is_professional_account": bool(profile.get("is_professional_account")),
+        "is_new_to_instagram": bool(profile.get("is_new_to_instagram")),
+        "is_eligible_for_meta_verified_label": bool(
+            profile.get("is_eligible_for_ig_meta_verified_label")
+            or profile.get("is_eligible_for_meta_verified_label")
+        ),
+        "fbid": profile.get("fbid"),
+        "account_created_year": age.get("year"),
+        "account_created_month": age.get("month")
+    }
+
+def resolve(username, host):
+    if not PROVIDERS:
+        return 500, "Api not configured", False
+
+    profile, hit = PROFILE_CACHE.get_or_fetch(
+        urls.canonical_username(username),
+        lambda: PROVIDERS.call(username)
+    )
+
+    return 200, {
+        "provider_by": "UseSir",
+        "data": normalize_profile(profile),
+        "owner": "@UseSir / @OverShade"
+    }, hit
+
+def error_response(e):
+    if isinstance(e, breaker.CircuitOpen):
+        return 503, "Provider temporarily unavailable"
+    return 500, "failed to send request to UseSir API"
+
+def take_token(api_key, ip, stop):
+    """
+    Waits until the key's bucket has a request for one more lookup, which
+    paces a long list at the key's rate instead of refusing it. False when
+    the bulk request was abandoned meanwhile.
+    """
+    while True:
+        retry_after = ratelimit.check(KEYS_FILE, api_key, ip)
+        if not retry_after:
+            return True
+        if stop.wait(retry_after):
+            return False
+
+def bulk_lookup(username, api_key=None, ip=None, stop=None):
+    if stop is not None and not take_token(api_key, ip, stop):
+        return 499, "Request abandoned", False
+    try:
+        return resolve(username, None)
+    except Exception as e:
+        metrics.record_exception()
+        code, message = error_response(e)
+        return code, message, False
+
+def parse_usernames(content_type, body):
+    """
+    Usernames from a JSON list, {"usernames": [...]}, plain text with one
+    name per line (or comma separated), or a multipart upload of such a file.
+    """
+    content_type = content_type or ""
 
-class handler(BaseHTTPRequestHandler):
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+        )
+        for part in message.iter_parts():
+            if part.get_filename() or part.get_param("name", header="content-disposition") == "usernames":
+                return parse_usernames(part.get_content_type(), part.get_payload(decode=True) or b"")
+        return []
+
+    text = body.decode("utf-8", "replace").strip()
+    if content_type.startswith("application/json") or text[:1] in ("[", "{"):
+        data = json.loads(text or "null")
+        if isinstance(data, dict):
+            data = data.get("usernames")
+        if not isinstance(data, list):
+            raise ValueError("expected a list of usernames")
+        names = [str(n) for n in data]
+    else:
+        names = text.replace(",", "\n").splitlines()
+
+    return [n.strip() for n in names if n and n.strip()]
+
+class handler(BaseHandler):
     def do_GET(self):
         query = parse_qs(urlparse(self.path).query)
         api_key = query.get("key", [None])[0]
         username = query.get("username", [None])[0]
 
         if not api_key or not is_key_valid(api_key):
-            self.send_response(401)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                "status": "error",
-                "message": "Invalid or expired API key"
-            }).encode())
+            return self.send_json(401, "Invalid or expired API key")
+
+        if self.rate_limited(KEYS_FILE, api_key):
             return
 
         if not username:
-            self.send_response(400)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                "status": "error",
-                "message": "username is required"
-            }).encode())
+            return self.send_json(400, "username is required")
+
+        try:
+            code, payload, hit = resolve(username, self.headers.get("host"))
+            self.cache_status = "HIT" if hit else "MISS"
+            self.send_json(code, payload)
+
+        except Exception as e:
+            self.send_json(*error_response(e))
+
+    def do_POST(self):
+        """
+        Bulk mode: many usernames in, one NDJSON line per profile out, in
+        completion order. Upstream calls are paced by INSTAGRAM_API_URL_RPS.
+        """
+        query = parse_qs(urlparse(self.path).query)
+        api_key = query.get("key", [None])[0]
+
+        if not api_key or not is_key_valid(api_key):
+            return self.send_json(401, "Invalid or expired API key")
+
+        if self.length_required():
             return
 
-        if not INSTAGRAM_API_URL:
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                "status": "error",
-                "message": "Api not configured"
-            }).encode())
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > BULK_MAX_BODY:
+                # too large to drain; the rest of the body must not be
+                # read as the next request
+                self.close_connection = True
+                return self.send_json(413, "Request body too large")
+            usernames = parse_usernames(self.headers.get("Content-Type"), self.rfile.read(length))
+        except:
+            return self.send_json(400, "Body must be a list of usernames")
+
+        if not usernames:
+            return self.send_json(400, "usernames are required")
+
+        if len(usernames) > BULK_MAX_USERNAMES:
+            return self.send_json(400, f"At most {BULK_MAX_USERNAMES} usernames per request")
+
+        # the first lookup is charged here; every later one takes its own
+        # token as it starts, see take_token()
+        if self.rate_limited(KEYS_FILE, api_key):
             return
 
-        headers = {
-            "authority": "tools.xrespond.com",
-            "accept": "*/*",
-            "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
-            "origin": "https://bitchipdigital.com",
-            "referer": "https://bitchipdigital.com/",
-            "sec-ch-ua": '"Chromium";v="137", "Not/A)Brand";v="24"',
-            "sec-ch-ua-mobile": "?1",
-            "sec-ch-ua-platform": '"Android"',
-            "sec-fetch-dest": "empty",
-            "sec-fetch-mode": "cors",
-            "sec-fetch-site": "cross-site",
-            "user-agent": "Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Mobile Safari/537.36"
-        }
-        
-
-        
+        self.start_stream(200)
+        ip = self.client_ip()
+        stop = threading.Event()
+
+        # only a bounded window of lookups is queued at a time, so memory
+        # stays flat for very long lists
+        window = BULK_CONCURRENCY * 2
+        names = iter(enumerate(usernames))
+        pending = {}
 
+        executor = ThreadPoolExecutor(max_workers=BULK_CONCURRENCY)
         try:
-            r = requests.post(INSTAGRAM_API_URL, headers=headers, data={"profile": username}, timeout=20)
-            r.raise_for_status()
-            try:
-                res_json = r.json()
-            except:
-                raise Exception()
-
-            profile = res_json.get("data", {}).get("data", {})
-
-            followers = (
-                profile.get("followers_count")
-                or profile.get("follower_count")
-                or profile.get("followers")
-                or (profile.get("edge_followed_by") or {}).get("count")
-            )
-
-            following = (
-                profile.get("following_count")
-                or profile.get("following")
-                or (profile.get("edge_follow") or {}).get("count")
-            )
-
-            posts = (
-                profile.get("media_count")
-                or profile.get("posts")
-                or profile.get("post_count")
-            )
-
-            response = {
-                "provider_by": "UseSir",
-                "data": {
-                    "id": profile.get("id"),
-                    "username": profile.get("username"),
-                    "full_name": profile.get("full_name"),
-                    "bio": profile.get("biography"),
-                    "external_url": profile.get("external_url") or None,
-                    "direct_link": f"https://www.instagram.com/{profile.get('username')}",
-                    "followers": followers,
-                    "following": following,
-                    "posts": posts,
-                    "profile_image_hd": profile.get("profile_pic_url_hd") or profile.get("profile_pic_url_original") or profile.get("profile_pic_url"),
-                    "is_private": bool(profile.get("is_private")),
-                    "is_verified": bool(profile.get("is_verified")),
-                    "is_business_account": bool(profile.get("is_business")),
-                    "is_professional_account": bool(profile.get("is_professional_account")),
-                    "is_new_to_instagram": bool(profile.get("is_new_to_instagram")),
-                    "is_eligible_for_meta_verified_label": bool(
-                        profile.get("is_eligible_for_ig_meta_verified_label")
-                        or profile.get("is_eligible_for_meta_verified_label")
-                    ),
-                    "fbid": profile.get("fbid"),
-                    "account_created_year": detect_year(profile.get("id"))
-                },
-                "owner": "@UseSir / @OverShade"
-            }
-
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps(response, ensure_ascii=False).encode())
+            while True:
+                while len(pending) < window:
+                    item = next(names, None)
+                    if item is None:
+                        break
+                    if item[0] == 0:
+                        future = executor.submit(metrics.bound(bulk_lookup), item[1])
+                    else:
+                        future = executor.submit(metrics.bound(bulk_lookup), item[1], api_key, ip, stop)
+                    pending[future] = item
 
-        except:
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                "status": "error",
-                "message": "failed to send request to UseSir API"
-            }).encode())
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, username = pending.pop(future)
+                    code, payload, hit = future.result()
+                    if isinstance(payload, str):
+                        payload = {"status": "error", "message": payload}
+                    self.send_line({
+                        "index": index,
+                        "username": username,
+                        "code": code,
+                        "cache": "HIT" if hit else "MISS",
+                        "result": payload
+                    })
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,18 +1,15 @@
 import os
-import json
 import html
-import base64
-import requests
 import re
-from bs4 import BeautifulSoup
-from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
-from datetime import datetime
+from api._lib import breaker, cache, keystore, links, mediaproxy, providers, sessions, tokens, urls
+from api._lib.base import BaseHandler
 
-IG_POST_PROVIDER = os.environ.get("IG_POST_PROVIDER")
 MAIN_API_ORIGIN = os.environ.get("MAIN_API_ORIGIN")
 
-KEYS_FILE = os.path.join(os.path.dirname(__file__), "..", "igpostkey.txt")
+KEYS_FILE = "igpostkey.txt"
+
+POST_CACHE = cache.get_cache("ig-post", 600)
 
 QUALITY_PRIORITY = {
     "1440p": 3,
@@ -22,25 +19,15 @@ QUALITY_PRIORITY = {
 
 
 def is_key_valid(api_key):
-    try:
-        with open(KEYS_FILE, "r") as f:
-            for line in f:
-                if ":" not in line:
-                    continue
-                key, expiry = line.strip().split(":", 1)
-                if key == api_key:
-                    return datetime.utcnow() <= datetime.strptime(expiry, "%d/%m/%Y")
-    except:
-        pass
-    return False
+    return keystore.is_key_valid(KEYS_FILE, api_key)
 
 
 def encode_url(url):
-    return base64.urlsafe_b64encode(url.encode()).decode()
+    return tokens.encode(url)
 
 
 def decode_url(token):
-    return base64.urlsafe_b64decode(token.encode()).decode()
+    return tokens.decode(token)
 
 
 def detect_quality(url: str):
@@ -61,7 +48,98 @@ def extract_media_id(url: str):
     return m.group(1) if m else url.split("?")[0]
 
 
-class handler(BaseHTTPRequestHandler):
+def fetch_media(provider, post_url):
+    headers = {
+        "User-Agent": "Mozilla/5.0",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Origin": MAIN_API_ORIGIN,
+        "Referer": MAIN_API_ORIGIN
+    }
+
+    r = sessions.get(
+        provider,
+        params={"url": post_url},
+        headers=headers,
+        timeout=20
+    )
+    r.raise_for_status()
+
+    grouped = {}
+
+    for href in links.hrefs(r.text):
+        href = html.unescape(href)
+        if not re.search(r"(cdninstagram|\.mp4|\.jpg|\.jpeg|\.png|\.webp)", href, re.I):
+            continue
+
+        media_id = extract_media_id(href)
+        quality = detect_quality(href)
+        priority = QUALITY_PRIORITY[quality]
+
+        existing = grouped.get(media_id)
+        if not existing or priority > existing["priority"]:
+            grouped[media_id] = {
+                "url": href,
+                "quality": quality,
+                "priority": priority
+            }
+
+    return list(grouped.values()) or None
+
+
+def fetch_media_mirror(provider, post_url):
+    data = providers.fetch_mirror(provider, post_url)
+    if not data:
+        return None
+    return [
+        {"url": m["download_url"], "quality": m.get("quality"), "type": m.get("type")}
+        for m in data.get("media") or []
+        if m.get("download_url")
+    ] or None
+
+
+# IG_POST_PROVIDER: comma separated, "mirror=<other deployment>/api/ig-post?key=..."
+PROVIDERS = providers.Pool("IG_POST_PROVIDER", {"html": fetch_media, "mirror": fetch_media_mirror})
+
+
+def resolve(post_url, host):
+    if not PROVIDERS:
+        return 500, "Api not configured", False
+
+    media, hit = POST_CACHE.get_or_fetch(
+        urls.canonical_url(post_url),
+        lambda: PROVIDERS.call(post_url)
+    )
+
+    if not media:
+        return 404, "Media not found or post is private", hit
+
+    results = []
+    for idx, item in enumerate(media, start=1):
+        token = encode_url(item["url"])
+        results.append({
+            "index": idx,
+            "type": item.get("type") or ("video" if ".mp4" in item["url"].lower() else "image"),
+            "quality": item["quality"],
+            "download_url": f"https://{host}/api/ig-post?link={token}"
+        })
+
+    return 200, {
+        "status": "success",
+        "total_media": len(results),
+        "media": results,
+        "provider": "UseSir",
+        "owner": "@UseSir / @OverShade"
+    }, hit
+
+
+def error_response(e):
+    if isinstance(e, breaker.CircuitOpen):
+        return 503, "Provider temporarily unavailable"
+    return 500, "failed to fetch instagram post"
+
+
+class handler(BaseHandler):
 
     def do_GET(self):
         query = parse_qs(urlparse(self.path).query)
@@ -77,108 +155,40 @@ class handler(BaseHTTPRequestHandler):
         if not api_key or not is_key_valid(api_key):
             return self.send_json(401, "Invalid or expired API key")
 
+        if self.rate_limited(KEYS_FILE, api_key):
+            return
+
         if not post_url:
             return self.send_json(400, "Missing 'url' parameter")
 
-        if not IG_POST_PROVIDER:
-            return self.send_json(500, "Api not configured")
-
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Origin": MAIN_API_ORIGIN,
-                "Referer": MAIN_API_ORIGIN
-            }
-
-            r = requests.get(
-                IG_POST_PROVIDER,
-                params={"url": post_url},
-                headers=headers,
-                timeout=20
-            )
-            r.raise_for_status()
-
-            soup = BeautifulSoup(r.text, "html.parser")
-
-            grouped = {}
-
-            for a in soup.find_all("a", href=True):
-                href = html.unescape(a["href"])
-                if not re.search(r"(cdninstagram|\.mp4|\.jpg|\.jpeg|\.png|\.webp)", href, re.I):
-                    continue
-
-                media_id = extract_media_id(href)
-                quality = detect_quality(href)
-                priority = QUALITY_PRIORITY[quality]
-
-                existing = grouped.get(media_id)
-                if not existing or priority > existing["priority"]:
-                    grouped[media_id] = {
-                        "url": href,
-                        "quality": quality,
-                        "priority": priority
-                    }
-
-            if not grouped:
-                return self.send_json(404, "Media not found or post is private")
-
-            host = self.headers.get("host")
-            results = []
-
-            for idx, item in enumerate(grouped.values(), start=1):
-                token = encode_url(item["url"])
-                results.append({
-                    "index": idx,
-                    "type": "video" if ".mp4" in item["url"].lower() else "image",
-                    "quality": item["quality"],
-                    "download_url": f"https://{host}/api/ig-post?link={token}"
-                })
-
-            self.respond(200, {
-                "status": "success",
-                "total_media": len(results),
-                "media": results,
-                "provider": "UseSir",
-                "owner": "@UseSir / @OverShade"
-            })
+            code, payload, hit = resolve(post_url, self.headers.get("host"))
+            self.cache_status = "HIT" if hit else "MISS"
+            self.send_json(code, payload)
 
-        except:
-            self.send_json(500, "failed to fetch instagram post")
+        except Exception as e:
+            self.send_json(*error_response(e))
 
     def proxy_media(self, query):
         token = query.get("link", [None])[0]
+
         try:
             target = decode_url(token)
-            r = requests.get(target, stream=True, timeout=30)
+        except tokens.InvalidToken:
+            return self.send_json(403, "Invalid or expired link")
 
-            self.send_response(200)
-            self.send_header(
-                "Content-Type",
-                r.headers.get("Content-Type", "application/octet-stream")
+        try:
+            mediaproxy.relay(
+                self,
+                target,
+                lambda headers: sessions.get(
+                    target,
+                    purpose="media",
+                    stream=True,
+                    timeout=30,
+                    headers=headers
+                )
             )
-            self.send_header("Content-Disposition", "inline")
-            self.end_headers()
-
-            for chunk in r.iter_content(8192):
-                if chunk:
-                    self.wfile.write(chunk)
 
         except:
-            self.send_response(500)
-            self.end_headers()
-
-    def send_json(self, code, message):
-        self.respond(code, {
-            "status": "error",
-            "message": message
-        })
-
-    def respond(self, code, payload):
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        self.wfile.write(
-            json.dumps(payload, ensure_ascii=False, indent=2).encode()
-    )
+            self.abort(500)
@@ -1,34 +1,69 @@
 import requests
-from bs4 import BeautifulSoup
 import html
 from user_agent import generate_user_agent
-from http.server import BaseHTTPRequestHandler
-import json
 from urllib.parse import urlparse, parse_qs
-import os
-from datetime import datetime
+from api._lib import breaker, cache, keystore, links, providers, sessions, urls
+from api._lib.base import BaseHandler
 
-PROVIDER_URL = os.environ.get("PROVIDER_URL")
 KEYS_FILE = "Igreelskeys.txt"
 
+REEL_CACHE = cache.get_cache("ig-reel", 600)
+
 def is_key_valid(api_key):
-    try:
-        with open(KEYS_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or ":" not in line:
-                    continue
-
-                key, expiry = line.split(":", 1)
-                if key == api_key:
-                    expiry_date = datetime.strptime(expiry, "%d/%m/%Y")
-                    return datetime.utcnow() <= expiry_date
-    except Exception:
-        pass
-
-    return False
-
-class handler(BaseHTTPRequestHandler):
+    return keystore.is_key_valid(KEYS_FILE, api_key)
+
+def fetch_reel(provider, url):
+    headers = {
+        "User-Agent": generate_user_agent(),
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+    }
+
+    encoded_url = requests.utils.quote(url.strip(), safe="")
+    target_url = f"{provider}?url={encoded_url}"
+
+    r = sessions.get(target_url, headers=headers, timeout=20)
+    if r.status_code != 200:
+        raise breaker.ProviderError("Request failed", r.status_code)
+
+    href = links.first_href(r.text, links.is_mp4)
+
+    if not href:
+        return None
+
+    return html.unescape(href).strip()
+
+def fetch_reel_mirror(provider, url):
+    data = providers.fetch_mirror(provider, url)
+    return data and data.get("video")
+
+# PROVIDER_URL: comma separated, "mirror=<other deployment>/api/ig-reel?key=..."
+PROVIDERS = providers.Pool("PROVIDER_URL", {"html": fetch_reel, "mirror": fetch_reel_mirror})
+
+def resolve(url, host):
+    if not PROVIDERS:
+        return 500, "Provider not configured", False
+
+    video, hit = REEL_CACHE.get_or_fetch(
+        urls.canonical_url(url),
+        lambda: PROVIDERS.call(url)
+    )
+
+    if not video:
+        raise Exception("Media not found or private")
+
+    return 200, {
+        "status": "success",
+        "video": video,
+        "dev": "@UseSir"
+    }, hit
+
+def error_response(e):
+    if isinstance(e, breaker.CircuitOpen):
+        return 503, "Provider temporarily unavailable"
+    return 500, str(e)
+
+class handler(BaseHandler):
     def do_GET(self):
         query = parse_qs(urlparse(self.path).query)
 
@@ -37,71 +72,18 @@ class handler(BaseHTTPRequestHandler):
 
         # 🔐 KEY CHECK FIRST
         if not api_key or not is_key_valid(api_key):
-            self.send_response(401)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                "status": "error",
-                "message": "Invalid or expired API key"
-            }).encode())
-            return
+            return self.send_json(401, "Invalid or expired API key")
 
-        if not url:
-            self.send_response(400)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                "status": "error",
-                "message": "Missing 'url' parameter"
-            }).encode())
+        if self.rate_limited(KEYS_FILE, api_key):
             return
 
-        if not PROVIDER_URL:
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                "status": "error",
-                "message": "Provider not configured"
-            }).encode())
-            return
+        if not url:
+            return self.send_json(400, "Missing 'url' parameter")
 
         try:
-            headers = {
-                "User-Agent": generate_user_agent(),
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.9",
-            }
-
-            encoded_url = requests.utils.quote(url.strip(), safe="")
-            target_url = f"{PROVIDER_URL}?url={encoded_url}"
-
-            r = requests.get(target_url, headers=headers, timeout=20)
-            if r.status_code != 200:
-                raise Exception("Request failed")
-
-            soup = BeautifulSoup(r.text, "html.parser")
-            video_tag = soup.find("a", href=lambda x: x and ".mp4" in x.lower())
-
-            if not video_tag:
-                raise Exception("Media not found or private")
-
-            video = html.unescape(video_tag["href"]).strip()
-
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                "status": "success",
-                "video": video,
-                "dev": "@UseSir"
-            }).encode())
+            code, payload, hit = resolve(url, self.headers.get("host"))
+            self.cache_status = "HIT" if hit else "MISS"
+            self.send_json(code, payload)
 
         except Exception as e:
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                "status": "error",
-                "message": str(e)
-            }).encode())
+            self.send_json(*error_response(e))
@@ -1,39 +1,27 @@
 import os
-import json
-import requests
 import re
-import base64
-from http.server import BaseHTTPRequestHandler
+from collections import deque
 from urllib.parse import urlparse, parse_qs
-from datetime import datetime
+from api._lib import breaker, cache, keystore, mediaproxy, providers, sessions, tokens, urls
+from api._lib.base import BaseHandler
 
-PROVIDER_URL = os.environ.get("IG_STORY_PROVIDER")
 MEDIA_BASE = os.environ.get("IG_STORY_MEDIA_BASE")
 
-KEYS_FILE = os.path.join(os.path.dirname(__file__), "..", "igstorykey.txt")
+KEYS_FILE = "igstorykey.txt"
+
+STORY_CACHE = cache.get_cache("ig-story", 60)
 
 
 def is_key_valid(api_key):
-    try:
-        with open(KEYS_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if ":" not in line:
-                    continue
-                key, expiry = line.split(":", 1)
-                if key == api_key:
-                    return datetime.utcnow() <= datetime.strptime(expiry, "%d/%m/%Y")
-    except:
-        pass
-    return False
+    return keystore.is_key_valid(KEYS_FILE, api_key)
 
 
 def encode_url(url: str) -> str:
-    return base64.urlsafe_b64encode(url.encode()).decode()
+    return tokens.encode(url)
 
 
 def decode_url(token: str) -> str:
-    return base64.urlsafe_b64decode(token.encode()).decode()
+    return tokens.decode(token)
 
 
 def normalize_media_url(url: str) -> str:
@@ -51,7 +39,130 @@ def detect_quality(url: str) -> str:
     return "720p"
 
 
-class handler(BaseHTTPRequestHandler):
+STORY_TOKENS = re.compile(
+    r'<small>(?:(?!</small>).)*?<i class="far fa-clock"[^>]*>.*?</i>\s*(?P<timestamp>.*?)</small>'
+    r'|<source src="(?P<video>[^"]+\.mp4[^"]*)"'
+    r'|(?i:<img[^>]+src="(?P<image>[^"]+\.(?:jpg|jpeg|png|webp)[^"]*)")',
+    re.DOTALL
+)
+
+
+def scan_stories(html):
+    """
+    Walk the provider HTML once and return story records in page order.
+    Timestamps and media are paired first-in first-out, so each clock
+    label lands on the media element of its own story block whether it is
+    rendered before or after the media.
+    """
+    stories = []
+    seen = set()
+    waiting_media = deque()
+    waiting_times = deque()
+
+    for m in STORY_TOKENS.finditer(html):
+        if m.lastgroup == "timestamp":
+            if waiting_media:
+                waiting_media.popleft()["timestamp"] = m.group("timestamp")
+            else:
+                waiting_times.append(m.group("timestamp"))
+            continue
+
+        media_url = normalize_media_url(m.group(m.lastgroup))
+        if media_url in seen:
+            continue
+        seen.add(media_url)
+
+        if m.lastgroup == "video":
+            item = {"type": "video", "quality": detect_quality(media_url)}
+        else:
+            item = {"type": "image", "quality": "original"}
+
+        item["timestamp"] = None
+        item["url"] = media_url
+        stories.append(item)
+
+        if waiting_times:
+            item["timestamp"] = waiting_times.popleft()
+        else:
+            waiting_media.append(item)
+
+    return stories
+
+
+def fetch_stories(provider, username):
+    r = sessions.get(
+        f"{provider}?url={username}&method=allstories",
+        headers={"User-Agent": "Mozilla/5.0"},
+        timeout=20
+    )
+    r.raise_for_status()
+
+    return scan_stories(r.json().get("html", "")) or None
+
+
+def fetch_stories_mirror(provider, username):
+    data = providers.fetch_mirror(provider, username, param="username")
+    if not data:
+        return None
+    return [
+        {
+            "type": s.get("type"),
+            "quality": s.get("quality"),
+            "timestamp": s.get("posted"),
+            "url": s["download_url"]
+        }
+        for s in (data.get("message") or {}).get("stories") or []
+        if s.get("download_url")
+    ] or None
+
+
+# IG_STORY_PROVIDER: comma separated, "mirror=<other deployment>/api/ig-story?key=..."
+PROVIDERS = providers.Pool("IG_STORY_PROVIDER", {"json": fetch_stories, "mirror": fetch_stories_mirror})
+
+
+def resolve(username, host):
+    if not PROVIDERS or not MEDIA_BASE:
+        return 500, "Api not configured", False
+
+    stories, hit = STORY_CACHE.get_or_fetch(
+        urls.canonical_username(username),
+        lambda: PROVIDERS.call(username)
+    )
+
+    if not stories:
+        return 404, "No stories found", hit
+
+    output = []
+    for idx, item in enumerate(stories, start=1):
+        token = encode_url(item["url"])
+        output.append({
+            "index": idx,
+            "type": item["type"],
+            "quality": item["quality"],
+            "posted": item["timestamp"],
+            "download_url": f"https://{host}/api/ig-story?link={token}"
+        })
+
+    return 200, {
+        "status": "success",
+        "message": {
+            "status": "success",
+            "username": username,
+            "total_stories": len(output),
+            "stories": output,
+            "provider": "UseSir",
+            "owner": "@UseSir / @OverShade"
+        }
+    }, hit
+
+
+def error_response(e):
+    if isinstance(e, breaker.CircuitOpen):
+        return 503, "Provider temporarily unavailable"
+    return 500, "failed to fetch stories"
+
+
+class handler(BaseHandler):
 
     def do_GET(self):
         query = parse_qs(urlparse(self.path).query)
@@ -70,99 +181,19 @@ class handler(BaseHTTPRequestHandler):
         if not api_key or not is_key_valid(api_key):
             return self.send_json(401, "Invalid or expired API key")
 
+        if self.rate_limited(KEYS_FILE, api_key):
+            return
+
         if not username:
             return self.send_json(400, "username is required")
 
-        if not PROVIDER_URL or not MEDIA_BASE:
-            return self.send_json(500, "Api not configured")
-
         try:
-            r = requests.get(
-                f"{PROVIDER_URL}?url={username}&method=allstories",
-                headers={"User-Agent": "Mozilla/5.0"},
-                timeout=20
-            )
-            r.raise_for_status()
-
-            html = r.json().get("html", "")
-
-
-            timestamps = re.findall(
-                r'<small>.*?<i class="far fa-clock".*?>.*?</i>\s*(.*?)</small>',
-                html,
-                re.DOTALL
-            )
-
-            stories = []
-            seen = set()
-
-
-            video_matches = re.findall(
-                r'<source src="([^"]+\.mp4[^"]*)"',
-                html
-            )
-
-            for i, raw_url in enumerate(video_matches):
-                media_url = normalize_media_url(raw_url)
-                if media_url in seen:
-                    continue
-
-                seen.add(media_url)
-
-                stories.append({
-                    "type": "video",
-                    "quality": detect_quality(media_url),
-                    "timestamp": timestamps[i] if i < len(timestamps) else None,
-                    "url": media_url
-                })
-
-            image_matches = re.findall(
-                r'<img[^>]+src="([^"]+\.(?:jpg|jpeg|png|webp)[^"]*)"',
-                html,
-                re.I
-            )
-
-            for j, raw_url in enumerate(image_matches):
-                media_url = normalize_media_url(raw_url)
-                if media_url in seen:
-                    continue
-
-                seen.add(media_url)
-
-                stories.append({
-                    "type": "image",
-                    "quality": "original",
-                    "timestamp": timestamps[len(stories)] if len(stories) < len(timestamps) else None,
-                    "url": media_url
-                })
-
-            if not stories:
-                return self.send_json(404, "No stories found")
-
-            host = self.headers.get("host")
-            output = []
-
-            for idx, item in enumerate(stories, start=1):
-                token = encode_url(item["url"])
-                output.append({
-                    "index": idx,
-                    "type": item["type"],
-                    "quality": item["quality"],
-                    "posted": item["timestamp"],
-                    "download_url": f"https://{host}/api/ig-story?link={token}"
-                })
-
-            self.send_json(200, {
-                "status": "success",
-                "username": username,
-                "total_stories": len(output),
-                "stories": output,
-                "provider": "UseSir",
-                "owner": "@UseSir / @OverShade"
-            })
+            code, payload, hit = resolve(username, self.headers.get("host"))
+            self.cache_status = "HIT" if hit else "MISS"
+            self.send_json(code, payload)
 
         except Exception as e:
-            self.send_json(500, "failed to fetch stories")
+            self.send_json(*error_response(e))
 
 
     def handle_proxy(self, query):
@@ -170,35 +201,21 @@ class handler(BaseHTTPRequestHandler):
 
         try:
             target = decode_url(token)
+        except tokens.InvalidToken:
+            return self.send_json(403, "Invalid or expired link")
 
-            if not target.startswith("http"):
-                raise Exception("Invalid media URL")
-
-            r = requests.get(target, stream=True, timeout=20)
-            r.raise_for_status()
-
-            self.send_response(200)
-            self.send_header(
-                "Content-Type",
-                r.headers.get("Content-Type", "application/octet-stream")
+        try:
+            mediaproxy.relay(
+                self,
+                target,
+                lambda headers: sessions.get(
+                    target,
+                    purpose="media",
+                    stream=True,
+                    timeout=20,
+                    headers=headers
+                )
             )
-            self.send_header("Content-Disposition", "inline")
-            self.end_headers()
-
-            for chunk in r.iter_content(8192):
-                if chunk:
-                    self.wfile.write(chunk)
 
         except:
-            self.send_response(500)
-            self.end_headers()
-
-
-    def send_json(self, code, message):
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        self.wfile.write(json.dumps(
-            {"status": "error" if code != 200 else "success", "message": message},
-            indent=2
-        ).encode())
+            self.abort(500)
@@ -0,0 +1,47 @@
+import os
+import hmac
+from urllib.parse import urlparse, parse_qs
+from api._lib import breaker, cache, metrics
+from api._lib.base import BaseHandler
+
+# optional; when set, scrapes must pass ?key= or a Bearer token
+METRICS_KEY = os.environ.get("METRICS_KEY", "")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STATES = (breaker.CLOSED, breaker.OPEN, breaker.HALF_OPEN)
+
+
+def collect():
+    """
+    Scrape-time families for state that already lives elsewhere: result
+    cache counters and provider breaker states.
+    """
+    events = []
+    for name, stats in sorted(cache.stats().items()):
+        for event, value in sorted(stats.items()):
+            if event != "hit_rate":
+                events.append((metrics.series("reel_api_cache_events_total", cache=name, event=event), value))
+
+    states = []
+    for name, snap in sorted(breaker.snapshot().items()):
+        for state in STATES:
+            states.append((metrics.series("reel_api_provider_state", provider=name, state=state), int(snap["state"] == state)))
+
+    return (
+        metrics.render_family("reel_api_cache_events_total", "counter", "Result cache hits, misses and shared fetches.", events)
+        + metrics.render_family("reel_api_provider_state", "gauge", "Provider circuit breaker state.", states)
+    )
+
+
+class handler(BaseHandler):
+
+    def do_GET(self):
+        if METRICS_KEY:
+            query = parse_qs(urlparse(self.path).query)
+            auth = self.headers.get("Authorization") or ""
+            token = query.get("key", [auth.removeprefix("Bearer ").strip()])[0]
+            if not hmac.compare_digest(token.encode(), METRICS_KEY.encode()):
+                return self.send_json(401, "Invalid or expired API key")
+
+        self.send_body(200, metrics.render(collect()), CONTENT_TYPE)
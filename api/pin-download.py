@@ -1,16 +1,12 @@
-import requests
-from bs4 import BeautifulSoup
-import re
 from user_agent import generate_user_agent
-from http.server import BaseHTTPRequestHandler
-import json
 from urllib.parse import urlparse, parse_qs
-from datetime import datetime
-import os
+from api._lib import breaker, cache, keystore, links, providers, sessions, urls
+from api._lib.base import BaseHandler
 
-PIN_PROVIDER_URL = os.environ.get("PIN_PROVIDER_URL")
 KEYS_FILE = "pinkeys.txt"
 
+PIN_CACHE = cache.get_cache("pin", 1800)
+
 PINIMG_DOMAINS = ("pinimg.com", "v.pinimg.com", "i.pinimg.com")
 
 def is_real_media(url):
@@ -21,96 +17,96 @@ def is_real_media(url):
     )
 
 def is_key_valid(api_key):
-    try:
-        with open(KEYS_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or ":" not in line:
-                    continue
-                key, expiry = line.split(":", 1)
-                if key == api_key:
-                    return datetime.utcnow() <= datetime.strptime(expiry, "%d/%m/%Y")
-    except:
-        pass
-    return False
-
-class handler(BaseHTTPRequestHandler):
+    return keystore.is_key_valid(KEYS_FILE, api_key)
+
+def fetch_pin(provider, url):
+    headers = {
+        "user-agent": generate_user_agent(),
+        "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "accept-language": "en-US,en;q=0.9",
+        "origin": "https://www.expertstool.com",
+        "referer": provider
+    }
+
+    r = sessions.post(provider, headers=headers, data={"url": url.strip()}, timeout=20)
+    r.raise_for_status()
+    html = r.text
+
+    if any(x in html.lower() for x in ["api not work", "invalid", "captcha"]):
+        raise Exception("Invalid Pinterest URL or service down")
+
+    video_link = None
+    photo_link = None
+
+    for a in links.iter_links(html, with_text=True):
+        href = a.url
+        if not is_real_media(href):
+            continue
+        if href.lower().endswith(".mp4"):
+            if any(q in a.text.lower() for q in ["1080", "original", "hd"]):
+                video_link = href
+                break
+            if not video_link:
+                video_link = href
+        elif not photo_link:
+            photo_link = href
+
+    if video_link:
+        return {"video": video_link, "photo": None}
+    if photo_link:
+        return {"video": None, "photo": photo_link}
+    return None
+
+def fetch_pin_mirror(provider, url):
+    data = providers.fetch_mirror(provider, url)
+    if not data:
+        return None
+    return {"video": data.get("video"), "photo": data.get("photo")}
+
+PROVIDERS = providers.Pool("PIN_PROVIDER_URL", {"html": fetch_pin, "mirror": fetch_pin_mirror})
+
+def resolve(url, host):
+    if not PROVIDERS:
+        return 500, "Provider not configured", False
+
+    media, hit = PIN_CACHE.get_or_fetch(
+        urls.canonical_url(url),
+        lambda: PROVIDERS.call(url)
+    )
+    media = media or {}
+    video_link = media.get("video")
+    photo_link = media.get("photo")
+
+    if video_link and is_real_media(video_link):
+        return 200, {"status": "success", "video": video_link, "dev": "@UseSir"}, hit
+    if photo_link and is_real_media(photo_link):
+        return 200, {"status": "success", "photo": photo_link, "dev": "@UseSir"}, hit
+    return 200, "No media found", hit
+
+def error_response(e):
+    if isinstance(e, breaker.CircuitOpen):
+        return 503, "Provider temporarily unavailable"
+    return 500, str(e)
+
+class handler(BaseHandler):
     def do_GET(self):
         query = parse_qs(urlparse(self.path).query)
         api_key = query.get("key", [None])[0]
         url = query.get("url", [None])[0]
 
         if not api_key or not is_key_valid(api_key):
-            self.send_response(401)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"status": "error", "message": "Invalid or expired API key"}).encode())
-            return
-
-        if not url:
-            self.send_response(400)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"status": "error", "message": "Missing 'url' parameter"}).encode())
-            return
+            return self.send_json(401, "Invalid or expired API key")
 
-        if not PIN_PROVIDER_URL:
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"status": "error", "message": "Provider not configured"}).encode())
+        if self.rate_limited(KEYS_FILE, api_key):
             return
 
-        headers = {
-            "user-agent": generate_user_agent(),
-            "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "accept-language": "en-US,en;q=0.9",
-            "origin": "https://www.expertstool.com",
-            "referer": PIN_PROVIDER_URL
-        }
+        if not url:
+            return self.send_json(400, "Missing 'url' parameter")
 
         try:
-            r = requests.post(PIN_PROVIDER_URL, headers=headers, data={"url": url.strip()}, timeout=20)
-            r.raise_for_status()
-            html = r.text
-
-            if any(x in html.lower() for x in ["api not work", "invalid", "captcha"]):
-                raise Exception("Invalid Pinterest URL or service down")
-
-            soup = BeautifulSoup(html, "html.parser")
-            video_link = None
-            photo_link = None
-
-            for a in soup.find_all("a", href=True):
-                href = a["href"]
-                text = a.get_text(strip=True).lower()
-                if is_real_media(href) and href.lower().endswith(".mp4"):
-                    if any(q in text for q in ["1080", "original", "hd"]):
-                        video_link = href
-                        break
-                    if not video_link:
-                        video_link = href
-
-            if not video_link:
-                for a in soup.find_all("a", href=True):
-                    href = a["href"]
-                    if is_real_media(href) and not href.lower().endswith(".mp4"):
-                        photo_link = href
-                        break
-
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-
-            if video_link and is_real_media(video_link):
-                self.wfile.write(json.dumps({"status": "success", "video": video_link, "dev": "@UseSir"}).encode())
-            elif photo_link and is_real_media(photo_link):
-                self.wfile.write(json.dumps({"status": "success", "photo": photo_link, "dev": "@UseSir"}).encode())
-            else:
-                self.wfile.write(json.dumps({"status": "error", "message": "No media found"}).encode())
+            code, payload, hit = resolve(url, self.headers.get("host"))
+            self.cache_status = "HIT" if hit else "MISS"
+            self.send_json(code, payload)
 
         except Exception as e:
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"status": "error", "message": str(e)}).encode())
+            self.send_json(*error_response(e))
@@ -0,0 +1,15 @@
+from api._lib import breaker, cache
+from api._lib.base import BaseHandler
+
+
+class handler(BaseHandler):
+
+    def do_GET(self):
+        providers = breaker.snapshot()
+        healthy = all(p["state"] == breaker.CLOSED for p in providers.values())
+
+        self.send_json(200, {
+            "status": "success" if healthy else "degraded",
+            "providers": providers,
+            "caches": cache.stats()
+        })
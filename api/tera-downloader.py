@@ -1,47 +1,36 @@
 import os
-import json
-import base64
-import cloudscraper
-from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
-from datetime import datetime
+from api._lib import breaker, cache, keystore, providers, scraper, segmented, tokens, urls
+from api._lib.base import BaseHandler
 
-PROVIDER_URL = os.environ.get("TERABOX_PROVIDER")
+KEYS_FILE = "terakeys.txt"
 
-KEYS_FILE = os.path.join(os.path.dirname(__file__), "..", "terakeys.txt")
-MASTER_KEYS_FILE = os.path.join(os.path.dirname(__file__), "..", "masterkeys.txt")
+# parallel range requests per proxied file; 1 streams over one connection
+SEGMENTS = int(os.environ.get("TERABOX_SEGMENTS", "4"))
 
+PROVIDER_SCRAPERS = scraper.get_pool(
+    "terabox-provider",
+    browser={
+        "browser": "chrome",
+        "platform": "windows",
+        "desktop": True
+    }
+)
+MEDIA_SCRAPERS = scraper.get_pool("terabox-media", size=max(scraper.POOL_SIZE, SEGMENTS))
 
-def is_master_key(api_key):
-    try:
-        with open(MASTER_KEYS_FILE, "r") as f:
-            return api_key in [x.strip() for x in f if x.strip()]
-    except:
-        return False
+FILES_CACHE = cache.get_cache("terabox", 300)
 
 
 def is_key_valid(api_key):
-    if is_master_key(api_key):
-        return True
-    try:
-        with open(KEYS_FILE, "r") as f:
-            for line in f:
-                if ":" not in line:
-                    continue
-                key, expiry = line.strip().split(":", 1)
-                if key == api_key:
-                    return datetime.utcnow() <= datetime.strptime(expiry, "%d/%m/%Y")
-    except:
-        pass
-    return False
+    return keystore.is_key_valid(KEYS_FILE, api_key, allow_master=True)
 
 
 def encode_url(url):
-    return base64.urlsafe_b64encode(url.encode()).decode()
+    return tokens.encode(url)
 
 
 def decode_url(token):
-    return base64.urlsafe_b64decode(token.encode()).decode()
+    return tokens.decode(token)
 
 
 def proxy(url, host, path):
@@ -50,7 +39,90 @@ def proxy(url, host, path):
     return f"https://{host}{path}?link={encode_url(url)}"
 
 
-class handler(BaseHTTPRequestHandler):
+def fetch_files(provider, url):
+    r = PROVIDER_SCRAPERS.request(
+        "POST",
+        provider,
+        json={"url": url},
+        headers={
+            "accept": "application/json",
+            "content-type": "application/json",
+            "user-agent": (
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                "AppleWebKit/537.36 (KHTML, like Gecko) "
+                "Chrome/143.0.0.0 Safari/537.36"
+            )
+        },
+        timeout=30
+    )
+
+    r.raise_for_status()
+    data = r.json()
+
+    return data.get("list") or None
+
+
+def fetch_files_mirror(provider, url):
+    data = providers.fetch_mirror(provider, url)
+    if not data:
+        return None
+    return data.get("files") or None
+
+
+# TERABOX_PROVIDER: comma separated, "mirror=<other deployment>/api/tera-downloader?key=..."
+PROVIDERS = providers.Pool("TERABOX_PROVIDER", {"json": fetch_files, "mirror": fetch_files_mirror})
+
+
+def resolve(url, host, path="/api/tera-downloader"):
+    if not PROVIDERS:
+        return 500, "Api not configured", False
+
+    files, hit = FILES_CACHE.get_or_fetch(
+        urls.canonical_url(url),
+        lambda: PROVIDERS.call(url)
+    )
+
+    if not files:
+        raise Exception("no_files")
+
+    output = []
+    for item in files:
+        output.append({
+            "fs_id": item.get("fs_id"),
+            "name": item.get("name"),
+            "size": item.get("size"),
+            "size_formatted": item.get("size_formatted"),
+            "type": item.get("type"),
+            "duration": item.get("duration"),
+            "quality": item.get("quality"),
+            "download_link": proxy(item.get("download_link"), host, path),
+            "fast_download_link": proxy(item.get("fast_download_link"), host, path),
+            "stream_url": proxy(item.get("stream_url"), host, path),
+            "fast_stream_url": {
+                q: proxy(u, host, path)
+                for q, u in (item.get("fast_stream_url") or {}).items()
+            },
+            "subtitle_url": proxy(item.get("subtitle_url"), host, path),
+            "thumbnail": proxy(item.get("thumbnail"), host, path),
+            "folder": item.get("folder")
+        })
+
+    return 200, {
+        "status": "success",
+        "total_files": len(output),
+        "files": output,
+        "provider": "UseSir",
+        "owner": "@UseSir / @OverShade"
+    }, hit
+
+
+def error_response(e):
+    if isinstance(e, breaker.CircuitOpen):
+        return 503, "Provider temporarily unavailable"
+    return 500, "failed to fetch terabox data"
+
+
+class handler(BaseHandler):
 
     def do_GET(self):
         query = parse_qs(urlparse(self.path).query)
@@ -62,119 +134,47 @@ class handler(BaseHTTPRequestHandler):
         url = query.get("url", [None])[0]
 
         if not api_key or not is_key_valid(api_key):
-            return self.respond(401, {
-                "status": "error",
-                "message": "Invalid or expired API key"
-            })
+            return self.send_json(401, "Invalid or expired API key")
 
-        if not url:
-            return self.respond(400, {
-                "status": "error",
-                "message": "Missing 'url' parameter"
-            })
+        if self.rate_limited(KEYS_FILE, api_key):
+            return
 
-        if not PROVIDER_URL:
-            return self.respond(500, {
-                "status": "error",
-                "message": "Api not configured"
-            })
+        if not url:
+            return self.send_json(400, "Missing 'url' parameter")
 
         try:
-            scraper = cloudscraper.create_scraper(
-                browser={
-                    "browser": "chrome",
-                    "platform": "windows",
-                    "desktop": True
-                }
+            code, payload, hit = resolve(
+                url,
+                self.headers.get("host"),
+                urlparse(self.path).path
             )
+            self.cache_status = "HIT" if hit else "MISS"
+            self.send_json(code, payload)
 
-            r = scraper.post(
-                PROVIDER_URL,
-                json={"url": url},
-                headers={
-                    "accept": "application/json",
-                    "content-type": "application/json",
-                    "user-agent": (
-                        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                        "AppleWebKit/537.36 (KHTML, like Gecko) "
-                        "Chrome/143.0.0.0 Safari/537.36"
-                    )
-                },
-                timeout=30
-            )
-
-            r.raise_for_status()
-            data = r.json()
-
-            files = data.get("list", [])
-            if not files:
-                raise Exception("no_files")
-
-            host = self.headers.get("host")
-            path = urlparse(self.path).path
-
-            output = []
-            for item in files:
-                output.append({
-                    "fs_id": item.get("fs_id"),
-                    "name": item.get("name"),
-                    "size": item.get("size"),
-                    "size_formatted": item.get("size_formatted"),
-                    "type": item.get("type"),
-                    "duration": item.get("duration"),
-                    "quality": item.get("quality"),
-                    "download_link": proxy(item.get("download_link"), host, path),
-                    "fast_download_link": proxy(item.get("fast_download_link"), host, path),
-                    "stream_url": proxy(item.get("stream_url"), host, path),
-                    "fast_stream_url": {
-                        q: proxy(u, host, path)
-                        for q, u in (item.get("fast_stream_url") or {}).items()
-                    },
-                    "subtitle_url": proxy(item.get("subtitle_url"), host, path),
-                    "thumbnail": proxy(item.get("thumbnail"), host, path),
-                    "folder": item.get("folder")
-                })
-
-            self.respond(200, {
-                "status": "success",
-                "total_files": len(output),
-                "files": output,
-                "provider": "UseSir",
-                "owner": "@UseSir / @OverShade"
-            })
-
-        except:
-            self.respond(500, {
-                "status": "error",
-                "message": "failed to fetch terabox data"
-            })
+        except Exception as e:
+            self.send_json(*error_response(e))
 
     def proxy_media(self, query):
-        try:
-            target = decode_url(query.get("link")[0])
+        token = query.get("link", [None])[0]
 
-            scraper = cloudscraper.create_scraper()
-            r = scraper.get(target, stream=True, timeout=30)
-            r.raise_for_status()
+        try:
+            target = decode_url(token)
+        except tokens.InvalidToken:
+            return self.send_json(403, "Invalid or expired link")
 
-            self.send_response(200)
-            self.send_header(
-                "Content-Type",
-                r.headers.get("Content-Type", "application/octet-stream")
+        try:
+            segmented.relay(
+                self,
+                target,
+                lambda headers: MEDIA_SCRAPERS.request(
+                    "GET",
+                    target,
+                    stream=True,
+                    timeout=30,
+                    headers=headers
+                ),
+                SEGMENTS
             )
-            self.send_header("Content-Disposition", "inline")
-            self.end_headers()
-
-            for chunk in r.iter_content(8192):
-                if chunk:
-                    self.wfile.write(chunk)
 
         except:
-            self.send_response(500)
-            self.end_headers()
-
-    def respond(self, code, payload):
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        self.wfile.write(json.dumps(payload, indent=2).encode())
+            self.abort(500)
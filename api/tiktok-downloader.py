@@ -1,37 +1,22 @@
-import os
-import json
-import base64
-import requests
-from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
-from datetime import datetime
+from api._lib import breaker, cache, keystore, mediaproxy, providers, sessions, tokens, urls
+from api._lib.base import BaseHandler
 
-PROVIDER_URL = os.environ.get("TIKTOK_PROVIDER")
+KEYS_FILE = "tiktokkeys.txt"
 
-KEYS_FILE = os.path.join(os.path.dirname(__file__), "..", "tiktokkeys.txt")
+VIDEO_CACHE = cache.get_cache("tiktok", 600)
 
 
 def is_key_valid(api_key):
-    try:
-        with open(KEYS_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if ":" not in line:
-                    continue
-                key, expiry = line.split(":", 1)
-                if key == api_key:
-                    return datetime.utcnow() <= datetime.strptime(expiry, "%d/%m/%Y")
-    except:
-        pass
-    return False
+    return keystore.is_key_valid(KEYS_FILE, api_key)
 
 
 def encode_url(url):
-    return base64.urlsafe_b64encode(url.encode()).decode()
+    return tokens.encode(url)
 
 
 def decode_url(token):
-    return base64.urlsafe_b64decode(token.encode()).decode()
+    return tokens.decode(token)
 
 
 def proxy(url, host, path):
@@ -40,7 +25,110 @@ def proxy(url, host, path):
     return f"https://{host}{path}?link={encode_url(url)}"
 
 
-class handler(BaseHTTPRequestHandler):
+def fetch_data(provider, video_url):
+    headers = {
+        "accept": "*/*",
+        "content-type": "application/json",
+        "user-agent": "Mozilla/5.0"
+    }
+
+    payload = {"url": video_url}
+
+    r = sessions.post(
+        provider,
+        headers=headers,
+        json=payload,
+        timeout=30
+    )
+
+    r.raise_for_status()
+    data = r.json()
+
+    if not data.get("mediaUrl"):
+        return None
+    return data
+
+
+def fetch_data_mirror(provider, video_url):
+    data = providers.fetch_mirror(provider, video_url)
+    if not data or not (data.get("video") or {}).get("download_url"):
+        return None
+    return {
+        "mediaUrl": data["video"]["download_url"],
+        "id": data.get("id"),
+        "username": data.get("username"),
+        "caption": data.get("caption"),
+        "stats": data.get("stats"),
+        "thumbnail": data.get("thumbnail"),
+        "authorInfo": data.get("author") or {},
+        "musicInfo": data.get("music") or {}
+    }
+
+
+# TIKTOK_PROVIDER: comma separated, "mirror=<other deployment>/api/tiktok-downloader?key=..."
+PROVIDERS = providers.Pool("TIKTOK_PROVIDER", {"json": fetch_data, "mirror": fetch_data_mirror})
+
+
+def resolve(video_url, host, path="/api/tiktok-downloader"):
+    if not PROVIDERS:
+        return 500, "Api not configured", False
+
+    data, hit = VIDEO_CACHE.get_or_fetch(
+        urls.canonical_url(video_url),
+        lambda: PROVIDERS.call(video_url)
+    )
+
+    if not data:
+        return 404, "Video not found", hit
+
+    media = data["mediaUrl"]
+
+    response = {
+        "status": "success",
+        "id": data.get("id"),
+        "username": data.get("username"),
+        "caption": data.get("caption"),
+        "stats": data.get("stats"),
+        "video": {
+            "download_url": proxy(media, host, path),
+            "quality": "highest"
+        },
+        "thumbnail": proxy(data.get("thumbnail"), host, path),
+        "author": {
+            "id": data.get("authorInfo", {}).get("id"),
+            "username": data.get("authorInfo", {}).get("username"),
+            "nickname": data.get("authorInfo", {}).get("nickname"),
+            "avatar": proxy(
+                data.get("authorInfo", {}).get("avatar"),
+                host,
+                path
+            )
+        },
+        "music": {
+            "id": data.get("musicInfo", {}).get("id"),
+            "title": data.get("musicInfo", {}).get("title"),
+            "author": data.get("musicInfo", {}).get("author"),
+            "duration": data.get("musicInfo", {}).get("duration"),
+            "cover": proxy(
+                data.get("musicInfo", {}).get("cover"),
+                host,
+                path
+            )
+        },
+        "provider": "UseSir",
+        "owner": "@UseSir / @OverShade"
+    }
+
+    return 200, response, hit
+
+
+def error_response(e):
+    if isinstance(e, breaker.CircuitOpen):
+        return 503, "Provider temporarily unavailable"
+    return 500, "failed to fetch tiktok video"
+
+
+class handler(BaseHandler):
 
     def do_GET(self):
         query = parse_qs(urlparse(self.path).query)
@@ -57,107 +145,45 @@ class handler(BaseHTTPRequestHandler):
         if not api_key or not is_key_valid(api_key):
             return self.send_json(401, "Invalid or expired API key")
 
+        if self.rate_limited(KEYS_FILE, api_key):
+            return
+
         if not video_url:
             return self.send_json(400, "Missing 'url' parameter")
 
-        if not PROVIDER_URL:
-            return self.send_json(500, "Api not configured")
-
         try:
-            headers = {
-                "accept": "*/*",
-                "content-type": "application/json",
-                "user-agent": "Mozilla/5.0"
-            }
-
-            payload = {"url": video_url}
-
-            r = requests.post(
-                PROVIDER_URL,
-                headers=headers,
-                json=payload,
-                timeout=30
+            code, payload, hit = resolve(
+                video_url,
+                self.headers.get("host"),
+                urlparse(self.path).path
             )
+            self.cache_status = "HIT" if hit else "MISS"
+            self.send_json(code, payload)
 
-            r.raise_for_status()
-            data = r.json()
-
-            media = data.get("mediaUrl")
-            if not media:
-                return self.send_json(404, "Video not found")
-
-            host = self.headers.get("host")
-            path = urlparse(self.path).path
-
-            response = {
-                "status": "success",
-                "id": data.get("id"),
-                "username": data.get("username"),
-                "caption": data.get("caption"),
-                "stats": data.get("stats"),
-                "video": {
-                    "download_url": proxy(media, host, path),
-                    "quality": "highest"
-                },
-                "thumbnail": proxy(data.get("thumbnail"), host, path),
-                "author": {
-                    "id": data.get("authorInfo", {}).get("id"),
-                    "username": data.get("authorInfo", {}).get("username"),
-                    "nickname": data.get("authorInfo", {}).get("nickname"),
-                    "avatar": proxy(
-                        data.get("authorInfo", {}).get("avatar"),
-                        host,
-                        path
-                    )
-                },
-                "music": {
-                    "id": data.get("musicInfo", {}).get("id"),
-                    "title": data.get("musicInfo", {}).get("title"),
-                    "author": data.get("musicInfo", {}).get("author"),
-                    "duration": data.get("musicInfo", {}).get("duration"),
-                    "cover": proxy(
-                        data.get("musicInfo", {}).get("cover"),
-                        host,
-                        path
-                    )
-                },
-                "provider": "UseSir",
-                "owner": "@UseSir / @OverShade"
-            }
-
-            self.send_json(200, response)
-
-        except Exception:
-            self.send_json(500, "failed to fetch tiktok video")
+        except Exception as e:
+            self.send_json(*error_response(e))
 
     def proxy_media(self, query):
+        token = query.get("link", [None])[0]
+
         try:
-            target = decode_url(query.get("link")[0])
-            r = requests.get(target, stream=True, timeout=30)
-            r.raise_for_status()
-
-            self.send_response(200)
-            self.send_header(
-                "Content-Type",
-                r.headers.get("Content-Type", "video/mp4")
-            )
-            self.send_header("Content-Disposition", "inline")
-            self.end_headers()
+            target = decode_url(token)
+        except tokens.InvalidToken:
+            return self.send_json(403, "Invalid or expired link")
 
-            for chunk in r.iter_content(8192):
-                if chunk:
-                    self.wfile.write(chunk)
+        try:
+            mediaproxy.relay(
+                self,
+                target,
+                lambda headers: sessions.get(
+                    target,
+                    purpose="media",
+                    stream=True,
+                    timeout=30,
+                    headers=headers
+                ),
+                "video/mp4"
+            )
 
         except:
-            self.send_response(500)
-            self.end_headers()
-
-    def send_json(self, code, payload):
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-
-        if isinstance(payload, str):
-            payload = {"status": "error", "message": payload}
-
-        self.wfile.write(json.dumps(payload, indent=2).encode())
+            self.abort(500)
@@ -1,38 +1,91 @@
-import os
-import json
 import html
-import base64
-import requests
-from bs4 import BeautifulSoup
-from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs, quote
-from datetime import datetime
+from api._lib import breaker, cache, keystore, links, mediaproxy, providers, sessions, tokens, urls
+from api._lib.base import BaseHandler
 from user_agent import generate_user_agent
 
-PROVIDER_URL = os.environ.get("TWITTER_PROVIDER")
-KEYS_FILE = os.path.join(os.path.dirname(__file__), "..", "twitterapikey.txt")
+KEYS_FILE = "twitterapikey.txt"
+
+VIDEO_CACHE = cache.get_cache("twitter", 900)
 
 def is_key_valid(api_key):
-    try:
-        with open(KEYS_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if ":" not in line:
-                    continue
-                key, expiry = line.split(":", 1)
-                if key == api_key:
-                    return datetime.utcnow() <= datetime.strptime(expiry, "%d/%m/%Y")
-    except:
-        pass
-    return False
+    return keystore.is_key_valid(KEYS_FILE, api_key)
 
 def encode_url(url):
-    return base64.urlsafe_b64encode(url.encode()).decode()
+    return tokens.encode(url)
 
 def decode_url(token):
-    return base64.urlsafe_b64decode(token.encode()).decode()
+    return tokens.decode(token)
+
+def fetch_videos(provider, url):
+    headers = {
+        "User-Agent": generate_user_agent(),
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Referer": "https://snapdownloader.com/tools/twitter-video-downloader",
+        "Origin": "https://snapdownloader.com"
+    }
+
+    encoded = quote(url.strip(), safe="")
+    target = f"{provider}?url={encoded}"
+
+    r = sessions.get(
+        target,
+        headers=headers,
+        timeout=20,
+        allow_redirects=True
+    )
+
+    r.raise_for_status()
+
+    videos = [
+        html.unescape(href)
+        for href in links.hrefs(r.text, links.is_mp4)
+    ]
+
+    return videos or None
+
+def fetch_videos_mirror(provider, url):
+    data = providers.fetch_mirror(provider, url)
+    if not data or not data.get("download_url"):
+        return None
+    return [data["download_url"]]
+
+# TWITTER_PROVIDER: comma separated, "mirror=<other deployment>/api/twitter-download?key=..."
+PROVIDERS = providers.Pool("TWITTER_PROVIDER", {"html": fetch_videos, "mirror": fetch_videos_mirror})
+
+
+def resolve(url, host):
+    if not PROVIDERS:
+        return 500, "Api not configured", False
+
+    videos, hit = VIDEO_CACHE.get_or_fetch(
+        urls.canonical_url(url),
+        lambda: PROVIDERS.call(url)
+    )
+
+    if not videos:
+        return 404, "Video not found or tweet is private", hit
+
+    best = videos[-1]
+    token = encode_url(best)
+
+    return 200, {
+        "status": "success",
+        "download_url": f"https://{host}/api/twitter-download?link={token}",
+        "quality": "highest",
+        "provider": "UseSir",
+        "owner": "@UseSir / @OverShade"
+    }, hit
+
+
+def error_response(e):
+    if isinstance(e, breaker.CircuitOpen):
+        return 503, "Provider temporarily unavailable"
+    return 500, "failed to fetch twitter video"
 
-class handler(BaseHTTPRequestHandler):
+
+class handler(BaseHandler):
 
     def do_GET(self):
         query = parse_qs(urlparse(self.path).query)
@@ -47,94 +100,43 @@ class handler(BaseHTTPRequestHandler):
         url = query.get("url", [None])[0]
 
         if not api_key or not is_key_valid(api_key):
-            return self.json(401, "Invalid or expired API key")
+            return self.send_json(401, "Invalid or expired API key")
 
-        if not url:
-            return self.json(400, "Missing 'url' parameter")
+        if self.rate_limited(KEYS_FILE, api_key):
+            return
 
-        if not PROVIDER_URL:
-            return self.json(500, "Api not configured")
+        if not url:
+            return self.send_json(400, "Missing 'url' parameter")
 
         try:
-            headers = {
-                "User-Agent": generate_user_agent(),
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Referer": "https://snapdownloader.com/tools/twitter-video-downloader",
-                "Origin": "https://snapdownloader.com"
-            }
-
-            encoded = quote(url.strip(), safe="")
-            target = f"{PROVIDER_URL}?url={encoded}"
-
-            r = requests.get(
-                target,
-                headers=headers,
-                timeout=20,
-                allow_redirects=True
-            )
-
-            r.raise_for_status()
-
-            soup = BeautifulSoup(r.text, "html.parser")
-
-            videos = []
-            for a in soup.find_all("a", href=True):
-                href = a["href"]
-                if ".mp4" in href.lower():
-                    videos.append(html.unescape(href))
+            code, payload, hit = resolve(url, self.headers.get("host"))
+            self.cache_status = "HIT" if hit else "MISS"
+            self.send_json(code, payload)
 
-            if not videos:
-                return self.json(404, "Video not found or tweet is private")
-
-            best = videos[-1]
-            token = encode_url(best)
-
-            host = self.headers.get("host")
-            proxy_url = f"https://{host}/api/twitter-download?link={token}"
-
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                "status": "success",
-                "download_url": proxy_url,
-                "quality": "highest",
-                "provider": "UseSir",
-                "owner": "@UseSir / @OverShade"
-            }, indent=2).encode())
-
-        except:
-            self.json(500, "failed to fetch twitter video")
+        except Exception as e:
+            self.send_json(*error_response(e))
 
     def proxy_video(self, query):
         token = query.get("link", [None])[0]
 
         try:
             target = decode_url(token)
-            r = requests.get(target, stream=True, timeout=20)
+        except tokens.InvalidToken:
+            return self.send_json(403, "Invalid or expired link")
 
-            self.send_response(200)
-            self.send_header(
-                "Content-Type",
-                r.headers.get("Content-Type", "video/mp4")
+        try:
+            mediaproxy.relay(
+                self,
+                target,
+                lambda headers: sessions.get(
+                    target,
+                    purpose="media",
+                    stream=True,
+                    timeout=20,
+                    headers=headers
+                ),
+                "video/mp4"
             )
-            self.send_header("Content-Disposition", "inline")
-            self.end_headers()
-
-            for chunk in r.iter_content(8192):
-                if chunk:
-                    self.wfile.write(chunk)
 
         except:
-            self.send_response(500)
-            self.end_headers()
-
-    def json(self, code, message):
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        self.wfile.write(json.dumps({
-            "status": "error",
-            "message": message
-        }).encode())
+            self.abort(500)
@@ -0,0 +1,3 @@
+from api._lib.asgi import create_app
+
+app = create_app()
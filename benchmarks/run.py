@@ -0,0 +1,449 @@
+"""
+Offline benchmarks for the API handlers.
+
+    python benchmarks/run.py
+    python benchmarks/run.py --scenarios ig-reel,tiktok-proxy --concurrency 1,16,64
+    python benchmarks/run.py --output new.json --compare old.json
+
+Starts the stub upstream (benchmarks/stub_upstream.py) and the OpenAI stub
+(tools/stub_openai.py) in this process, points every provider env var at
+them, and runs the API in a child process (benchmarks/serve.py) so its RSS
+can be read on its own. Each scenario is driven at every --concurrency
+level over keep-alive connections; throughput, p50/p95/p99 latency, bytes
+and the API process RSS are written as JSON.
+
+Every request uses a fresh URL/username so the result caches miss; --hot
+repeats one value to measure the cache-hit path instead. Other settings
+(CACHE_BACKEND, MEDIA_CACHE_DIR, TERABOX_SEGMENTS, ...) are taken from the
+environment, which makes it easy to compare configurations.
+
+--compare flags scenarios whose throughput dropped, or whose p95 grew, by
+more than --threshold percent against an earlier results file and exits 1.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import shutil
+import secrets
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import http.client
+from itertools import count
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BENCH_DIR = os.path.join(ROOT_DIR, "benchmarks")
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+# tokens for the ?link= scenarios must be signed with the API's secret
+os.environ.setdefault("PROXY_TOKEN_SECRET", secrets.token_hex(32))
+
+import stub_upstream
+from tools import stub_openai
+from api._lib import tokens
+
+BENCH_KEY = "benchkey"
+
+# scenario -> (endpoint stem, query for request n); "{link}" is a signed
+# token for a blob on the stub upstream
+SCENARIOS = {
+    "ig-reel": ("ig-reel", "url=https://www.instagram.com/reel/Cbench{n}/"),
+    "ig-post": ("ig-post", "url=https://www.instagram.com/p/Cbench{n}/"),
+    "ig-story": ("ig-story", "username=bench{n}"),
+    "ig-info": ("ig-info", "username=bench{n}"),
+    "tiktok": ("tiktok-downloader", "url=https://www.tiktok.com/@bench/video/{n}"),
+    "twitter": ("twitter-download", "url=https://x.com/bench/status/{n}"),
+    "pin": ("pin-download", "url=https://www.pinterest.com/pin/{n}/"),
+    "terabox": ("tera-downloader", "url=https://www.terabox.com/s/1bench{n}"),
+    "wormgpt": ("WORMgpt", "text=benchmark prompt {n}"),
+    "ig-story-proxy": ("ig-story", "link={link}"),
+    "ig-post-proxy": ("ig-post", "link={link}"),
+    "tiktok-proxy": ("tiktok-downloader", "link={link}"),
+    "twitter-proxy": ("twitter-download", "link={link}"),
+    "terabox-proxy": ("tera-downloader", "link={link}"),
+}
+
+KEYS_FILE = re.compile(r'^KEYS_FILE = "([^"]+)"', re.M)
+
+READ_CHUNK = 256 * 1024
+
+
+def key_files():
+    names = set()
+    for name in os.listdir(os.path.join(ROOT_DIR, "api")):
+        if name.endswith(".py"):
+            with open(os.path.join(ROOT_DIR, "api", name), encoding="utf-8") as f:
+                names.update(KEYS_FILE.findall(f.read()))
+    return sorted(names)
+
+
+def write_keys(keys_dir):
+    for name in key_files():
+        with open(os.path.join(keys_dir, name), "w") as f:
+            f.write(f"{BENCH_KEY}:31/12/2099\n")
+    open(os.path.join(keys_dir, "masterkeys.txt"), "w").close()
+
+
+def api_env(upstream, openai, keys_dir):
+    env = dict(os.environ)
+    base = upstream.base_url
+    env.update({
+        "KEYS_DIR": keys_dir,
+        "RATELIMIT_BACKEND": "off",
+        "PROVIDER_URL": f"{base}/ig-reel",
+        "IG_POST_PROVIDER": f"{base}/ig-post",
+        "MAIN_API_ORIGIN": base,
+        "IG_STORY_PROVIDER": f"{base}/ig-story",
+        "IG_STORY_MEDIA_BASE": base,
+        "INSTAGRAM_API_URL": f"{base}/ig-info",
+        "TIKTOK_PROVIDER": f"{base}/tiktok",
+        "TWITTER_PROVIDER": f"{base}/twitter",
+        "PIN_PROVIDER_URL": f"{base}/pin",
+        "TERABOX_PROVIDER": f"{base}/terabox",
+        "OPENAI_BASE_URL": openai.base_url,
+        "DEEPSEEK_API_KEY": "bench",
+        "DEEPSEEK_MODEL": "stub",
+    })
+    return env
+
+
+def start_api(env, server, stems, log_path):
+    with open(log_path, "a") as log:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(BENCH_DIR, "serve.py"), "--server", server, *stems],
+            stdout=subprocess.PIPE,
+            stderr=log,
+            env=env,
+            cwd=ROOT_DIR,
+            text=True
+        )
+    line = proc.stdout.readline()
+    if not line:
+        proc.wait()
+        raise SystemExit(f"API process exited with {proc.returncode}")
+    info = json.loads(line)
+
+    # uvicorn announces its port before it is listening
+    for url in set(info["endpoints"].values()):
+        host, port = urlsplit(url).hostname, urlsplit(url).port
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                http.client.HTTPConnection(host, port, timeout=1).connect()
+                break
+            except OSError:
+                if time.monotonic() > deadline or proc.poll() is not None:
+                    proc.kill()
+                    raise SystemExit(f"API process did not start listening on {url}")
+                time.sleep(0.05)
+    return proc, info
+
+
+def rss(pid):
+    """
+    (current, peak) resident set size of `pid` in MiB, from /proc.
+    """
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    values[name] = int(value.split()[0]) / 1024
+    except OSError:
+        return None, None
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+class Target:
+    """
+    Hands out request paths for one scenario until the request budget or
+    the deadline runs out.
+    """
+
+    def __init__(self, stem, template, upstream, numbers, total, deadline, hot):
+        self.stem = stem
+        self.template = template
+        self.upstream = upstream
+        self.numbers = numbers
+        self.remaining = total
+        self.deadline = deadline
+        self.hot = hot
+        self._lock = threading.Lock()
+
+    def next_path(self):
+        with self._lock:
+            if self.remaining is not None:
+                if self.remaining <= 0:
+                    return None
+                self.remaining -= 1
+            n = 0 if self.hot else next(self.numbers)
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return None
+
+        values = {"n": n, "link": ""}
+        if "{link}" in self.template:
+            values["link"] = tokens.encode(f"{self.upstream.base_url}/blob/bench_{n}.mp4")
+        field, _, value = self.template.format(**values).partition("=")
+        query = f"{field}={quote(value, safe='')}"
+        if field != "link":
+            query = f"key={BENCH_KEY}&{query}"
+        return f"/api/{self.stem}?{query}"
+
+
+def worker(url, target, samples):
+    parts = urlsplit(url)
+    conn = None
+    while True:
+        path = target.next_path()
+        if path is None:
+            break
+        if conn is None:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+
+        start = time.perf_counter()
+        size = 0
+        try:
+            conn.request("GET", path)
+            r = conn.getresponse()
+            while True:
+                chunk = r.read(READ_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+            status = r.status
+            if r.will_close:
+                conn.close()
+                conn = None
+        except Exception:
+            status = 0
+            conn.close()
+            conn = None
+        samples.append((time.perf_counter() - start, status, size))
+
+    if conn is not None:
+        conn.close()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    return values[max(0, math.ceil(p * len(values)) - 1)]
+
+
+def run_scenario(name, url, upstream, pid, numbers, args, concurrency):
+    stem, template = SCENARIOS[name]
+
+    if args.warmup:
+        warm = Target(stem, template, upstream, numbers, args.warmup, None, args.hot)
+        worker(url, warm, [])
+
+    deadline = time.monotonic() + args.duration if args.duration else None
+    total = None if args.duration else args.requests
+    target = Target(stem, template, upstream, numbers, total, deadline, args.hot)
+
+    rss_before, _ = rss(pid)
+    samples = []
+    threads = [
+        threading.Thread(target=worker, args=(url, target, samples))
+        for _ in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    rss_after, rss_peak = rss(pid)
+
+    latencies = sorted(s[0] for s in samples)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = sum(1 for _, status, _ in samples if 200 <= status < 300)
+    total_bytes = sum(s[2] for s in samples)
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 2)
+
+    return {
+        "scenario": name,
+        "endpoint": stem,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "ok": ok,
+        "errors": len(samples) - ok,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "rps": round(ok / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "mean_ms": ms(sum(latencies) / len(latencies) if latencies else None),
+        "bytes": total_bytes,
+        "mb_per_s": round(total_bytes / elapsed / 1048576, 1) if elapsed else 0.0,
+        "rss_mb": None if rss_after is None else round(rss_after, 1),
+        "rss_delta_mb": None if rss_after is None or rss_before is None else round(rss_after - rss_before, 1),
+        "peak_rss_mb": None if rss_peak is None else round(rss_peak, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """
+    Returns the list of regressions against an earlier results file.
+    """
+    with open(baseline_path) as f:
+        baseline = {
+            (r["scenario"], r["concurrency"]): r
+            for r in json.load(f)["results"]
+        }
+
+    regressions = []
+    for r in results:
+        old = baseline.get((r["scenario"], r["concurrency"]))
+        if not old:
+            continue
+        if old["rps"] and r["rps"] < old["rps"] * (1 - threshold / 100):
+            regressions.append(f"{r['scenario']} c={r['concurrency']}: rps {old['rps']} -> {r['rps']}")
+        if old["p95_ms"] and r["p95_ms"] and r["p95_ms"] > old["p95_ms"] * (1 + threshold / 100):
+            regressions.append(f"{r['scenario']} c={r['concurrency']}: p95 {old['p95_ms']}ms -> {r['p95_ms']}ms")
+    return regressions
+
+
+def print_table(results):
+    header = f"{'scenario':<16}{'conc':>5}{'reqs':>7}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'MB/s':>8}{'rss':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['scenario']:<16}{r['concurrency']:>5}{r['requests']:>7}{r['errors']:>5}"
+            f"{r['rps']:>9}{r['p50_ms'] or 0:>9}{r['p95_ms'] or 0:>9}{r['p99_ms'] or 0:>9}"
+            f"{r['mb_per_s']:>8}{r['rss_mb'] or 0:>8}"
+        )
+
+
+def parse_size(text):
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper().rstrip("B").rstrip("I")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--duration", type=float, default=0, help="seconds per run instead of --requests")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--hot", action="store_true", help="repeat one value to measure cache hits")
+    parser.add_argument("--server", choices=("threaded", "asgi"), default="threaded")
+    parser.add_argument("--blob-size", default="8M", help="size of proxied media objects")
+    parser.add_argument("--upstream-delay", type=float, default=0.0, help="seconds added to every stub response")
+    parser.add_argument("--api-log", default=os.devnull, help="file for the API process's request log")
+    parser.add_argument("--output", default=None, help="results file (default benchmarks/results/<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    upstream = stub_upstream.serve(delay=args.upstream_delay, blob_size=parse_size(args.blob_size))
+    openai = stub_openai.serve(token_delay=0)
+
+    keys_dir = tempfile.mkdtemp(prefix="reel-api-bench-")
+    write_keys(keys_dir)
+
+    stems = sorted({SCENARIOS[name][0] for name in names})
+    proc, info = start_api(api_env(upstream, openai, keys_dir), args.server, stems, args.api_log)
+
+    results = []
+    numbers = count(1)
+    try:
+        for stem, reason in info["skipped"].items():
+            print(f"skipping {stem}: {reason}", file=sys.stderr)
+
+        for name in names:
+            url = info["endpoints"].get(SCENARIOS[name][0])
+            if url is None:
+                continue
+            for concurrency in levels:
+                result = run_scenario(name, url, upstream, proc.pid, numbers, args, concurrency)
+                results.append(result)
+                print(
+                    f"{name} c={concurrency}: {result['rps']} req/s, "
+                    f"p95 {result['p95_ms']} ms, {result['errors']} errors",
+                    file=sys.stderr
+                )
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(keys_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "server": args.server,
+            "hot": args.hot,
+            "requests": None if args.duration else args.requests,
+            "duration": args.duration or None,
+            "blob_bytes": parse_size(args.blob_size),
+            "upstream_delay": args.upstream_delay,
+            "skipped": info["skipped"],
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        BENCH_DIR, "results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+    print_table(results)
+    print(f"\nwrote {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for line in regressions:
+            print("REGRESSION " + line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
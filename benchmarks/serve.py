@@ -0,0 +1,84 @@
+"""
+API process for benchmarks/run.py. Loads the endpoints and prints one JSON
+line once it is listening:
+
+    {"endpoints": {"<stem>": "http://127.0.0.1:<port>", ...}, "skipped": {...}}
+
+--server threaded (the default) gives every endpoint its own stdlib
+ThreadingHTTPServer, which is what the Vercel-style handlers run on;
+--server asgi serves them all from the ASGI app in asgi.py via uvicorn.
+Endpoints whose dependencies are missing are listed under "skipped".
+"""
+import os
+import sys
+import json
+import socket
+import argparse
+import threading
+from http.server import ThreadingHTTPServer
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+from api._lib import endpoints
+
+
+class APIServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def load_all(stems):
+    loaded = {}
+    skipped = {}
+    for stem in stems:
+        try:
+            loaded[stem] = endpoints.load(stem)
+        except Exception as e:
+            skipped[stem] = f"{type(e).__name__}: {e}"
+    return loaded, skipped
+
+
+def serve_threaded(host, stems):
+    loaded, skipped = load_all(stems)
+    urls = {}
+    for stem, module in loaded.items():
+        server = APIServer((host, 0), module.handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        urls[stem] = f"http://{host}:{server.server_address[1]}"
+    announce(urls, skipped)
+    threading.Event().wait()
+
+
+def serve_asgi(host, stems):
+    import uvicorn
+
+    # import errors surface here rather than as 404s from the app
+    loaded, skipped = load_all(stems)
+
+    with socket.socket() as s:
+        s.bind((host, 0))
+        port = s.getsockname()[1]
+
+    announce({stem: f"http://{host}:{port}" for stem in loaded}, skipped)
+    uvicorn.run("asgi:app", host=host, port=port, log_level="warning", app_dir=ROOT_DIR)
+
+
+def announce(urls, skipped):
+    sys.stdout.write(json.dumps({"endpoints": urls, "skipped": skipped}) + "\n")
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--server", choices=("threaded", "asgi"), default="threaded")
+    parser.add_argument("stems", nargs="*")
+    args = parser.parse_args()
+
+    stems = args.stems or endpoints.names()
+    if args.server == "asgi":
+        serve_asgi(args.host, stems)
+    else:
+        serve_threaded(args.host, stems)
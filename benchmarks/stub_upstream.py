@@ -0,0 +1,185 @@
+"""
+Stub upstream for the benchmarks: replays the recorded provider responses
+in benchmarks/fixtures and serves generated binary blobs for the media
+proxy paths.
+
+    python benchmarks/stub_upstream.py --port 8090
+
+Routes (any method, any query string):
+
+    /ig-reel /ig-post /ig-story /ig-info /tiktok /twitter /pin /terabox
+        the fixture for that provider, with {{BASE}} replaced by the
+        server's own URL so media links point back here
+    /blob/<name>
+        BLOB_SIZE deterministic bytes with ETag, Last-Modified and single
+        Range support, like a CDN
+
+STUB_DELAY adds a fixed per-response delay to mimic upstream latency.
+"""
+import os
+import re
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+DELAY = float(os.environ.get("STUB_DELAY", "0"))
+BLOB_SIZE = int(os.environ.get("STUB_BLOB_SIZE", str(8 * 1024 * 1024)))
+
+ROUTES = {
+    "/ig-reel": ("ig-reel.html", "text/html; charset=utf-8"),
+    "/ig-post": ("ig-post.html", "text/html; charset=utf-8"),
+    "/ig-story": ("ig-story.json", "application/json"),
+    "/ig-info": ("ig-info.json", "application/json"),
+    "/tiktok": ("tiktok.json", "application/json"),
+    "/twitter": ("twitter.html", "text/html; charset=utf-8"),
+    "/pin": ("pin.html", "text/html; charset=utf-8"),
+    "/terabox": ("terabox.json", "application/json"),
+}
+
+BLOB_TYPES = {
+    ".mp4": "video/mp4",
+    ".jpg": "image/jpeg",
+    ".webp": "image/webp",
+    ".m3u8": "application/vnd.apple.mpegurl",
+}
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+LAST_MODIFIED = "Mon, 06 Jan 2025 00:00:00 GMT"
+
+
+def make_blob(size):
+    pattern = bytes(range(256)) * 4096
+    return (pattern * (size // len(pattern) + 1))[:size]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.route()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self.route()
+
+    def do_HEAD(self):
+        self.route()
+
+    def route(self):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        path = self.path.split("?", 1)[0]
+        if path.startswith("/blob/"):
+            return self.send_blob(path)
+
+        fixture = self.server.fixtures.get(path)
+        if fixture is None:
+            return self.send_plain(404, b"not found", "text/plain")
+        self.send_plain(200, *fixture)
+
+    def send_plain(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        # end_headers() by hand so headers and body leave in one write;
+        # split writes let Nagle and delayed ACKs add ~40ms per response
+        self._headers_buffer.append(b"\r\n")
+        if self.command != "HEAD":
+            self._headers_buffer.append(body)
+        self.flush_headers()
+
+    def send_blob(self, path):
+        blob = self.server.blob
+        size = len(blob)
+        start, end = 0, size - 1
+        status = 200
+
+        m = RANGE.match(self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if m and (not if_range or if_range == self.server.etag):
+            if m.group(1):
+                start = int(m.group(1))
+                end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            else:
+                start = max(0, size - int(m.group(2)))
+            if start >= size or start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        ext = os.path.splitext(path)[1].lower()
+        self.send_response(status)
+        self.send_header("Content-Type", BLOB_TYPES.get(ext, "application/octet-stream"))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        if self.command != "HEAD":
+            view = memoryview(blob)
+            offset = start
+            try:
+                while offset <= end:
+                    n = min(256 * 1024, end + 1 - offset)
+                    self.wfile.write(view[offset:offset + n])
+                    offset += n
+            except (BrokenPipeError, ConnectionError):
+                self.close_connection = True
+
+
+class StubServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, delay=DELAY, blob_size=BLOB_SIZE):
+        super().__init__(address, StubHandler)
+        self.delay = delay
+        self.blob = make_blob(blob_size)
+        self.etag = f'"blob-{blob_size}"'
+        self.fixtures = {}
+        for path, (name, content_type) in ROUTES.items():
+            with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+                body = f.read().replace("{{BASE}}", self.base_url)
+            self.fixtures[path] = (body.encode(), content_type)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve(port=0, host="127.0.0.1", delay=DELAY, blob_size=BLOB_SIZE):
+    server = StubServer((host, port), delay, blob_size)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--delay", type=float, default=DELAY)
+    parser.add_argument("--blob-size", type=int, default=BLOB_SIZE)
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), args.delay, args.blob_size)
+    print(f"stub upstream on {server.base_url}")
+    server.serve_forever()
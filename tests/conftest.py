@@ -0,0 +1,7 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# endpoint modules refuse to import without a token secret
+os.environ.setdefault("PROXY_TOKEN_SECRET", "test-secret")
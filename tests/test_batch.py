@@ -0,0 +1,49 @@
+import pytest
+
+from api._lib import breaker, endpoints
+
+pytest.importorskip("requests")
+pytest.importorskip("user_agent")
+
+
+@pytest.fixture
+def batch():
+    return endpoints.load("batch")
+
+
+def failing(error):
+    def resolve(value, host):
+        raise error
+    return resolve
+
+
+def test_item_errors_use_the_endpoint_message(monkeypatch, batch):
+    reel = endpoints.load("ig-reel")
+    monkeypatch.setattr(reel, "resolve", failing(Exception("Media not found or private")))
+    assert batch.resolve_item("ig-reel", "https://www.instagram.com/reel/C1/", "h") == (
+        500, "Media not found or private", False
+    )
+
+    post = endpoints.load("ig-post")
+    monkeypatch.setattr(post, "resolve", failing(ValueError("boom")))
+    assert batch.resolve_item("ig-post", "https://www.instagram.com/p/C1/", "h") == (
+        500, "failed to fetch instagram post", False
+    )
+
+
+def test_item_open_circuit_is_503(monkeypatch, batch):
+    pin = endpoints.load("pin-download")
+    monkeypatch.setattr(pin, "resolve", failing(breaker.CircuitOpen("pin")))
+    assert batch.resolve_item("pin-download", "https://pin.it/1", "h") == (
+        503, "Provider temporarily unavailable", False
+    )
+
+
+def test_every_batch_type_maps_its_errors(batch):
+    for stem in set(batch.TYPES.values()):
+        try:
+            module = endpoints.load(stem)
+        except ImportError:
+            continue
+        assert module.error_response(breaker.CircuitOpen(stem))[0] == 503
+        assert module.error_response(Exception("x"))[0] == 500
@@ -0,0 +1,81 @@
+import pytest
+
+from api._lib import breaker
+
+
+def fail(error):
+    def fn():
+        raise error
+    return fn
+
+
+def run(b, fn, times):
+    for _ in range(times):
+        with pytest.raises(Exception):
+            b.call(fn)
+
+
+def test_input_errors_do_not_open():
+    b = breaker.Breaker("test")
+    run(b, fail(Exception("Invalid Pinterest URL")), breaker.MIN_CALLS * 2)
+    assert b.state == breaker.CLOSED
+
+
+def test_provider_4xx_does_not_open():
+    b = breaker.Breaker("test")
+    run(b, fail(breaker.ProviderError("Request failed", 404)), breaker.MIN_CALLS * 2)
+    assert b.state == breaker.CLOSED
+
+
+def test_5xx_and_timeouts_open():
+    b = breaker.Breaker("test")
+    run(b, fail(breaker.ProviderError("Request failed", 502)), breaker.MIN_CALLS // 2)
+    run(b, fail(TimeoutError()), breaker.MIN_CALLS - breaker.MIN_CALLS // 2)
+    assert b.state == breaker.OPEN
+    with pytest.raises(breaker.CircuitOpen):
+        b.call(lambda: "ok")
+
+
+def test_half_open_waits_for_every_probe(monkeypatch):
+    monkeypatch.setattr(breaker, "OPEN_SECONDS", 0)
+    monkeypatch.setattr(breaker, "HALF_OPEN_CALLS", 2)
+    b = breaker.Breaker("test")
+    run(b, fail(TimeoutError()), breaker.MIN_CALLS)
+    assert b.state == breaker.OPEN
+
+    assert b.allow() and b.allow()
+    assert not b.allow()
+    b.record(True, 0.1)
+    assert b.state == breaker.HALF_OPEN
+    b.record(True, 0.1)
+    assert b.state == breaker.CLOSED
+
+
+def test_failures_age_out_of_the_window(monkeypatch):
+    b = breaker.Breaker("test")
+    run(b, fail(TimeoutError()), 3)
+    assert b.snapshot()["error_rate"] == 1.0
+    monkeypatch.setattr(breaker, "WINDOW", -1)
+    snap = b.snapshot()
+    assert snap["calls"] == 0 and b._failures == 0
+
+
+def test_latency_uses_a_bounded_sample(monkeypatch):
+    monkeypatch.setattr(breaker, "LATENCY_SAMPLES", 100)
+    monkeypatch.setattr(breaker, "LATENCY_REFRESH", 0)
+    b = breaker.Breaker("test")
+    for i in range(1000):
+        b.record(True, i / 1000)
+    # only the last 100 calls (0.900 .. 0.999) are kept
+    assert b.latency(0.0) == 0.9
+    assert b.latency(0.5) == 0.95
+
+
+def test_latency_is_cached(monkeypatch):
+    monkeypatch.setattr(breaker, "LATENCY_REFRESH", 60)
+    b = breaker.Breaker("test")
+    for _ in range(breaker.MIN_CALLS):
+        b.record(True, 0.1)
+    assert b.latency(0.9) == 0.1
+    b.record(True, 5.0)
+    assert b.latency(0.9) == 0.1
@@ -0,0 +1,168 @@
+import os
+import re
+import html
+
+import pytest
+
+from api._lib import endpoints, links
+
+bs4 = pytest.importorskip("bs4")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+PAGES = {
+    "ig-reel": "benchmarks/fixtures/ig-reel.html",
+    "ig-post": "benchmarks/fixtures/ig-post.html",
+    "twitter": "benchmarks/fixtures/twitter.html",
+    "pin": "tests/fixtures/pin.html",
+    "pin-plain": "benchmarks/fixtures/pin.html",
+    "ig-story": "tests/fixtures/ig-story.html",
+    "tiktok": "tests/fixtures/tiktok.html",
+}
+
+
+def page(name):
+    with open(os.path.join(ROOT_DIR, PAGES[name]), encoding="utf-8") as f:
+        return f.read().replace("{{BASE}}", "https://cdn.example.com")
+
+
+def soup(markup):
+    return bs4.BeautifulSoup(markup, "html.parser")
+
+
+@pytest.fixture(params=["stdlib", "lxml"])
+def backend(request, monkeypatch):
+    if request.param == "lxml" and links.etree is None:
+        pytest.skip("lxml not installed")
+    monkeypatch.setattr(links, "BACKEND", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("name", sorted(PAGES))
+def test_anchors_match_beautifulsoup(name, backend):
+    markup = page(name)
+    expected = [(a["href"], a.get_text(strip=True)) for a in soup(markup).find_all("a", href=True)]
+
+    assert [(l.url, l.text) for l in links.iter_links(markup, with_text=True)] == expected
+    assert links.hrefs(markup) == [url for url, _ in expected]
+
+
+@pytest.mark.parametrize("name", sorted(PAGES))
+def test_media_tags_match_beautifulsoup(name, backend):
+    markup = page(name)
+    expected = [
+        (tag.name, tag[links.LINK_ATTRS[tag.name]])
+        for tag in soup(markup).find_all(["a", "source", "img"])
+        if tag.has_attr(links.LINK_ATTRS[tag.name])
+    ]
+    found = links.iter_links(markup, tags=("a", "source", "img"))
+
+    assert [(l.tag, l.url) for l in found] == expected
+
+
+def test_repeated_attribute_keeps_the_last(backend):
+    markup = '<a href="#" class="btn" href="https://cdn.example.com/v.mp4">HD</a>'
+    assert links.hrefs(markup) == ["https://cdn.example.com/v.mp4"]
+
+
+class Recorded:
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    pytest.importorskip("requests")
+    pytest.importorskip("user_agent")
+    from api._lib import sessions
+
+    def serve(stem, name):
+        recorded = Recorded(page(name))
+        monkeypatch.setattr(sessions, "get", lambda *a, **kw: recorded)
+        monkeypatch.setattr(sessions, "post", lambda *a, **kw: recorded)
+        return endpoints.load(stem)
+    return serve
+
+
+# the BeautifulSoup extraction each handler did before links.py
+
+def old_reel(markup):
+    tag = soup(markup).find("a", href=lambda x: x and ".mp4" in x.lower())
+    return html.unescape(tag["href"]).strip() if tag else None
+
+
+def old_post(markup, module):
+    grouped = {}
+    for a in soup(markup).find_all("a", href=True):
+        href = html.unescape(a["href"])
+        if not re.search(r"(cdninstagram|\.mp4|\.jpg|\.jpeg|\.png|\.webp)", href, re.I):
+            continue
+        media_id = module.extract_media_id(href)
+        quality = module.detect_quality(href)
+        priority = module.QUALITY_PRIORITY[quality]
+        existing = grouped.get(media_id)
+        if not existing or priority > existing["priority"]:
+            grouped[media_id] = {"url": href, "quality": quality, "priority": priority}
+    return list(grouped.values()) or None
+
+
+def old_twitter(markup):
+    videos = [
+        html.unescape(a["href"]) for a in soup(markup).find_all("a", href=True)
+        if ".mp4" in a["href"].lower()
+    ]
+    return videos or None
+
+
+def old_pin(markup, module):
+    anchors = soup(markup).find_all("a", href=True)
+    video_link = None
+    photo_link = None
+    for a in anchors:
+        href = a["href"]
+        text = a.get_text(strip=True).lower()
+        if module.is_real_media(href) and href.lower().endswith(".mp4"):
+            if any(q in text for q in ["1080", "original", "hd"]):
+                video_link = href
+                break
+            if not video_link:
+                video_link = href
+    if not video_link:
+        for a in anchors:
+            href = a["href"]
+            if module.is_real_media(href) and not href.lower().endswith(".mp4"):
+                photo_link = href
+                break
+    if video_link:
+        return {"video": video_link, "photo": None}
+    if photo_link:
+        return {"video": None, "photo": photo_link}
+    return None
+
+
+def test_reel_matches_old_handler(provider, backend):
+    module = provider("ig-reel", "ig-reel")
+    assert module.fetch_reel("https://provider", "https://www.instagram.com/reel/C1/") == old_reel(page("ig-reel"))
+
+
+def test_post_matches_old_handler(provider, backend):
+    module = provider("ig-post", "ig-post")
+    assert module.fetch_media("https://provider", "https://www.instagram.com/p/C1/") == old_post(page("ig-post"), module)
+
+
+def test_twitter_matches_old_handler(provider, backend):
+    module = provider("twitter-download", "twitter")
+    assert module.fetch_videos("https://provider", "https://x.com/a/status/1") == old_twitter(page("twitter"))
+
+
+@pytest.mark.parametrize("name", ["pin", "pin-plain"])
+def test_pin_matches_old_handler(name, provider, backend):
+    module = provider("pin-download", name)
+    expected = old_pin(page(name), module)
+    assert expected is not None
+    assert module.fetch_pin("https://provider", "https://pin.it/1") == expected
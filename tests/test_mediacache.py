@@ -0,0 +1,44 @@
+import io
+
+import pytest
+
+from api._lib import mediacache
+
+LENGTH = 64 * 1024 * 1024
+
+
+class GoneClient:
+    def write(self, data):
+        raise BrokenPipeError()
+
+
+@pytest.fixture
+def fill(monkeypatch, tmp_path):
+    monkeypatch.setattr(mediacache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(mediacache, "ORPHAN_BYTES", 1024 * 1024)
+    fill = mediacache.Fill("ab" * 32)
+    fill.started({"length": LENGTH})
+    return fill
+
+
+def test_fill_without_readers_is_abandoned(fill):
+    tee = mediacache._TeeWriter(io.BytesIO(), GoneClient(), fill)
+    with pytest.raises(mediacache.FillAbandoned):
+        tee.write(b"x" * 1024)
+    assert not fill.join()
+
+
+def test_nearly_complete_fill_is_finished(fill):
+    fill.advance(LENGTH - 4096)
+    tee = mediacache._TeeWriter(io.BytesIO(), GoneClient(), fill)
+    assert tee.write(b"x" * 1024) == 1024
+    assert tee.client_gone
+
+
+def test_follower_keeps_the_fill_going(fill):
+    tee = mediacache._TeeWriter(io.BytesIO(), GoneClient(), fill)
+    assert fill.join()
+    tee.write(b"x" * 1024)
+    fill.leave()
+    with pytest.raises(mediacache.FillAbandoned):
+        tee.write(b"x" * 1024)
@@ -0,0 +1,39 @@
+import time
+
+from api._lib import metrics
+
+
+def test_method_label_folds_unknown_methods():
+    assert metrics.method_label("GET") == "GET"
+    assert metrics.method_label("POST") == "POST"
+    assert metrics.method_label("FOOBAR") == "other"
+    assert metrics.method_label("get") == "other"
+    assert metrics.method_label(None) == "other"
+
+
+def test_histogram_buckets_are_cumulative():
+    h = metrics.Histogram("test_seconds", "test", ("endpoint",), buckets=(0.1, 1.0))
+    h.observe(0.05, "a")
+    h.observe(0.5, "a")
+    h.observe(5, "a")
+    samples = dict(h.samples())
+    assert samples['test_seconds_bucket{endpoint="a",le="0.1"}'] == 1
+    assert samples['test_seconds_bucket{endpoint="a",le="1"}'] == 2
+    assert samples['test_seconds_bucket{endpoint="a",le="+Inf"}'] == 3
+    assert samples['test_seconds_count{endpoint="a"}'] == 3
+
+
+def test_bound_worker_upstream_counts_towards_request():
+    from concurrent.futures import ThreadPoolExecutor
+
+    def attempt():
+        with metrics.upstream():
+            time.sleep(0.05)
+
+    metrics.bind("ig-reel")
+    with ThreadPoolExecutor(1) as pool:
+        pool.submit(metrics.bound(attempt)).result()
+    assert metrics.request_info()["upstream"] >= 0.05
+
+    metrics.bind("ig-reel")
+    assert metrics.request_info()["upstream"] < 0.05
@@ -0,0 +1,50 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from api._lib import sessions
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+
+@pytest.fixture
+def servers():
+    started = []
+    for _ in range(sessions.POOL_CONNECTIONS + 5):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        started.append(server)
+    yield [f"http://127.0.0.1:{s.server_address[1]}/" for s in started]
+    for server in started:
+        server.shutdown()
+        server.server_close()
+    sessions.close_all()
+
+
+def test_many_hosts_share_one_bounded_session(servers):
+    for url in servers:
+        assert sessions.get(url, purpose="media", timeout=5).text == "ok"
+
+    assert list(sessions._SESSIONS) == ["media"]
+    adapter = sessions.get_session("media").get_adapter(servers[0])
+    assert len(adapter.poolmanager.pools) <= sessions.POOL_CONNECTIONS
+
+
+def test_unknown_purpose():
+    with pytest.raises(ValueError):
+        sessions.get_session("cdn")
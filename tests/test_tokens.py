@@ -0,0 +1,55 @@
+import importlib
+import os
+
+import pytest
+
+
+@pytest.fixture
+def tokens(monkeypatch):
+    monkeypatch.setenv("PROXY_TOKEN_SECRET", "test-secret")
+    monkeypatch.setenv("PROXY_TOKEN_MODE", "signed")
+    monkeypatch.delenv("PROXY_TOKEN_STORE", raising=False)
+    from api._lib import tokens
+    yield importlib.reload(tokens)
+    # leave the module as other tests expect it
+    monkeypatch.setenv("PROXY_TOKEN_MODE", "signed")
+    importlib.reload(tokens)
+
+
+def test_signed_round_trip(tokens):
+    url = "https://cdn.example.com/v/video.mp4?sig=abc"
+    assert tokens.decode(tokens.encode(url)) == url
+
+
+def test_tampered_token(tokens):
+    token = tokens.encode("https://cdn.example.com/a.mp4")
+    with pytest.raises(tokens.InvalidToken):
+        tokens.decode(token[:-2] + ("AA" if token[-2:] != "AA" else "BB"))
+
+
+def test_id_mode_needs_a_store(monkeypatch, tokens):
+    monkeypatch.setenv("PROXY_TOKEN_MODE", "id")
+    with pytest.raises(RuntimeError):
+        importlib.reload(tokens)
+
+
+def test_id_mode_links_survive_many_writes(monkeypatch, tmp_path, tokens):
+    monkeypatch.setenv("PROXY_TOKEN_MODE", "id")
+    monkeypatch.setenv("PROXY_TOKEN_STORE", str(tmp_path / "links.sqlite3"))
+    tokens = importlib.reload(tokens)
+
+    first = tokens.encode("https://cdn.example.com/0.mp4")
+    for i in range(1, 5000):
+        tokens.encode(f"https://cdn.example.com/{i}.mp4")
+
+    # a second store on the same file stands in for another worker
+    other = tokens.LinkStore(os.environ["PROXY_TOKEN_STORE"])
+    assert other.get(first) == "https://cdn.example.com/0.mp4"
+    assert tokens.decode(first) == "https://cdn.example.com/0.mp4"
+
+
+def test_secret_is_required(monkeypatch, tokens):
+    monkeypatch.setenv("PROXY_TOKEN_SECRET", "")
+    with pytest.raises(RuntimeError):
+        importlib.reload(tokens)
+    monkeypatch.setenv("PROXY_TOKEN_SECRET", "test-secret")
@@ -0,0 +1,33 @@
+from api._lib import urls
+
+
+def test_terabox_share_path_drops_leading_one():
+    assert urls.canonical_url("https://www.terabox.com/s/1abcXYZ") == "terabox:abcXYZ"
+
+
+def test_terabox_surl_keeps_leading_one():
+    assert urls.canonical_url("https://www.terabox.com/sharing/link?surl=1abcXYZ") == "terabox:1abcXYZ"
+
+
+def test_terabox_surl_and_share_path_forms_differ():
+    assert (
+        urls.canonical_url("https://terabox.com/s/1abcXYZ")
+        != urls.canonical_url("https://terabox.com/sharing/link?surl=1abcXYZ")
+    )
+
+
+def test_terabox_same_share_in_both_forms():
+    assert (
+        urls.canonical_url("https://www.terabox.com/s/11abcXYZ")
+        == urls.canonical_url("https://www.1024terabox.com/sharing/link?surl=1abcXYZ")
+        == urls.canonical_url("https://terabox.app/wap/share/filelist?surl=1abcXYZ")
+    )
+
+
+def test_terabox_surl_after_other_params():
+    assert urls.canonical_url("https://terabox.com/sharing/link?from=x&surl=abc") == "terabox:abc"
+
+
+def test_shortcodes():
+    assert urls.canonical_url("https://www.instagram.com/reel/Cabc123/?igsh=x") == "instagram:Cabc123"
+    assert urls.canonical_url("https://x.com/user/status/123?s=20") == "twitter:123"
@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import http.client
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from api._lib import cache, endpoints, keystore
+
+pytest.importorskip("openai")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+import stub_openai
+
+KEY = "wormgpt-test-key"
+
+
+@pytest.fixture(scope="module")
+def upstream():
+    server = stub_openai.serve(0, token_delay=0.02)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def api(upstream, monkeypatch, tmp_path):
+    from openai import OpenAI
+
+    os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+    module = endpoints.load("WORMgpt")
+    monkeypatch.setattr(module, "client", OpenAI(api_key="test", base_url=upstream.base_url))
+    monkeypatch.setattr(module, "MODEL_NAME", "stub")
+
+    (tmp_path / module.KEYS_FILE).write_text(f"{KEY}:31/12/2099\n")
+    monkeypatch.setattr(keystore, "KEYS_DIR", str(tmp_path))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), module.handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield module, server.server_address[1]
+    server.shutdown()
+
+
+def get(port, query):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("GET", f"/api/WORMgpt?key={KEY}&{query}")
+    r = conn.getresponse()
+    return r, r.read()
+
+
+def test_stream_is_server_sent_events(api):
+    module, port = api
+    r, body = get(port, "text=hello+there+world&stream=1")
+
+    assert r.status == 200
+    assert r.getheader("Content-Type") == "text/event-stream"
+    assert body.endswith(b"\n\n")
+
+    events = body.decode().split("\n\n")[:-1]
+    assert all(e.startswith("data: ") and "\n" not in e for e in events)
+    assert events[-1] == "data: [DONE]"
+    text = "".join(json.loads(e[len("data: "):])["delta"] for e in events[:-1])
+    assert text == "stub answer: hello there world"
+
+
+def test_client_disconnect_cancels_upstream(api, upstream):
+    module, port = api
+    cancelled = upstream.cancelled
+    words = "+".join(["word"] * 200)
+
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall(f"GET /api/WORMgpt?key={KEY}&text={words}&stream=1 HTTP/1.1\r\nHost: t\r\n\r\n".encode())
+    received = b""
+    while b"data: " not in received:
+        received += sock.recv(4096)
+    sock.close()
+
+    # the whole answer would take 200 * 20ms upstream
+    deadline = time.monotonic() + 2
+    while upstream.cancelled == cancelled and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert upstream.cancelled == cancelled + 1
+
+
+def test_repeated_prompt_is_served_from_cache(api, upstream, monkeypatch):
+    module, port = api
+    completions = cache.ResultCache("wormgpt", 60, cache.MemoryBackend())
+    monkeypatch.setattr(module, "COMPLETION_CACHE", completions)
+    calls = upstream.completions
+
+    r1, first = get(port, "text=Tell+me+a+joke")
+    r2, second = get(port, "text=tell++me+a+JOKE")
+
+    assert (r1.getheader("X-Cache"), r2.getheader("X-Cache")) == ("MISS", "HIT")
+    assert json.loads(second)["response"] == json.loads(first)["response"]
+    assert upstream.completions == calls + 1
+    # "you are funny" + "Tell me a joke" in, "stub answer: Tell me a joke" out
+    assert completions.counters["tokens_saved"] == 3 + 4 + 6
+
+
+def test_without_ttl_every_prompt_goes_upstream(api, upstream, monkeypatch):
+    module, port = api
+    completions = cache.ResultCache("wormgpt", 0, cache.MemoryBackend())
+    monkeypatch.setattr(module, "COMPLETION_CACHE", completions)
+    calls = upstream.completions
+
+    r1, _ = get(port, "text=Tell+me+a+joke")
+    r2, _ = get(port, "text=Tell+me+a+joke")
+
+    assert (r1.status, r2.status) == (200, 200)
+    assert r1.getheader("X-Cache") is None and r2.getheader("X-Cache") is None
+    assert upstream.completions == calls + 2
+    assert "tokens_saved" not in completions.counters
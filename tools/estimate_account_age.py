@@ -0,0 +1,44 @@
+"""
+Estimate account creation dates for many Instagram user ids at once.
+
+    python tools/estimate_account_age.py ids.txt > ages.csv
+    cut -d, -f1 export.csv | python tools/estimate_account_age.py
+
+Reads one id per line (files or stdin) and writes `id,year,month` CSV,
+processing BATCH ids per estimate_many() call.
+"""
+import os
+import sys
+import csv
+import fileinput
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from api._lib import accountage
+
+BATCH = 10000
+
+
+def main(paths):
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["id", "year", "month"])
+
+    batch = []
+    for line in fileinput.input(paths):
+        value = line.strip()
+        if value:
+            batch.append(value)
+        if len(batch) >= BATCH:
+            flush(writer, batch)
+            batch = []
+    flush(writer, batch)
+
+
+def flush(writer, batch):
+    for uid, result in zip(batch, accountage.estimate_many(batch)):
+        result = result or {}
+        writer.writerow([uid, result.get("year", ""), result.get("month") or ""])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
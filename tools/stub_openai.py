@@ -0,0 +1,147 @@
+"""
+Minimal OpenAI-compatible chat completions server for local runs and
+tests. The answer echoes the last user message word by word, with
+STUB_TOKEN_DELAY seconds between streamed chunks.
+
+    python tools/stub_openai.py --port 8081
+    OPENAI_BASE_URL=http://127.0.0.1:8081/v1 DEEPSEEK_API_KEY=x DEEPSEEK_MODEL=stub ...
+
+In a test, `server = serve(0)` starts it on a free port in a background
+thread; `server.base_url` is the value for OPENAI_BASE_URL,
+`server.completions` counts chat completion requests and
+`server.cancelled` the streams the client abandoned. Usage is reported in
+words rather than real tokens.
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOKEN_DELAY = float(os.environ.get("STUB_TOKEN_DELAY", "0.02"))
+
+
+def answer_for(messages):
+    text = next(
+        (m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"),
+        ""
+    )
+    return f"stub answer: {text}"
+
+
+def usage(messages, answer):
+    prompt = sum(len((m.get("content") or "").split()) for m in messages)
+    completion = len(answer.split())
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            return self.send_error(404)
+
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        messages = body.get("messages") or []
+        answer = answer_for(messages)
+        model = body.get("model") or "stub"
+
+        with self.server.lock:
+            self.server.completions += 1
+
+        if body.get("stream"):
+            return self.stream(model, answer)
+
+        payload = json.dumps({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop"
+            }],
+            "usage": usage(messages, answer)
+        }).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def stream(self, model, answer):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        words = answer.split(" ")
+        try:
+            for i, word in enumerate(words):
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": word if i == 0 else " " + word},
+                        "finish_reason": None
+                    }]
+                }
+                self.wfile.write(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+                self.wfile.flush()
+                time.sleep(self.server.token_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionError):
+            with self.server.lock:
+                self.server.cancelled += 1
+
+
+class StubServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, token_delay=TOKEN_DELAY):
+        super().__init__(address, StubHandler)
+        self.token_delay = token_delay
+        self.completions = 0
+        self.cancelled = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def serve(port=0, host="127.0.0.1", token_delay=TOKEN_DELAY):
+    server = StubServer((host, port), token_delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--delay", type=float, default=TOKEN_DELAY)
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), args.delay)
+    print(f"OPENAI_BASE_URL={server.base_url}")
+    server.serve_forever()